@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Load generator for the files and accounts APIs.
+
+Registers and logs in a pool of synthetic users, seeds each of them with a few
+files and then runs a weighted mix of uploads, listings, downloads, shares and
+public-link downloads against a running backend for a fixed duration. At the
+end it reports throughput, p50/p95/p99 latency per endpoint and the error rate,
+and can save the result as a baseline or compare it against an earlier one.
+
+Only the standard library is used, so it runs from any checkout:
+
+    python3 loadtest/loadtest.py --scenario loadtest/scenarios/default.json
+    python3 loadtest/loadtest.py --scenario ... --save-baseline loadtest/baselines/sync.json
+    python3 loadtest/loadtest.py --scenario ... --baseline loadtest/baselines/sync.json
+
+The target server must not rate limit or redirect to HTTPS, i.e. it should run
+with DEBUG=1 (or behind a TLS-terminating proxy with the limits raised).
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+DEFAULT_SCENARIO = {
+    'users': 10,
+    'concurrency': 10,
+    'duration': 60,
+    'seed_files': 3,
+    'file_sizes': [16 * 1024, 256 * 1024, 1024 * 1024],
+    'mix': {
+        'upload': 1,
+        'list': 5,
+        'download': 4,
+        'share': 1,
+        'public_download': 2,
+    },
+}
+
+PASSWORD = 'load-test-password-1234'
+
+
+class Client:
+    """Keep-alive HTTP client owned by a single worker thread."""
+
+    def __init__(self, base_url, timeout=60):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        self.conn = cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request and return (status, body); reconnects once on a dropped connection."""
+        for attempt in (0, 1):
+            if self.conn is None:
+                self._connect()
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def json_body(data):
+    return json.dumps(data).encode(), {'Content-Type': 'application/json'}
+
+
+def multipart_body(fields, file_field, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+        f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()
+    )
+    parts.append(content)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+class Stats:
+    """Latency samples and error counts per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        total = errors = 0
+        for endpoint, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            total += len(samples)
+            errors += self.errors[endpoint]
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': self.errors[endpoint],
+                'throughput': len(samples) / elapsed,
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+            }
+        return {
+            'elapsed': elapsed,
+            'requests': total,
+            'errors': errors,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'error_rate': errors / total if total else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+class SyntheticUser:
+    """A registered user plus the files and links it owns."""
+
+    def __init__(self, email, user_id, access):
+        self.email = email
+        self.id = user_id
+        self.access = access
+        self.files = []
+        self.links = {}
+        self.shared = set()
+        self.lock = threading.Lock()
+
+    def auth(self):
+        return {'Authorization': f'Bearer {self.access}'}
+
+
+class LoadTest:
+    def __init__(self, base_url, scenario):
+        self.base_url = base_url
+        self.scenario = scenario
+        self.stats = Stats()
+        self.users = []
+        self.run_id = uuid.uuid4().hex[:8]
+        self.payloads = {size: os.urandom(size) for size in scenario['file_sizes']}
+
+    def call(self, client, endpoint, method, path, body=None, headers=None, expect=(200, 201)):
+        start = time.perf_counter()
+        try:
+            status, data = client.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            self.stats.record(endpoint, time.perf_counter() - start, False)
+            return None, None
+        ok = status in expect
+        self.stats.record(endpoint, time.perf_counter() - start, ok)
+        return status, data
+
+    # Setup
+
+    def register(self, client, index):
+        email = f'loadtest+{self.run_id}-{index}@example.com'
+        body, headers = json_body({
+            'email': email,
+            'full_name': f'Load Test {index}',
+            'password': PASSWORD,
+            'confirmPassword': PASSWORD,
+        })
+        status, _ = self.call(client, 'register', 'POST', '/api/auth/register/', body, headers)
+        if status != 201:
+            raise RuntimeError(f'Registering {email} failed with status {status}')
+        return self.login(client, email)
+
+    def login(self, client, email):
+        body, headers = json_body({'email': email, 'password': PASSWORD})
+        status, data = self.call(client, 'login', 'POST', '/api/auth/login/', body, headers)
+        if status != 200:
+            raise RuntimeError(f'Logging in {email} failed with status {status}')
+        payload = json.loads(data)
+        return SyntheticUser(email, payload['user']['id'], payload['tokens']['access'])
+
+    def setup(self):
+        client = Client(self.base_url)
+        for index in range(self.scenario['users']):
+            self.users.append(self.register(client, index))
+        for user in self.users:
+            for _ in range(self.scenario['seed_files']):
+                self.upload(client, user)
+
+    # Operations
+
+    def upload(self, client, user):
+        size = random.choice(self.scenario['file_sizes'])
+        name = f'{uuid.uuid4().hex}.bin'
+        body, headers = multipart_body({'name': name}, 'file', name, self.payloads[size])
+        status, data = self.call(
+            client, 'upload', 'POST', '/api/files/', body, {**headers, **user.auth()}
+        )
+        if status == 201:
+            with user.lock:
+                user.files.append(json.loads(data)['id'])
+
+    def list(self, client, user):
+        self.call(client, 'list', 'GET', '/api/files/', headers=user.auth())
+
+    def download(self, client, user):
+        if user.files:
+            file_id = random.choice(user.files)
+            self.call(client, 'download', 'GET', f'/api/files/{file_id}/download/', headers=user.auth())
+
+    def share(self, client, user):
+        candidates = [u for u in self.users if u is not user]
+        if not user.files or not candidates:
+            return
+        file_id = random.choice(user.files)
+        recipient = random.choice(candidates)
+        with user.lock:
+            if (file_id, recipient.id) in user.shared:
+                return self.list(client, user)
+            user.shared.add((file_id, recipient.id))
+        body, headers = json_body({
+            'shared_with': recipient.id,
+            'shared_with_username': recipient.email,
+            'shared_with_email': recipient.email,
+            'can_write': False,
+        })
+        self.call(
+            client, 'share', 'POST', f'/api/files/{file_id}/share/', body, {**headers, **user.auth()}
+        )
+
+    def public_download(self, client, user):
+        if not user.files:
+            return
+        file_id = random.choice(user.files)
+        link_id = user.links.get(file_id)
+        if link_id is None:
+            body, headers = json_body({})
+            status, data = self.call(
+                client, 'create_link', 'POST', f'/api/files/{file_id}/create-link/',
+                body, {**headers, **user.auth()}
+            )
+            if status != 201:
+                return
+            link_id = user.links.setdefault(file_id, json.loads(data)['id'])
+        body, headers = json_body({})
+        self.call(client, 'public_download', 'POST', f'/api/files/public/{link_id}/', body, headers)
+
+    # Run
+
+    def worker(self, deadline):
+        client = Client(self.base_url)
+        operations = list(self.scenario['mix'])
+        weights = [self.scenario['mix'][op] for op in operations]
+        while time.monotonic() < deadline:
+            operation = random.choices(operations, weights)[0]
+            getattr(self, operation)(client, random.choice(self.users))
+
+    def run(self):
+        self.setup()
+        self.stats = Stats()
+        deadline = time.monotonic() + self.scenario['duration']
+        threads = [
+            threading.Thread(target=self.worker, args=(deadline,), daemon=True)
+            for _ in range(self.scenario['concurrency'])
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.stats.summary(time.monotonic() - start)
+
+
+def print_report(result, baseline=None):
+    print(f"Requests: {result['requests']}  errors: {result['errors']} "
+          f"({result['error_rate']:.2%})  throughput: {result['throughput']:.1f} req/s")
+    header = f"{'endpoint':<18}{'reqs':>8}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'Δ p95':>10}{'Δ req/s':>10}"
+    print(header)
+    for endpoint, row in result['endpoints'].items():
+        line = (f"{endpoint:<18}{row['requests']:>8}{row['errors']:>6}{row['throughput']:>9.1f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+        base = baseline['endpoints'].get(endpoint) if baseline else None
+        if base:
+            line += f"{relative(row['p95_ms'], base['p95_ms']):>10}"
+            line += f"{relative(row['throughput'], base['throughput']):>10}"
+        print(line)
+
+
+def relative(value, base):
+    if not base:
+        return 'n/a'
+    return f'{(value - base) / base:+.0%}'
+
+
+def load_scenario(path):
+    scenario = dict(DEFAULT_SCENARIO)
+    if path:
+        with open(path) as fh:
+            scenario.update(json.load(fh))
+    return scenario
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--scenario', help='JSON file overriding the default scenario')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--concurrency', type=int)
+    parser.add_argument('--duration', type=float)
+    parser.add_argument('--output', help='write the full result as JSON')
+    parser.add_argument('--save-baseline', help='write the result as a named baseline')
+    parser.add_argument('--baseline', help='compare against a saved baseline')
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    for key in ('users', 'concurrency', 'duration'):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+
+    result = LoadTest(args.base_url, scenario).run()
+    result['scenario'] = scenario
+    result['base_url'] = args.base_url
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+    print_report(result, baseline)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as fh:
+            json.dump(result, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
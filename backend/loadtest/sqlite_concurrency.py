@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Mixed read/write SQLite benchmark: stock Django backend vs config.db.sqlite3.
+
+Each mode gets a fresh database file with a table shaped like the shareable
+links table. Reader threads run listing-style aggregate queries while writer
+threads do what PublicFileDownloadView does on every hit: read a link and then
+bump its ``access_count`` inside a transaction. The report shows operations
+per second and how many operations failed with "database is locked".
+
+    python3 loadtest/sqlite_concurrency.py --readers 8 --writers 4 --duration 10
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+ROWS = 10000
+MODES = {
+    'stock': 'django.db.backends.sqlite3',
+    'tuned': 'config.db.sqlite3',
+}
+
+
+def configure(directory):
+    settings.configure(
+        DATABASES={
+            mode: {'ENGINE': engine, 'NAME': os.path.join(directory, f'{mode}.sqlite3')}
+            for mode, engine in MODES.items()
+        } | {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        INSTALLED_APPS=[],
+        USE_TZ=True,
+    )
+    django.setup()
+
+
+def seed(alias):
+    from django.db import connections
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'CREATE TABLE link (id INTEGER PRIMARY KEY, file_id INTEGER, access_count INTEGER)'
+        )
+        cursor.executemany(
+            'INSERT INTO link (id, file_id, access_count) VALUES (%s, %s, 0)',
+            [(i, i % 500) for i in range(ROWS)]
+        )
+    connections[alias].close()
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = self.writes = self.locked = self.other_errors = 0
+
+    def add(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+
+def reader(alias, deadline, counters):
+    from django.db import OperationalError, connections
+    conn = connections[alias]
+    while time.monotonic() < deadline:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    'SELECT file_id, SUM(access_count) FROM link WHERE file_id < %s GROUP BY file_id',
+                    [random.randint(10, 500)]
+                )
+                cursor.fetchall()
+            counters.add('reads')
+        except OperationalError as exc:
+            counters.add('locked' if 'locked' in str(exc) else 'other_errors')
+    conn.close()
+
+
+def writer(alias, deadline, counters):
+    from django.db import OperationalError, connections, transaction
+    conn = connections[alias]
+    while time.monotonic() < deadline:
+        link_id = random.randrange(ROWS)
+        try:
+            with transaction.atomic(using=alias):
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT access_count FROM link WHERE id = %s', [link_id])
+                    cursor.fetchone()
+                    cursor.execute(
+                        'UPDATE link SET access_count = access_count + 1 WHERE id = %s',
+                        [link_id]
+                    )
+            counters.add('writes')
+        except OperationalError as exc:
+            counters.add('locked' if 'locked' in str(exc) else 'other_errors')
+    conn.close()
+
+
+def run(alias, readers, writers, duration):
+    counters = Counters()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=reader, args=(alias, deadline, counters)) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(alias, deadline, counters)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory)
+        print(f"{'mode':<8}{'reads/s':>10}{'writes/s':>10}{'locked':>9}{'other':>8}")
+        for alias in MODES:
+            seed(alias)
+            c = run(alias, args.readers, args.writers, args.duration)
+            print(f'{alias:<8}{c.reads / args.duration:>10.0f}{c.writes / args.duration:>10.0f}'
+                  f'{c.locked:>9}{c.other_errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
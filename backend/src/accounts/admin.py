@@ -1,21 +1,27 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
+from config.admin import LargeTableAdminMixin
 from .models import User, MFABackupCode
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(LargeTableAdminMixin, BaseUserAdmin):
     """Custom admin interface for User model."""
-    list_display = ('email', 'full_name', 'is_staff', 'mfa_enabled')
+    list_display = ('email', 'full_name', 'is_staff', 'mfa_enabled', 'storage_used', 'storage_quota')
     list_filter = ('is_staff', 'is_superuser', 'mfa_enabled', 'is_active')
-    search_fields = ('email', 'full_name')
+    search_fields = ('email',)
+    search_email_field = 'email'
+    search_prefix_field = 'email'
+    search_help_text = _('An email address, or its start (case-sensitive).')
     ordering = ('email',)
+    readonly_fields = ('storage_used', 'file_count')
     
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (_('Personal info'), {'fields': ('full_name',)}),
         (_('MFA'), {'fields': ('mfa_enabled', 'mfa_secret')}),
+        (_('Storage'), {'fields': ('storage_quota', 'storage_used', 'file_count')}),
         (_('Permissions'), {
             'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions'),
         }),
@@ -31,9 +37,14 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(MFABackupCode)
-class MFABackupCodeAdmin(admin.ModelAdmin):
+class MFABackupCodeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for MFABackupCode model."""
     list_display = ('user', 'used', 'created_at', 'used_at')
+    list_select_related = ('user',)
     list_filter = ('used', 'created_at', 'used_at')
-    search_fields = ('user__email', 'user__full_name')
+    search_fields = ('user__email',)
+    search_email_field = 'user__email'
+    search_prefix_field = 'user__email'
+    search_help_text = _('A user email address, or its start (case-sensitive).')
     readonly_fields = ('created_at', 'used_at')
+    raw_id_fields = ('user',)
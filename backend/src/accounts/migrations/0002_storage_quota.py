@@ -0,0 +1,45 @@
+# Generated by Django 5.0 on 2026-10-19 03:25
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_storage(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    EncryptedFile = apps.get_model('files', 'EncryptedFile')
+    totals = (
+        EncryptedFile.objects.values('owner_id')
+        .annotate(files=Count('id'), bytes=Sum('size'))
+        .order_by()
+    )
+    for row in totals:
+        User.objects.filter(pk=row['owner_id']).update(
+            file_count=row['files'], storage_used=row['bytes']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('files', '0004_encryptedfile_tiering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='file_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='file count'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='storage_quota',
+            field=models.BigIntegerField(blank=True, help_text='Bytes this user may store; empty uses STORAGE_QUOTA_DEFAULT', null=True, verbose_name='storage quota'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='storage_used',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='storage used'),
+        ),
+        migrations.RunPython(count_storage, migrations.RunPython.noop),
+    ]
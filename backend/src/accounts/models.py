@@ -73,6 +73,16 @@ class User(AbstractUser):
         default=False,
         help_text=_('Whether MFA is enabled for this user')
     )
+    storage_quota = models.BigIntegerField(
+        _('storage quota'),
+        null=True,
+        blank=True,
+        help_text=_('Bytes this user may store; empty uses STORAGE_QUOTA_DEFAULT')
+    )
+    # Kept in step with the user's files by files.quota, in the same
+    # transaction as each create and delete.
+    storage_used = models.BigIntegerField(_('storage used'), default=0, editable=False)
+    file_count = models.IntegerField(_('file count'), default=0, editable=False)
     
     objects = UserManager()
     
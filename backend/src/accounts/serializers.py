@@ -2,6 +2,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
+from files.quota import quota_of
 from .models import MFABackupCode
 
 User = get_user_model()
@@ -18,11 +19,19 @@ class MFABackupCodeSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     """Serializer for user profile data."""
     backup_codes = MFABackupCodeSerializer(many=True, read_only=True)
+    storage_quota = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'email', 'full_name', 'mfa_enabled', 'backup_codes']
-        read_only_fields = ['id', 'email', 'backup_codes']
+        fields = [
+            'id', 'email', 'full_name', 'mfa_enabled', 'backup_codes',
+            'storage_quota', 'storage_used', 'file_count'
+        ]
+        read_only_fields = ['id', 'email', 'backup_codes', 'storage_used', 'file_count']
+    
+    def get_storage_quota(self, obj):
+        # The effective quota in bytes; null means unlimited.
+        return quota_of(obj)
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -1,3 +1,144 @@
-from django.test import TestCase
+import pyotp
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from config.testing import EndpointBudgetTestCase
+from .models import MFABackupCode
 
-# Create your tests here.
+User = get_user_model()
+
+PASSWORD = 'budget-test-password-1234'
+USERS = 1000
+
+# Endpoint budgets: (max SQL queries, max seconds). Anything that hashes a
+# password pays for one PBKDF2 run, hence the larger time budgets.
+BUDGETS = {
+    'register': (2, 1.5),
+    'login': (1, 1.5),
+    'profile': (2, 0.5),
+    'profile-update': (3, 0.5),
+    'change-password': (2, 3.0),
+    'enable-mfa': (2, 0.5),
+    'disable-mfa': (3, 0.5),
+    'verify-mfa': (1, 0.5),
+    'generate-backup-codes': (12, 0.5),
+    'verify-backup-code': (3, 0.5),
+    'token-refresh': (0, 0.5),
+}
+
+
+class AccountEndpointBudgetTests(EndpointBudgetTestCase):
+    """Query and latency budgets for every endpoint in accounts/urls.py."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user@example.com', PASSWORD, full_name='User')
+        cls.mfa_user = User.objects.create_user(
+            'mfa@example.com', PASSWORD, full_name='MFA User',
+            mfa_enabled=True, mfa_secret=pyotp.random_base32()
+        )
+        # Bulk rows share one password hash; only the table size matters here.
+        User.objects.bulk_create([
+            User(email=f'user{i}@example.com', full_name=f'User {i}', password=cls.user.password)
+            for i in range(USERS)
+        ])
+        MFABackupCode.objects.bulk_create([
+            MFABackupCode(user=cls.mfa_user, code=f'{i:08x}') for i in range(10)
+        ])
+
+    def budget(self, name):
+        return self.assertWithinBudget(name, *BUDGETS[name])
+
+    def test_register(self):
+        with self.budget('register'):
+            response = self.request(
+                'POST', reverse('accounts:register'),
+                data={
+                    'email': 'new@example.com',
+                    'full_name': 'New User',
+                    'password': PASSWORD,
+                    'confirmPassword': PASSWORD,
+                },
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        with self.budget('login'):
+            response = self.request(
+                'POST', reverse('accounts:login'),
+                data={'email': self.user.email, 'password': PASSWORD},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile(self):
+        with self.budget('profile'):
+            response = self.request('GET', reverse('accounts:profile'), self.user)
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_update(self):
+        with self.budget('profile-update'):
+            response = self.request(
+                'PATCH', reverse('accounts:profile'), self.user,
+                data={'full_name': 'Renamed User'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_password(self):
+        with self.budget('change-password'):
+            response = self.request(
+                'POST', reverse('accounts:change-password'), self.user,
+                data={
+                    'old_password': PASSWORD,
+                    'new_password': 'another-budget-password-5678',
+                    'new_password2': 'another-budget-password-5678',
+                },
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_enable_mfa(self):
+        with self.budget('enable-mfa'):
+            response = self.request('POST', reverse('accounts:enable-mfa'), self.user)
+        self.assertEqual(response.status_code, 200)
+
+    def test_disable_mfa(self):
+        with self.budget('disable-mfa'):
+            response = self.request('POST', reverse('accounts:disable-mfa'), self.mfa_user)
+        self.assertEqual(response.status_code, 200)
+
+    def test_verify_mfa(self):
+        with self.budget('verify-mfa'):
+            response = self.request(
+                'POST', reverse('accounts:verify-mfa'),
+                data={
+                    'user_id': self.mfa_user.pk,
+                    'token': pyotp.TOTP(self.mfa_user.mfa_secret).now(),
+                },
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_generate_backup_codes(self):
+        with self.budget('generate-backup-codes'):
+            response = self.request('POST', reverse('accounts:generate-backup-codes'), self.mfa_user)
+        self.assertEqual(response.status_code, 200)
+
+    def test_verify_backup_code(self):
+        with self.budget('verify-backup-code'):
+            response = self.request(
+                'POST', reverse('accounts:verify-backup-code'),
+                data={'user_id': self.mfa_user.pk, 'code': '00000000'},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_refresh(self):
+        refresh = RefreshToken.for_user(self.user)
+        with self.budget('token-refresh'):
+            response = self.request(
+                'POST', reverse('accounts:token-refresh'),
+                data={'refresh': str(refresh)}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
@@ -229,7 +229,7 @@ class DisableMFAView(APIView):
 
         # Disable MFA and delete backup codes
         request.user.mfa_enabled = False
-        request.user.mfa_secret = None
+        request.user.mfa_secret = ''
         request.user.save()
         request.user.backup_codes.all().delete()
 
@@ -0,0 +1,24 @@
+from django.contrib import admin
+from .models import FileHourlyTraffic, UserDailyUsage
+
+
+@admin.register(UserDailyUsage)
+class UserDailyUsageAdmin(admin.ModelAdmin):
+    """Admin interface for UserDailyUsage model."""
+    list_display = (
+        'user', 'day', 'stored_files', 'stored_bytes',
+        'files_added', 'files_deleted', 'downloads', 'bytes_downloaded'
+    )
+    list_select_related = ('user',)
+    date_hierarchy = 'day'
+    search_fields = ('user__email',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(FileHourlyTraffic)
+class FileHourlyTrafficAdmin(admin.ModelAdmin):
+    """Admin interface for FileHourlyTraffic model."""
+    list_display = ('file', 'hour', 'downloads', 'bytes_downloaded')
+    list_select_related = ('file',)
+    date_hierarchy = 'hour'
+    raw_id_fields = ('file',)
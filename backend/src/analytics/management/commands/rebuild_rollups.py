@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from analytics.rollups import rebuild, usage
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the usage rollups from the files and the audit log. '
+        'Changes buffered by running workers meanwhile may be counted twice.'
+    )
+
+    def handle(self, *args, **options):
+        usage.flush()
+        days, hours = rebuild()
+        self.stdout.write(f'Rebuilt {days} daily usage rows and {hours} hourly traffic rows.')
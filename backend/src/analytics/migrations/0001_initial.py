@@ -0,0 +1,63 @@
+# Generated by Django 5.0 on 2026-10-19 03:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('files', '0004_encryptedfile_tiering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('files_added', models.PositiveIntegerField(default=0)),
+                ('bytes_added', models.BigIntegerField(default=0)),
+                ('files_deleted', models.PositiveIntegerField(default=0)),
+                ('bytes_deleted', models.BigIntegerField(default=0)),
+                ('downloads', models.PositiveIntegerField(default=0, help_text="Downloads of the user's files, by anyone")),
+                ('bytes_downloaded', models.BigIntegerField(default=0)),
+                ('stored_files', models.IntegerField(default=0, help_text='Files stored at the end of the day')),
+                ('stored_bytes', models.BigIntegerField(default=0, help_text='Bytes stored at the end of the day')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'daily usage',
+                'verbose_name_plural': 'daily usage',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FileHourlyTraffic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='Start of the hour')),
+                ('downloads', models.PositiveIntegerField(default=0)),
+                ('bytes_downloaded', models.BigIntegerField(default=0)),
+                ('file', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='files.encryptedfile')),
+            ],
+            options={
+                'verbose_name': 'hourly file traffic',
+                'verbose_name_plural': 'hourly file traffic',
+                'ordering': ['-hour'],
+                'indexes': [models.Index(fields=['hour'], name='traffic_hour_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filehourlytraffic',
+            constraint=models.UniqueConstraint(fields=('file', 'hour'), name='traffic_file_hour_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdailyusage',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='usage_user_day_unique'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.db import models
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+
+class UserDailyUsage(models.Model):
+    """Storage and traffic totals of one user's files on one day."""
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_usage'
+    )
+    day = models.DateField()
+    files_added = models.PositiveIntegerField(default=0)
+    bytes_added = models.BigIntegerField(default=0)
+    files_deleted = models.PositiveIntegerField(default=0)
+    bytes_deleted = models.BigIntegerField(default=0)
+    downloads = models.PositiveIntegerField(
+        default=0,
+        help_text=_('Downloads of the user\'s files, by anyone')
+    )
+    bytes_downloaded = models.BigIntegerField(default=0)
+    stored_files = models.IntegerField(
+        default=0,
+        help_text=_('Files stored at the end of the day')
+    )
+    stored_bytes = models.BigIntegerField(
+        default=0,
+        help_text=_('Bytes stored at the end of the day')
+    )
+    
+    class Meta:
+        verbose_name = _('daily usage')
+        verbose_name_plural = _('daily usage')
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='usage_user_day_unique'),
+        ]
+        
+    def __str__(self):
+        return f'{self.user_id} on {self.day}'
+
+
+class FileHourlyTraffic(models.Model):
+    """Downloads of one file during one hour."""
+    
+    # Not a database constraint, so deleting a file does not touch its
+    # traffic; rows of deleted files are dropped by the next rebuild.
+    file = models.ForeignKey(
+        'files.EncryptedFile',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    hour = models.DateTimeField(help_text=_('Start of the hour'))
+    downloads = models.PositiveIntegerField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = _('hourly file traffic')
+        verbose_name_plural = _('hourly file traffic')
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'hour'], name='traffic_file_hour_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='traffic_hour_idx'),
+        ]
+        
+    def __str__(self):
+        return f'{self.file_id} at {self.hour}'
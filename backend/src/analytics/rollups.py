@@ -0,0 +1,196 @@
+"""
+Incremental usage rollups.
+
+``UserDailyUsage`` keeps per-user, per-day upload, deletion and download
+totals plus the user's stored files and bytes at the end of the day;
+``FileHourlyTraffic`` keeps downloads per file per hour. Views report
+changes to ``usage``, a write-behind buffer that sums them in memory and
+adds the sums to the tables every ``ROLLUP_FLUSH_INTERVAL`` seconds, so
+requests never wait on a rollup update. Reading a rollup is an indexed
+lookup however many files there are.
+
+``rebuild()`` (``manage.py rebuild_rollups``) recomputes both tables from
+``EncryptedFile`` and the audit log, e.g. after buffered changes were lost
+in a crash.
+"""
+
+import threading
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+from audit.models import AuditEvent
+from config.buffers import BackgroundFlusher
+from files.models import EncryptedFile
+from .models import FileHourlyTraffic, UserDailyUsage
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _increment(model, keys, deltas, initial=None):
+    """Add ``deltas`` to the row matching ``keys``, creating it if needed."""
+    increments = {name: F(name) + value for name, value in deltas.items()}
+    if model.objects.filter(**keys).update(**increments):
+        return
+    values = dict(initial or {})
+    for name, value in deltas.items():
+        values[name] = values.get(name, 0) + value
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **values)
+    except IntegrityError:
+        # Created concurrently, or the user is gone (then this updates
+        # nothing and the change is dropped).
+        model.objects.filter(**keys).update(**increments)
+
+
+def add_user_usage(user_id, day, **deltas):
+    # A user's first row of the day carries the stored totals forward.
+    previous = UserDailyUsage.objects.filter(
+        user_id=user_id, day__lt=day
+    ).order_by('-day').values('stored_files', 'stored_bytes').first()
+    _increment(UserDailyUsage, {'user_id': user_id, 'day': day}, deltas, previous)
+
+
+def add_file_traffic(file_id, hour, **deltas):
+    _increment(FileHourlyTraffic, {'file_id': file_id, 'hour': hour}, deltas)
+
+
+class UsageBuffer(BackgroundFlusher):
+    interval_setting = 'ROLLUP_FLUSH_INTERVAL'
+    thread_name = 'usage-rollups'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._users = defaultdict(Counter)
+        self._files = defaultdict(Counter)
+
+    def _add(self, user_key, user_deltas, file_key=None, file_deltas=None):
+        with self._lock:
+            if self._ensure_flusher():
+                self._users = defaultdict(Counter)
+                self._files = defaultdict(Counter)
+            self._users[user_key].update(user_deltas)
+            if file_key is not None:
+                self._files[file_key].update(file_deltas)
+
+    def file_added(self, file_obj):
+        self._add((file_obj.owner_id, timezone.localdate()), {
+            'files_added': 1,
+            'bytes_added': file_obj.size,
+            'stored_files': 1,
+            'stored_bytes': file_obj.size,
+        })
+
+    def file_deleted(self, file_obj):
+        self.files_deleted(file_obj.owner_id, 1, file_obj.size)
+
+    def files_deleted(self, owner_id, files, nbytes):
+        self._add((owner_id, timezone.localdate()), {
+            'files_deleted': files,
+            'bytes_deleted': nbytes,
+            'stored_files': -files,
+            'stored_bytes': -nbytes,
+        })
+
+    def downloaded(self, file_obj, nbytes=None):
+        nbytes = file_obj.size if nbytes is None else nbytes
+        now = timezone.now()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        deltas = {'downloads': 1, 'bytes_downloaded': nbytes}
+        self._add(
+            (file_obj.owner_id, timezone.localdate(now)), deltas,
+            (file_obj.pk, hour), deltas
+        )
+
+    def flush(self):
+        """Apply the buffered changes; returns the number of rows touched."""
+        with self._lock:
+            users, self._users = self._users, defaultdict(Counter)
+            files, self._files = self._files, defaultdict(Counter)
+
+        pending = [(add_user_usage, key, deltas) for key, deltas in users.items()]
+        pending += [(add_file_traffic, key, deltas) for key, deltas in files.items()]
+        for done, (apply, key, deltas) in enumerate(pending):
+            try:
+                apply(*key, **deltas)
+            except Exception:
+                self._restore(pending[done:])
+                raise
+        return len(pending)
+
+    def _restore(self, pending):
+        with self._lock:
+            for apply, key, deltas in pending:
+                target = self._users if apply is add_user_usage else self._files
+                target[key].update(deltas)
+
+
+usage = UsageBuffer()
+
+
+def rebuild():
+    """
+    Recompute all rollups from the files and the audit log.
+
+    Deleted files leave no trace in either, so the rebuilt tables count no
+    deletions, and downloads of deleted files are gone. Traffic bytes
+    assume every download was of the whole file.
+    """
+    users = {}
+
+    def user_row(owner_id, day):
+        if (owner_id, day) not in users:
+            users[owner_id, day] = UserDailyUsage(user_id=owner_id, day=day)
+        return users[owner_id, day]
+
+    added = (
+        EncryptedFile.objects.annotate(day=TruncDate('created_at'))
+        .values('owner_id', 'day')
+        .annotate(files=Count('id'), bytes=Sum('size'))
+        .order_by()
+    )
+    for row in added:
+        usage_row = user_row(row['owner_id'], row['day'])
+        usage_row.files_added = row['files']
+        usage_row.bytes_added = row['bytes']
+
+    traffic = []
+    downloads = (
+        AuditEvent.objects.filter(
+            action__in=[AuditEvent.DOWNLOAD, AuditEvent.PUBLIC_DOWNLOAD],
+            file__isnull=False,
+        )
+        .annotate(hour=TruncHour('created_at'))
+        .values('file_id', 'file__owner_id', 'file__size', 'hour')
+        .annotate(downloads=Count('id'))
+        .order_by()
+    )
+    for row in downloads:
+        if row['file__owner_id'] is None:
+            continue  # the file was deleted
+        nbytes = row['downloads'] * row['file__size']
+        traffic.append(FileHourlyTraffic(
+            file_id=row['file_id'], hour=row['hour'],
+            downloads=row['downloads'], bytes_downloaded=nbytes
+        ))
+        usage_row = user_row(row['file__owner_id'], timezone.localdate(row['hour']))
+        usage_row.downloads += row['downloads']
+        usage_row.bytes_downloaded += nbytes
+
+    stored = defaultdict(lambda: [0, 0])
+    for (owner_id, _), usage_row in sorted(users.items()):
+        totals = stored[owner_id]
+        totals[0] += usage_row.files_added
+        totals[1] += usage_row.bytes_added
+        usage_row.stored_files, usage_row.stored_bytes = totals
+
+    with transaction.atomic():
+        UserDailyUsage.objects.all().delete()
+        FileHourlyTraffic.objects.all().delete()
+        UserDailyUsage.objects.bulk_create(users.values(), batch_size=REBUILD_BATCH_SIZE)
+        FileHourlyTraffic.objects.bulk_create(traffic, batch_size=REBUILD_BATCH_SIZE)
+    return len(users), len(traffic)
@@ -0,0 +1,23 @@
+from rest_framework import serializers
+from .models import FileHourlyTraffic, UserDailyUsage
+
+
+class UserDailyUsageSerializer(serializers.ModelSerializer):
+    """Serializer for a user's daily usage."""
+    
+    class Meta:
+        model = UserDailyUsage
+        fields = (
+            'day', 'files_added', 'bytes_added', 'files_deleted', 'bytes_deleted',
+            'downloads', 'bytes_downloaded', 'stored_files', 'stored_bytes'
+        )
+        read_only_fields = fields
+
+
+class FileHourlyTrafficSerializer(serializers.ModelSerializer):
+    """Serializer for a file's hourly traffic."""
+    
+    class Meta:
+        model = FileHourlyTraffic
+        fields = ('hour', 'downloads', 'bytes_downloaded')
+        read_only_fields = fields
@@ -0,0 +1,165 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from audit.models import AuditEvent
+from config.testing import EndpointBudgetTestCase
+from files.models import EncryptedFile
+from .models import FileHourlyTraffic, UserDailyUsage
+from .rollups import UsageBuffer, usage
+
+User = get_user_model()
+
+PASSWORD = 'analytics-test-password-1234'
+
+
+def make_file(owner, name='a.txt', size=100):
+    return EncryptedFile.objects.create(
+        owner=owner, name=name, file=f'encrypted_files/{name}',
+        mime_type='text/plain', size=size, encryption_key=b'', encryption_iv=b''
+    )
+
+
+@override_settings(ROLLUP_FLUSH_INTERVAL=0)
+class UsageBufferTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('rollup-owner@example.com', PASSWORD, full_name='Owner')
+
+    def setUp(self):
+        self.buffer = UsageBuffer()
+        self.addCleanup(self.buffer.flush)
+
+    def test_changes_are_summed_before_writing(self):
+        first, second = make_file(self.owner, 'a.txt', 100), make_file(self.owner, 'b.txt', 50)
+        self.buffer.file_added(first)
+        self.buffer.file_added(second)
+        for _ in range(3):
+            self.buffer.downloaded(first)
+        self.buffer.downloaded(second, nbytes=10)
+        self.assertFalse(UserDailyUsage.objects.exists())
+
+        # One user row and two traffic rows, each an UPDATE then an INSERT
+        # in a savepoint, plus the lookup of the user's previous totals.
+        with self.assertNumQueries(13):
+            self.assertEqual(self.buffer.flush(), 3)
+        row = UserDailyUsage.objects.get(user=self.owner)
+        self.assertEqual(
+            (row.files_added, row.bytes_added, row.downloads, row.bytes_downloaded),
+            (2, 150, 4, 310)
+        )
+        self.assertEqual((row.stored_files, row.stored_bytes), (2, 150))
+        traffic = FileHourlyTraffic.objects.get(file=first)
+        self.assertEqual((traffic.downloads, traffic.bytes_downloaded), (3, 300))
+
+        self.buffer.downloaded(first)
+        self.buffer.flush()
+        traffic.refresh_from_db()
+        self.assertEqual(traffic.downloads, 4)
+
+    def test_stored_totals_carry_over_to_the_next_day(self):
+        UserDailyUsage.objects.create(
+            user=self.owner, day=timezone.localdate() - timedelta(days=3),
+            files_added=5, bytes_added=500, stored_files=5, stored_bytes=500
+        )
+        self.buffer.file_deleted(make_file(self.owner, size=100))
+        self.buffer.flush()
+
+        row = UserDailyUsage.objects.get(user=self.owner, day=timezone.localdate())
+        self.assertEqual((row.files_added, row.files_deleted, row.bytes_deleted), (0, 1, 100))
+        self.assertEqual((row.stored_files, row.stored_bytes), (4, 400))
+
+    def test_traffic_outlives_the_file(self):
+        file_obj = make_file(self.owner)
+        file_id = file_obj.pk
+        self.buffer.downloaded(file_obj)
+        file_obj.delete()
+
+        self.buffer.flush()
+        self.assertEqual(FileHourlyTraffic.objects.get().file_id, file_id)
+        self.assertEqual(UserDailyUsage.objects.get(user=self.owner).downloads, 1)
+
+
+class RebuildTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('rebuild-owner@example.com', PASSWORD, full_name='Owner')
+
+    def test_rebuild_recomputes_from_files_and_audit_log(self):
+        now = timezone.now()
+        old = make_file(self.owner, 'old.txt', 100)
+        EncryptedFile.objects.filter(pk=old.pk).update(created_at=now - timedelta(days=2))
+        new = make_file(self.owner, 'new.txt', 30)
+        AuditEvent.objects.bulk_create([
+            AuditEvent(action=AuditEvent.DOWNLOAD, actor=self.owner, file=new),
+            AuditEvent(action=AuditEvent.PUBLIC_DOWNLOAD, file=new),
+            AuditEvent(action=AuditEvent.SHARE, actor=self.owner, file=new),
+        ])
+        UserDailyUsage.objects.create(user=self.owner, day=now.date(), files_added=99)
+
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        rows = list(UserDailyUsage.objects.filter(user=self.owner).order_by('day'))
+        self.assertEqual(
+            [(r.files_added, r.stored_files, r.stored_bytes, r.downloads) for r in rows],
+            [(1, 1, 100, 0), (1, 2, 130, 2)]
+        )
+        traffic = FileHourlyTraffic.objects.get()
+        self.assertEqual((traffic.file_id, traffic.downloads, traffic.bytes_downloaded), (new.pk, 2, 60))
+
+
+class AnalyticsAPITests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('analytics-owner@example.com', PASSWORD, full_name='Owner')
+        cls.other = User.objects.create_user('analytics-other@example.com', PASSWORD, full_name='Other')
+
+    def test_uploads_downloads_and_deletes_are_rolled_up(self):
+        ids = []
+        for name in ('a.txt', 'b.txt'):
+            response = self.request(
+                'POST', reverse('files:file-list'), self.owner,
+                data={'name': name, 'file': SimpleUploadedFile(name, b'x' * 10, content_type='text/plain')}
+            )
+            ids.append(response.json()['id'])
+        self.request('GET', reverse('files:file-download', args=[ids[0]]), self.owner)
+        self.request(
+            'GET', reverse('files:file-download-stream', args=[ids[0]]), self.owner,
+            HTTP_RANGE='bytes=0-3'
+        )
+        self.request('DELETE', reverse('files:file-detail', args=[ids[1]]), self.owner)
+        usage.flush()
+
+        with self.assertWithinBudget('analytics-usage', 3, 0.5):
+            response = self.request('GET', reverse('analytics:usage'), self.owner)
+        body = response.json()
+        self.assertEqual((body['stored_files'], body['stored_bytes']), (1, 10))
+        self.assertEqual(len(body['days']), 1)
+        self.assertEqual(body['days'][0]['files_added'], 2)
+        self.assertEqual(body['days'][0]['files_deleted'], 1)
+        self.assertEqual(body['days'][0]['bytes_downloaded'], 14)
+
+        response = self.request('GET', reverse('analytics:file-traffic', args=[ids[0]]), self.owner)
+        self.assertEqual([row['downloads'] for row in response.json()], [2])
+        response = self.request('GET', reverse('analytics:file-traffic', args=[ids[0]]), self.other)
+        self.assertEqual(response.status_code, 404)
+
+        response = self.request('GET', reverse('analytics:top-files'), self.owner)
+        self.assertEqual(
+            [(row['name'], row['downloads']) for row in response.json()],
+            [('a.txt', 2)]
+        )
+        response = self.request('GET', reverse('analytics:top-files'), self.other)
+        self.assertEqual(response.json(), [])
+
+    def test_usage_of_a_new_user_is_empty(self):
+        response = self.request('GET', reverse('analytics:usage'), self.other)
+        self.assertEqual(response.json(), {'stored_files': 0, 'stored_bytes': 0, 'days': []})
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+app_name = 'analytics'
+
+urlpatterns = [
+    path('usage/', views.UsageView.as_view(), name='usage'),
+    path('files/<uuid:pk>/traffic/', views.FileTrafficView.as_view(), name='file-traffic'),
+    path('top-files/', views.TopFilesView.as_view(), name='top-files'),
+]
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from config.db.routers import ReplicaReadsMixin
+from files.models import EncryptedFile
+from .models import FileHourlyTraffic, UserDailyUsage
+from .serializers import FileHourlyTrafficSerializer, UserDailyUsageSerializer
+
+
+def _int_param(request, name, default, maximum):
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        value = default
+    return min(max(value, 1), maximum)
+
+
+class UsageView(ReplicaReadsMixin, APIView):
+    """Current storage and the last ``days`` days of usage for the user."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def get(self, request):
+        days = _int_param(request, 'days', 30, 366)
+        rows = list(
+            UserDailyUsage.objects.filter(user=request.user).order_by('-day')[:days]
+        )
+        # The newest row holds the running totals, even if it is older.
+        latest = rows[0] if rows else None
+        since = timezone.localdate() - timedelta(days=days - 1)
+        return Response({
+            'stored_files': latest.stored_files if latest else 0,
+            'stored_bytes': latest.stored_bytes if latest else 0,
+            'days': UserDailyUsageSerializer(
+                [row for row in rows if row.day >= since], many=True
+            ).data,
+        })
+
+
+class FileTrafficView(ReplicaReadsMixin, APIView):
+    """Hourly downloads of one of the user's files over the last ``hours`` hours."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def get(self, request, pk):
+        get_object_or_404(EncryptedFile.objects.only('pk'), pk=pk, owner=request.user)
+        hours = _int_param(request, 'hours', 24 * 7, 24 * 90)
+        rows = FileHourlyTraffic.objects.filter(
+            file_id=pk, hour__gte=timezone.now() - timedelta(hours=hours)
+        ).order_by('-hour')
+        return Response(FileHourlyTrafficSerializer(rows, many=True).data)
+
+
+class TopFilesView(ReplicaReadsMixin, APIView):
+    """The user's most downloaded files over the last ``days`` days."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def get(self, request):
+        days = _int_param(request, 'days', 7, 90)
+        limit = _int_param(request, 'limit', 10, 100)
+        rows = (
+            FileHourlyTraffic.objects.filter(
+                file__owner=request.user,
+                hour__gte=timezone.now() - timedelta(days=days),
+            )
+            .values('file_id', 'file__name')
+            .annotate(downloads=Sum('downloads'), bytes_downloaded=Sum('bytes_downloaded'))
+            .order_by('-downloads')[:limit]
+        )
+        return Response([
+            {
+                'file': row['file_id'],
+                'name': row['file__name'],
+                'downloads': row['downloads'],
+                'bytes_downloaded': row['bytes_downloaded'],
+            }
+            for row in rows
+        ])
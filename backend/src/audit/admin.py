@@ -0,0 +1,15 @@
+from django.contrib import admin
+from django.utils.translation import gettext_lazy as _
+from config.admin import LargeTableAdminMixin
+from .models import AuditEvent
+
+
+@admin.register(AuditEvent)
+class AuditEventAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """Admin interface for AuditEvent model."""
+    list_display = ('action', 'file_id', 'actor_id', 'target', 'ip_address', 'created_at')
+    list_filter = ('action',)
+    search_fields = ('target',)
+    search_prefix_field = 'target'
+    search_help_text = _('The start of a target (a recipient email address or link ID).')
+    readonly_fields = ('action', 'actor', 'file', 'target', 'ip_address', 'created_at')
@@ -0,0 +1,112 @@
+"""
+Write-behind buffer for audit events.
+
+``record()`` appends an unsaved ``AuditEvent`` to an in-process buffer and
+returns; a daemon thread writes the buffer with ``bulk_create`` as soon as it
+holds ``AUDIT_FLUSH_SIZE`` events, and at least every
+``AUDIT_FLUSH_INTERVAL`` seconds.
+
+At most ``AUDIT_BUFFER_SIZE`` events wait in the buffer. When it is full
+because the database cannot keep up, ``record()`` waits up to
+``AUDIT_BLOCK_SECONDS`` for the flusher to make room and then drops the
+event. Async views pass ``block=False`` so the event loop never waits: their
+events are dropped at once when the buffer is full. Drops are counted in
+``dropped`` and logged. Whatever is left is written when the process exits
+(``atexit`` and gunicorn's ``worker_exit`` hook).
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from config.buffers import BackgroundFlusher
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer(BackgroundFlusher):
+    interval_setting = 'AUDIT_FLUSH_INTERVAL'
+    thread_name = 'audit-flusher'
+
+    def __init__(self):
+        super().__init__()
+        self._cond = threading.Condition()
+        self._events = []
+        self._reported_drops = 0
+        self.dropped = 0
+        self.written = 0
+
+    def add(self, event, block=True):
+        """
+        Buffer ``event``; returns False if it was dropped. Waits for room in a
+        full buffer only if ``block`` is set.
+        """
+        limit = settings.AUDIT_BUFFER_SIZE
+        with self._cond:
+            if self._ensure_flusher():
+                self._events = []
+            if len(self._events) >= limit:
+                self.wake()
+                if block and self.background:
+                    self._cond.wait_for(
+                        lambda: len(self._events) < limit,
+                        timeout=settings.AUDIT_BLOCK_SECONDS
+                    )
+                if len(self._events) >= limit:
+                    self.dropped += 1
+                    return False
+            self._events.append(event)
+            if len(self._events) >= settings.AUDIT_FLUSH_SIZE:
+                self.wake()
+        return True
+
+    def after_flush(self):
+        if self.dropped > self._reported_drops:
+            logger.warning(
+                'Dropped %d audit events because the buffer was full',
+                self.dropped - self._reported_drops
+            )
+            self._reported_drops = self.dropped
+
+    def flush(self):
+        """Write all buffered events; returns how many were written."""
+        with self._cond:
+            events, self._events = self._events, []
+            self._cond.notify_all()
+        if not events:
+            return 0
+        try:
+            AuditEvent.objects.bulk_create(events, batch_size=settings.AUDIT_FLUSH_SIZE)
+        except Exception:
+            self._requeue(events)
+            raise
+        self.written += len(events)
+        return len(events)
+
+    def _requeue(self, events):
+        with self._cond:
+            room = max(0, settings.AUDIT_BUFFER_SIZE - len(self._events))
+            self.dropped += max(0, len(events) - room)
+            self._events[:0] = events[-room:] if room else []
+
+
+audit_log = AuditBuffer()
+
+
+def record(action, *, actor=None, file=None, target='', request=None, block=True):
+    """
+    Buffer an audit event without touching the database.
+
+    ``actor`` and ``file`` may be model instances or primary keys; see
+    ``AuditBuffer.add`` for ``block``.
+    """
+    return audit_log.add(AuditEvent(
+        action=action,
+        actor_id=getattr(actor, 'pk', actor),
+        file_id=getattr(file, 'pk', file),
+        target=str(target)[:255],
+        ip_address=(request.META.get('REMOTE_ADDR') or None) if request is not None else None,
+        created_at=timezone.now(),
+    ), block=block)
@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-19 03:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('files', '0004_encryptedfile_tiering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('download', 'Download'), ('public_download', 'Public link download'), ('share', 'Share'), ('unshare', 'Unshare'), ('link_create', 'Link created'), ('link_delete', 'Link deleted')], max_length=20)),
+                ('target', models.CharField(blank=True, help_text='Recipient email or link ID, depending on the action', max_length=255)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, db_index=False, help_text='User who acted; empty for public link downloads', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('file', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='files.encryptedfile')),
+            ],
+            options={
+                'verbose_name': 'audit event',
+                'verbose_name_plural': 'audit events',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['file', '-created_at'], name='audit_file_time_idx'), models.Index(fields=['actor', '-created_at'], name='audit_actor_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-19 03:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0001_initial'),
+        ('files', '0008_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditevent',
+            index=models.Index(fields=['-created_at'], name='audit_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditevent',
+            index=models.Index(fields=['target'], name='audit_target_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
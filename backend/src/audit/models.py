@@ -0,0 +1,71 @@
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class AuditEvent(models.Model):
+    """
+    A download or sharing event, written in batches by ``audit.buffer``.
+
+    Events outlive the users and files they mention, so the foreign keys
+    have no database constraint and are left dangling on deletion.
+    """
+    
+    DOWNLOAD = 'download'
+    PUBLIC_DOWNLOAD = 'public_download'
+    SHARE = 'share'
+    UNSHARE = 'unshare'
+    LINK_CREATE = 'link_create'
+    LINK_DELETE = 'link_delete'
+    ACTION_CHOICES = (
+        (DOWNLOAD, _('Download')),
+        (PUBLIC_DOWNLOAD, _('Public link download')),
+        (SHARE, _('Share')),
+        (UNSHARE, _('Unshare')),
+        (LINK_CREATE, _('Link created')),
+        (LINK_DELETE, _('Link deleted')),
+    )
+    
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text=_('User who acted; empty for public link downloads')
+    )
+    file = models.ForeignKey(
+        'files.EncryptedFile',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    target = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text=_('Recipient email or link ID, depending on the action')
+    )
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = _('audit event')
+        verbose_name_plural = _('audit events')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['file', '-created_at'], name='audit_file_time_idx'),
+            models.Index(fields=['actor', '-created_at'], name='audit_actor_time_idx'),
+            # The admin changelist's ordering and target prefix search.
+            models.Index(fields=['-created_at'], name='audit_time_idx'),
+            models.Index(fields=['target'], name='audit_target_idx', opclasses=['varchar_pattern_ops']),
+        ]
+        
+    def __str__(self):
+        return f'{self.action} {self.file_id} by {self.actor_id}'
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+from .models import AuditEvent
+
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    """Serializer for audit events."""
+    
+    class Meta:
+        model = AuditEvent
+        fields = ('id', 'action', 'actor', 'file', 'target', 'ip_address', 'created_at')
+        read_only_fields = fields
@@ -0,0 +1,150 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from config.testing import EndpointBudgetTestCase
+from files.models import EncryptedFile
+from .buffer import AuditBuffer, audit_log
+from .models import AuditEvent
+
+User = get_user_model()
+
+PASSWORD = 'audit-test-password-1234'
+
+
+@override_settings(AUDIT_FLUSH_INTERVAL=0, AUDIT_FLUSH_SIZE=100, AUDIT_BUFFER_SIZE=3)
+class AuditBufferTests(TestCase):
+
+    def setUp(self):
+        self.buffer = AuditBuffer()
+        self.addCleanup(self.buffer.flush)
+
+    def event(self, n=0):
+        return AuditEvent(action=AuditEvent.DOWNLOAD, target=str(n))
+
+    def test_events_are_written_in_one_batch(self):
+        for n in range(3):
+            self.assertTrue(self.buffer.add(self.event(n)))
+        self.assertEqual(AuditEvent.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(sorted(AuditEvent.objects.values_list('target', flat=True)), ['0', '1', '2'])
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_full_buffer_drops_and_counts(self):
+        for n in range(3):
+            self.buffer.add(self.event(n))
+        self.assertFalse(self.buffer.add(self.event(3)))
+        self.assertEqual(self.buffer.dropped, 1)
+
+        self.buffer.flush()
+        self.assertTrue(self.buffer.add(self.event(4)))
+
+    @override_settings(AUDIT_FLUSH_INTERVAL=60)
+    def test_non_blocking_add_drops_at_once(self):
+        with mock.patch.object(AuditBuffer, '_run'), mock.patch.object(self.buffer._cond, 'wait_for') as wait_for:
+            for n in range(3):
+                self.buffer.add(self.event(n))
+            self.assertTrue(self.buffer.background)
+            self.assertFalse(self.buffer.add(self.event(3), block=False))
+            wait_for.assert_not_called()
+            self.assertFalse(self.buffer.add(self.event(4)))
+            wait_for.assert_called_once()
+        self.assertEqual(self.buffer.dropped, 2)
+
+    def test_failed_flush_keeps_events(self):
+        self.buffer.add(self.event(1))
+        self.buffer.add(self.event(2))
+        with mock.patch.object(AuditEvent.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.buffer.add(self.event(3))
+        self.assertFalse(self.buffer.add(self.event(4)))
+
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(AuditEvent.objects.count(), 3)
+
+    @override_settings(AUDIT_FLUSH_INTERVAL=60, AUDIT_FLUSH_SIZE=2, AUDIT_BUFFER_SIZE=100)
+    def test_reaching_flush_size_wakes_the_flusher(self):
+        with mock.patch.object(AuditBuffer, '_run'):
+            self.buffer.add(self.event(1))
+            self.assertFalse(self.buffer._wake.is_set())
+            self.buffer.add(self.event(2))
+            self.assertTrue(self.buffer._wake.is_set())
+
+
+class AuditEventAPITests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('audit-owner@example.com', PASSWORD, full_name='Owner')
+        cls.recipient = User.objects.create_user('audit-recipient@example.com', PASSWORD, full_name='Recipient')
+
+    def test_downloads_and_shares_are_audited(self):
+        response = self.request(
+            'POST', reverse('files:file-list'), self.owner,
+            data={'name': 'a.txt', 'file': SimpleUploadedFile('a.txt', b'audit me', content_type='text/plain')}
+        )
+        file_id = response.json()['id']
+        self.request(
+            'POST', reverse('files:file-share', args=[file_id]), self.owner,
+            data={
+                'shared_with': self.recipient.pk,
+                'shared_with_username': self.recipient.email,
+                'shared_with_email': self.recipient.email,
+            },
+            content_type='application/json'
+        )
+        self.request('GET', reverse('files:file-download', args=[file_id]), self.recipient)
+        self.request('GET', reverse('files:file-download-stream', args=[file_id]), self.owner)
+        self.assertFalse(AuditEvent.objects.exists())
+        audit_log.flush()
+
+        response = self.request('GET', reverse('audit:file-events', args=[file_id]), self.owner)
+        self.assertEqual(response.status_code, 200)
+        events = response.json()['results']
+        self.assertEqual(
+            [(e['action'], e['actor']) for e in events],
+            [
+                (AuditEvent.DOWNLOAD, self.owner.pk),
+                (AuditEvent.DOWNLOAD, self.recipient.pk),
+                (AuditEvent.SHARE, self.owner.pk),
+            ]
+        )
+        self.assertEqual(events[2]['target'], self.recipient.email)
+
+        response = self.request('GET', reverse('audit:file-events', args=[file_id]), self.recipient)
+        self.assertEqual(response.status_code, 404)
+
+        response = self.request('GET', reverse('audit:my-events'), self.recipient)
+        self.assertEqual([e['action'] for e in response.json()['results']], [AuditEvent.DOWNLOAD])
+        response = self.request('GET', reverse('audit:user-events', args=[self.owner.pk]), self.recipient)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_async_downloads_do_not_wait_for_room(self):
+        response = self.request(
+            'POST', reverse('files:file-list'), self.owner,
+            data={'name': 'a.txt', 'file': SimpleUploadedFile('a.txt', b'audit me', content_type='text/plain')}
+        )
+        file_id = response.json()['id']
+        with mock.patch.object(audit_log, 'add', wraps=audit_log.add) as add:
+            self.request('GET', reverse('files:file-download', args=[file_id]), self.owner)
+            self.request('GET', reverse('files:file-download-stream', args=[file_id]), self.owner)
+        self.assertEqual([call.kwargs['block'] for call in add.call_args_list], [True, False])
+
+    def test_events_survive_file_deletion(self):
+        file_obj = EncryptedFile.objects.create(
+            owner=self.owner, name='gone.txt', file='encrypted_files/gone.txt',
+            mime_type='text/plain', size=1, encryption_key=b'', encryption_iv=b''
+        )
+        file_id = file_obj.pk
+        AuditEvent.objects.create(action=AuditEvent.DOWNLOAD, actor=self.owner, file=file_obj)
+        file_obj.delete()
+
+        self.assertEqual(AuditEvent.objects.filter(file_id=file_id).count(), 1)
+        staff = User.objects.create_user('audit-staff@example.com', PASSWORD, full_name='Staff', is_staff=True)
+        response = self.request('GET', reverse('audit:file-events', args=[file_id]), staff)
+        self.assertEqual(len(response.json()['results']), 1)
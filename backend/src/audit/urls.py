@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+app_name = 'audit'
+
+urlpatterns = [
+    path('files/<uuid:pk>/', views.FileAuditEventListView.as_view(), name='file-events'),
+    path('me/', views.UserAuditEventListView.as_view(), name='my-events'),
+    path('users/<int:pk>/', views.UserAuditEventListView.as_view(), name='user-events'),
+]
@@ -0,0 +1,42 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions
+from rest_framework.pagination import CursorPagination
+from config.db.routers import ReplicaReadsMixin
+from files.models import EncryptedFile
+from .models import AuditEvent
+from .serializers import AuditEventSerializer
+
+
+class AuditEventPagination(CursorPagination):
+    """Newest first; cursors keep pages stable while events are added."""
+    ordering = '-created_at'
+    page_size = 50
+
+
+class FileAuditEventListView(ReplicaReadsMixin, generics.ListAPIView):
+    """Events concerning one file, for its owner (or staff)."""
+    serializer_class = AuditEventSerializer
+    pagination_class = AuditEventPagination
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def get_queryset(self):
+        if not self.request.user.is_staff:
+            get_object_or_404(
+                EncryptedFile.objects.only('pk'),
+                pk=self.kwargs['pk'],
+                owner=self.request.user
+            )
+        return AuditEvent.objects.filter(file_id=self.kwargs['pk'])
+
+
+class UserAuditEventListView(ReplicaReadsMixin, generics.ListAPIView):
+    """Events performed by the current user, or by any user for staff."""
+    serializer_class = AuditEventSerializer
+    pagination_class = AuditEventPagination
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def get_queryset(self):
+        user_id = self.kwargs.get('pk', self.request.user.pk)
+        if user_id != self.request.user.pk and not self.request.user.is_staff:
+            return AuditEvent.objects.none()
+        return AuditEvent.objects.filter(actor_id=user_id)
@@ -0,0 +1,63 @@
+"""
+Admin helpers for tables with millions of rows.
+
+The stock changelist counts the whole table and the filtered result on
+every page, and its search runs ``icontains`` over every search field, all
+of which scan the table. ``LargeTableAdminMixin`` swaps those for an
+estimated total (PostgreSQL's planner statistics), a count that stops at
+``ADMIN_COUNT_LIMIT`` rows for filtered lists, and a search that only uses
+indexes: a term containing ``@`` matches ``search_email_field`` exactly and
+any other term is a case-sensitive prefix of ``search_prefix_field``.
+"""
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """The planner's row estimate for the queryset's table, or None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    # -1 until the table was first analyzed.
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never counts more than ``ADMIN_COUNT_LIMIT`` rows."""
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_COUNT_LIMIT
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= limit:
+                return estimate
+        # Later pages of a larger result are reached through filters.
+        return self.object_list.order_by()[:limit].count()
+
+
+class LargeTableAdminMixin:
+    """ModelAdmin settings for changelists over very large tables."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_email_field = None
+    search_prefix_field = None
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if '@' in term and self.search_email_field:
+            return queryset.filter(**{self.search_email_field: term}), False
+        if self.search_prefix_field:
+            return queryset.filter(**{f'{self.search_prefix_field}__startswith': term}), False
+        return queryset.none(), False
@@ -0,0 +1,75 @@
+"""
+Base class for in-process write-behind buffers.
+
+Subclasses collect work in memory on the request path and implement
+``flush()`` to write it to the database. A daemon thread calls ``flush()``
+every ``interval_setting`` seconds, or earlier after ``wake()``; with an
+interval of 0 there is no thread and callers flush by hand. Each process
+gets its own thread (including forked workers), and the buffer is flushed
+once more at exit.
+"""
+
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFlusher:
+    interval_setting = None
+    thread_name = 'flusher'
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_flusher(self):
+        """Start the flush thread if needed; returns True in a new process."""
+        new_process = self._pid != os.getpid()
+        if new_process:
+            # A forked child does not inherit the parent's thread.
+            self._pid = os.getpid()
+            self._thread = None
+            atexit.register(self._flush_at_exit)
+        if self._thread is None and getattr(settings, self.interval_setting) > 0:
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+        return new_process
+
+    @property
+    def background(self):
+        return self._thread is not None
+
+    def wake(self):
+        self._wake.set()
+
+    def flush(self):
+        raise NotImplementedError
+
+    def after_flush(self):
+        """Hook run by the flush thread after every flush attempt."""
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not flush %s at exit', type(self).__name__)
+
+    def _run(self):
+        while True:
+            self._wake.wait(getattr(settings, self.interval_setting))
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush %s', type(self).__name__)
+            finally:
+                # Connections are per thread; don't hold one between flushes.
+                connections.close_all()
+            self.after_flush()
@@ -0,0 +1,118 @@
+"""
+Process-wide pooling of raw database connections.
+
+Django keeps at most one connection per thread and, under ASGI, should not keep
+them between requests at all. With ``POOL`` set on a database entry, the
+backends in ``config.db`` hand closed connections back to a per-alias pool
+instead of closing them and take idle ones from it before opening new ones.
+
+    DATABASES['default']['POOL'] = {'max_idle': 10, 'max_lifetime': 600}
+
+``max_idle`` bounds the idle connections kept per process; connections older
+than ``max_lifetime`` seconds are closed rather than reused.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """LIFO stack of idle connections for one database alias."""
+
+    def __init__(self, max_idle=10, max_lifetime=600):
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # Connections inherited from the parent process must not be used or
+        # closed here; just forget about them.
+        if self._pid != os.getpid():
+            self._idle.clear()
+            self._pid = os.getpid()
+
+    def acquire(self):
+        """Return ``(connection, created_at)`` for an idle connection, or None."""
+        with self._lock:
+            self._check_fork()
+            while self._idle:
+                conn, created_at = self._idle.pop()
+                if time.monotonic() - created_at < self.max_lifetime:
+                    return conn, created_at
+                _close_quietly(conn)
+        return None
+
+    def release(self, conn, created_at):
+        """Return a connection to the pool, or close it if the pool is full."""
+        with self._lock:
+            self._check_fork()
+            if (len(self._idle) < self.max_idle
+                    and time.monotonic() - created_at < self.max_lifetime):
+                self._idle.append((conn, created_at))
+                return
+        _close_quietly(conn)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+    def __len__(self):
+        return len(self._idle)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def get_pool(alias, options):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(**options)
+        return pool
+
+
+class PooledConnectionMixin:
+    """DatabaseWrapper mixin that recycles connections through a ConnectionPool."""
+
+    _pool_created_at = None
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL')
+        return get_pool(self.alias, options) if options else None
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is not None:
+            pooled = pool.acquire()
+            if pooled is not None:
+                conn, self._pool_created_at = pooled
+                return conn
+            self._pool_created_at = time.monotonic()
+        return super().get_new_connection(conn_params)
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        if self.errors_occurred and not self.is_usable():
+            return super()._close()
+        try:
+            # Never hand out a connection with an open transaction.
+            self.connection.rollback()
+        except Exception:
+            return super()._close()
+        pool.release(self.connection, self._pool_created_at)
@@ -0,0 +1,8 @@
+"""PostgreSQL backend whose connections are recycled through ``config.db.pool``."""
+
+from django.db.backends.postgresql import base
+from ..pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    pass
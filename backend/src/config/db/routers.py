@@ -0,0 +1,103 @@
+"""
+Primary/replica database routing.
+
+Writes, migrations and anything outside a replica-read block go to
+``default``. Inside ``replica_reads()`` reads are spread over
+``settings.DATABASE_REPLICAS``. Views opt in with ``ReplicaReadsMixin``; users
+are pinned to the primary for ``REPLICA_PIN_SECONDS`` after a write (see
+``ReadYourWritesMiddleware``) so replication lag never hides their own changes.
+
+The pin is a signed, timestamped cookie rather than server state, so it holds
+whichever worker process serves the next request.
+"""
+
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+PIN_COOKIE = 'db_pin'
+_PIN_SALT = 'config.db.routers.pin'
+
+
+def pin_to_primary(response, user):
+    """Send ``user``'s next reads to the primary for a few seconds."""
+    if settings.DATABASE_REPLICAS and settings.REPLICA_PIN_SECONDS > 0:
+        response.set_signed_cookie(
+            PIN_COOKIE,
+            str(user.pk),
+            salt=_PIN_SALT,
+            max_age=settings.REPLICA_PIN_SECONDS,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax',
+        )
+
+
+def is_pinned(request, user):
+    """Whether ``request`` carries an unexpired pin for ``user``."""
+    if not settings.DATABASE_REPLICAS:
+        return False
+    pinned = request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=_PIN_SALT, max_age=settings.REPLICA_PIN_SECONDS
+    )
+    return pinned == str(user.pk)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route reads in this block (and tasks spawned from it) to a replica."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads_for(request):
+    """``replica_reads()`` unless the request's user has written recently."""
+    user = request.user
+    return replica_reads(not (user.is_authenticated and is_pinned(request, user)))
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadsMixin:
+    """
+    Serve the safe (read-only) methods of a DRF view from a replica.
+
+    Authentication still reads from the primary; the switch happens once the
+    user is known, so a pinned user keeps reading from the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self._replica_reads = replica_reads_for(request)
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica_block = self.__dict__.pop('_replica_reads', None)
+        if replica_block is not None:
+            replica_block.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,47 @@
+"""
+SQLite backend tuned for concurrent readers and writers.
+
+Every new connection switches the database to WAL so readers no longer block
+behind a writer, relaxes ``synchronous`` to NORMAL (safe with WAL), waits on
+locks instead of failing with "database is locked", and enlarges the page
+cache and memory map. Transactions start with ``BEGIN IMMEDIATE`` so a write
+transaction takes the write lock up front; a deferred transaction that reads
+first and writes later can otherwise fail to upgrade its lock without ever
+waiting on the busy timeout.
+
+Individual pragmas can be overridden through ``OPTIONS['pragmas']``. With
+``POOL`` set, connections are recycled through ``config.db.pool``.
+"""
+
+from django.db.backends.sqlite3 import base
+from ..pool import PooledConnectionMixin
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,  # KiB, i.e. roughly 64 MB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class TunedDatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
+
+
+class DatabaseWrapper(PooledConnectionMixin, TunedDatabaseWrapper):
+    pass
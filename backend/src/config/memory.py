@@ -0,0 +1,216 @@
+"""
+Per-request memory accounting.
+
+When ``MEMORY_ACCOUNTING_ENABLED`` is set, views using
+:class:`MemoryAccountingMixin` record the peak traced allocation and the RSS
+change for each request together with the file size and operation. Requests
+above ``MEMORY_LOG_THRESHOLD`` are logged and every sample is folded into a
+histogram keyed by operation and file-size bucket, which makes it easy to see
+whether peak memory tracks file size or stays flat.
+
+tracemalloc tracks the whole process, so a sample is only exact when no other
+measured request ran alongside it. The default ``UvicornWorker`` serves
+requests concurrently (and a streamed response keeps its sample open until
+the last chunk is sent), so samples that overlapped another one are marked
+``overlapped``: they are counted, but kept out of the peak buckets and logged
+as approximate.
+"""
+
+import contextvars
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds: 64 KiB, 128 KiB, ... 4 GiB.
+BUCKETS = tuple(64 * 1024 * 2 ** i for i in range(17))
+
+_current_sample = contextvars.ContextVar('memory_sample', default=None)
+_in_flight = set()
+_lock = threading.Lock()
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Return the resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # Peak RSS is the best we can do without /proc; reported in KiB on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bucket_for(value):
+    for bound in BUCKETS:
+        if value <= bound:
+            return bound
+    return float('inf')
+
+
+class MemorySample:
+    """Memory used while handling one request."""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.file_size = None
+        self.started = time.perf_counter()
+        self.peak = 0
+        self.rss_delta = 0
+        with _lock:
+            # Resetting the peak spoils the samples already running, too.
+            self.overlapped = bool(_in_flight)
+            for other in _in_flight:
+                other.overlapped = True
+            _in_flight.add(self)
+            tracemalloc.reset_peak()
+            self.traced_base = tracemalloc.get_traced_memory()[0]
+        self.rss_base = current_rss()
+
+    def finish(self):
+        with _lock:
+            _in_flight.discard(self)
+            self.peak = max(tracemalloc.get_traced_memory()[1] - self.traced_base, 0)
+        self.rss_delta = current_rss() - self.rss_base
+        duration = time.perf_counter() - self.started
+        histogram.observe(self.operation, self.file_size, self.peak, self.rss_delta, self.overlapped)
+        if self.peak >= settings.MEMORY_LOG_THRESHOLD:
+            logger.warning(
+                'High memory %s request: peak=%d rss_delta=%d file_size=%s duration=%.3fs%s',
+                self.operation, self.peak, self.rss_delta, self.file_size, duration,
+                ' (approximate, overlapped other requests)' if self.overlapped else ''
+            )
+
+
+class MemoryHistogram:
+    """
+    Histogram of peak allocation per operation and file-size bucket.
+
+    Overlapped samples are only counted in ``overlapped``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def observe(self, operation, file_size, peak, rss_delta, overlapped=False):
+        size_bucket = bucket_for(file_size) if file_size is not None else None
+        with self._lock:
+            series = self._series.setdefault((operation, size_bucket), {
+                'count': 0,
+                'overlapped': 0,
+                'peak_sum': 0,
+                'peak_max': 0,
+                'rss_delta_max': 0,
+                'buckets': [0] * (len(BUCKETS) + 1),
+            })
+            if overlapped:
+                series['overlapped'] += 1
+                return
+            series['count'] += 1
+            series['peak_sum'] += peak
+            series['peak_max'] = max(series['peak_max'], peak)
+            series['rss_delta_max'] = max(series['rss_delta_max'], rss_delta)
+            index = next((i for i, b in enumerate(BUCKETS) if peak <= b), len(BUCKETS))
+            series['buckets'][index] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {
+                    'operation': operation,
+                    'file_size_bucket': 'inf' if size_bucket == float('inf') else size_bucket,
+                    'count': s['count'],
+                    'overlapped': s['overlapped'],
+                    'peak_sum': s['peak_sum'],
+                    'peak_max': s['peak_max'],
+                    'rss_delta_max': s['rss_delta_max'],
+                    'buckets': dict(zip([*BUCKETS, 'inf'], s['buckets'])),
+                }
+                for (operation, size_bucket), s in sorted(
+                    self._series.items(), key=lambda item: (item[0][0], item[0][1] or 0)
+                )
+            ]
+
+    def prometheus(self):
+        """Render the histogram in the Prometheus text exposition format."""
+        lines = [
+            '# HELP request_peak_memory_bytes Peak traced allocation per request.',
+            '# TYPE request_peak_memory_bytes histogram',
+        ]
+        for series in self.snapshot():
+            size = series['file_size_bucket']
+            labels = f'operation="{series["operation"]}",file_size_le="{size if size is not None else "unknown"}"'
+            cumulative = 0
+            for bound, count in series['buckets'].items():
+                cumulative += count
+                le = '+Inf' if bound == 'inf' else bound
+                lines.append(f'request_peak_memory_bytes_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'request_peak_memory_bytes_sum{{{labels}}} {series["peak_sum"]}')
+            lines.append(f'request_peak_memory_bytes_count{{{labels}}} {series["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+histogram = MemoryHistogram()
+
+
+def set_file_size(size):
+    """Record the size of the file handled by the current request."""
+    sample = _current_sample.get()
+    if sample is not None:
+        sample.file_size = size
+
+
+class MemoryAccountingMixin:
+    """
+    Record memory usage of the views' requests.
+
+    Streaming responses are measured until their content has been consumed.
+    """
+    memory_operations = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        operation = self.memory_operations.get(request.method)
+        if not settings.MEMORY_ACCOUNTING_ENABLED or operation is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        sample = MemorySample(operation)
+        try:
+            sample.file_size = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            pass
+        token = _current_sample.set(sample)
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            sample.finish()
+            raise
+        finally:
+            _current_sample.reset(token)
+
+        if getattr(response, 'streaming', False):
+            response.streaming_content = self._measure_stream(
+                response.streaming_content, sample
+            )
+        else:
+            sample.finish()
+        return response
+
+    @staticmethod
+    def _measure_stream(content, sample):
+        try:
+            yield from content
+        finally:
+            sample.finish()
@@ -1,14 +1,65 @@
+"""
+Project middleware.
+
+Each class here runs natively in the mode of the handler below it: under
+ASGI the chain stays async all the way to the async views, so a long poll or
+a slow download parks a coroutine instead of holding a thread. Work that may
+touch the database (the lazy session user) hops to a thread for just that
+step.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.core.cache import cache
 from django.http import HttpResponse
 import time
 from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+from . import profiling, tracing
+from .db import routers
 
 
-class RateLimitMiddleware:
-    """Rate limiting middleware to protect sensitive endpoints."""
+class HybridMiddleware:
+    """Base for middleware with a sync ``handle`` and an async ``ahandle``."""
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.ahandle(request)
+        return self.handle(request)
+
+
+class WhiteNoiseMiddleware(HybridMiddleware, BaseWhiteNoiseMiddleware):
+    """WhiteNoise, which is sync-only, with an async path for other requests."""
+    
+    def __init__(self, get_response):
+        BaseWhiteNoiseMiddleware.__init__(self, get_response)
+        HybridMiddleware.__init__(self, get_response)
+    
+    def handle(self, request):
+        return BaseWhiteNoiseMiddleware.__call__(self, request)
+    
+    async def ahandle(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class RateLimitMiddleware(HybridMiddleware):
+    """Rate limiting middleware to protect sensitive endpoints."""
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
         # Rate limits: requests per minute
         self.limits = {
             'auth': 5,  # Login/register attempts
@@ -17,16 +68,19 @@ class RateLimitMiddleware:
             'default': 60,  # Other endpoints
         }
     
-    def __call__(self, request):
-        if not self._should_rate_limit(request):
-            return self.get_response(request)
-            
-        limit_key = self._get_limit_key(request)
-        if self._is_rate_limited(request, limit_key):
+    def handle(self, request):
+        if self._should_rate_limit(request) and self._is_rate_limited(request, self._get_limit_key(request)):
             return HttpResponse('Rate limit exceeded', status=429)
-            
         return self.get_response(request)
     
+    async def ahandle(self, request):
+        # The session user is loaded lazily from the database.
+        if self._should_rate_limit(request) and await sync_to_async(self._is_rate_limited)(
+            request, self._get_limit_key(request)
+        ):
+            return HttpResponse('Rate limit exceeded', status=429)
+        return await self.get_response(request)
+    
     def _should_rate_limit(self, request):
         """Determine if the request should be rate limited."""
         # Don't rate limit in debug mode
@@ -81,4 +135,98 @@ class RateLimitMiddleware:
         else:
             cache.incr(cache_key)
             
-        return False 
\ No newline at end of file
+        return False 
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+    Profile sampled or explicitly requested requests, one at a time. Under
+    ASGI the cProfile dump covers the event loop thread: it includes whatever
+    else the loop ran meanwhile, while work handed to ``sync_to_async``
+    threads only shows as the time spent awaiting it. The dump is written
+    from a thread.
+    """
+    
+    def handle(self, request):
+        reason = profiling.should_profile(request)
+        if reason is None:
+            return self.get_response(request)
+            
+        with profiling.profile_request(request, reason) as session:
+            response = self.get_response(request)
+        if session is None:
+            return response
+            
+        session.status_code = response.status_code
+        profiling.dump_store().save(session)
+        response['X-Profile-Id'] = session.name
+        return response
+    
+    async def ahandle(self, request):
+        reason = profiling.should_profile(request)
+        if reason is None:
+            return await self.get_response(request)
+            
+        with profiling.profile_request(request, reason) as session:
+            response = await self.get_response(request)
+        if session is None:
+            return response
+            
+        session.status_code = response.status_code
+        await sync_to_async(profiling.dump_store().save, thread_sensitive=False)(session)
+        response['X-Profile-Id'] = session.name
+        return response
+
+
+class TracingMiddleware(HybridMiddleware):
+    """Give each request a trace ID and a root span."""
+    
+    def handle(self, request):
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+            
+        with tracing.start_trace(request.META.get(tracing.TRACE_HEADER)) as trace:
+            with tracing.span('request', method=request.method, path=request.path) as root:
+                response = self.get_response(request)
+                root.set('status_code', response.status_code)
+                
+        response['X-Trace-Id'] = trace.trace_id
+        return response
+    
+    async def ahandle(self, request):
+        if not settings.TRACING_ENABLED:
+            return await self.get_response(request)
+            
+        with tracing.start_trace(request.META.get(tracing.TRACE_HEADER)) as trace:
+            with tracing.span('request', method=request.method, path=request.path) as root:
+                response = await self.get_response(request)
+                root.set('status_code', response.status_code)
+                
+        response['X-Trace-Id'] = trace.trace_id
+        return response
+
+
+class ReadYourWritesMiddleware(HybridMiddleware):
+    """Pin users to the primary database right after they change something."""
+    
+    def handle(self, request):
+        response = self.get_response(request)
+        if self._is_write(request, response):
+            self._pin(request, response)
+        return response
+    
+    async def ahandle(self, request):
+        response = await self.get_response(request)
+        if self._is_write(request, response):
+            # The session user is loaded lazily from the database.
+            await sync_to_async(self._pin)(request, response)
+        return response
+    
+    def _is_write(self, request, response):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400
+    
+    def _pin(self, request, response):
+        # DRF views replace request.user with the token-authenticated user.
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            routers.pin_to_primary(response, user)
@@ -0,0 +1,186 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it is picked by ``PROFILING_SAMPLE_RATE`` or when it
+carries an ``X-Profile-Token`` header matching ``PROFILING_TOKEN``. Profiled
+requests capture a cProfile dump plus a breakdown of the time spent in SQL,
+storage I/O and crypto. Dumps are kept in a bounded on-disk ring buffer.
+
+cProfile hooks are per interpreter (3.12+) or per thread and cannot be
+nested, so only one request per process is profiled at a time; requests
+picked meanwhile are served unprofiled.
+"""
+
+import contextvars
+import cProfile
+import json
+import os
+import random
+import re
+import secrets
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+PROFILE_HEADER = 'HTTP_X_PROFILE_TOKEN'
+SECTIONS = ('sql', 'storage', 'crypto')
+
+_DUMP_NAME_RE = re.compile(r'^[0-9]{20}-[0-9a-f]{32}$')
+_current_session = contextvars.ContextVar('profiling_session', default=None)
+_active = threading.Lock()
+
+
+class ProfileSession:
+    """Timing data collected for a single profiled request."""
+
+    def __init__(self, request, reason):
+        self.id = uuid.uuid4().hex
+        self.reason = reason
+        self.method = request.method
+        self.path = request.path
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.status_code = None
+        self.sections = {name: 0.0 for name in SECTIONS}
+        self.counts = {name: 0 for name in SECTIONS}
+        self.profiler = cProfile.Profile()
+
+    @property
+    def name(self):
+        stamp = time.strftime('%Y%m%d%H%M%S', time.gmtime(self.started_at))
+        micros = int(self.started_at % 1 * 1_000_000)
+        return f'{stamp}{micros:06d}-{self.id}'
+
+    def add(self, section, seconds):
+        self.sections[section] += seconds
+        self.counts[section] += 1
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'reason': self.reason,
+            'method': self.method,
+            'path': self.path,
+            'status_code': self.status_code,
+            'started_at': self.started_at,
+            'duration': self.duration,
+            'sections': self.sections,
+            'counts': self.counts,
+        }
+
+
+@contextmanager
+def section(name):
+    """Attribute the time spent in the block to a breakdown section."""
+    session = _current_session.get()
+    if session is None or name not in session.sections:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        session.add(name, time.perf_counter() - start)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    with section('sql'):
+        return execute(sql, params, many, context)
+
+
+def should_profile(request):
+    """Return the reason a request should be profiled, or None."""
+    token = settings.PROFILING_TOKEN
+    supplied = request.META.get(PROFILE_HEADER)
+    if token and supplied and secrets.compare_digest(supplied.encode(), token.encode()):
+        return 'header'
+    rate = settings.PROFILING_SAMPLE_RATE
+    if rate > 0 and random.random() < rate:
+        return 'sampled'
+    return None
+
+
+@contextmanager
+def profile_request(request, reason):
+    """
+    Profile the enclosed request handling; yields the ``ProfileSession``, or
+    None if another request is being profiled. The caller saves the session
+    with ``dump_store().save()``.
+    """
+    if not _active.acquire(blocking=False):
+        yield None
+        return
+    session = ProfileSession(request, reason)
+    token = _current_session.set(session)
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(_sql_wrapper))
+            session.profiler.enable()
+            try:
+                yield session
+            finally:
+                session.profiler.disable()
+    finally:
+        _current_session.reset(token)
+        session.duration = time.perf_counter() - start
+        _active.release()
+
+
+class DumpStore:
+    """Fixed-size ring buffer of profile dumps on disk."""
+
+    def __init__(self, directory, max_dumps):
+        self.directory = Path(directory)
+        self.max_dumps = max_dumps
+
+    def save(self, session):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        base = self.directory / session.name
+        session.profiler.dump_stats(f'{base}.prof')
+        with open(f'{base}.json', 'w') as fh:
+            json.dump(session.summary(), fh)
+        self._trim()
+
+    def _names(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (p.stem for p in self.directory.glob('*.json') if _DUMP_NAME_RE.match(p.stem)),
+            reverse=True
+        )
+
+    def _trim(self):
+        for name in self._names()[self.max_dumps:]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(self.directory / f'{name}{suffix}')
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        dumps = []
+        for name in self._names():
+            try:
+                with open(self.directory / f'{name}.json') as fh:
+                    dumps.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+        return dumps
+
+    def path(self, name):
+        """Return the path of a stored cProfile dump, or None."""
+        if not _DUMP_NAME_RE.match(name):
+            return None
+        path = self.directory / f'{name}.prof'
+        return path if path.is_file() else None
+
+
+def dump_store():
+    return DumpStore(settings.PROFILING_DUMP_DIR, settings.PROFILING_MAX_DUMPS)
@@ -46,16 +46,22 @@ INSTALLED_APPS = [
     # Local apps
     'accounts',
     'files',
+    'jobs',
+    'audit',
+    'analytics',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'config.middleware.TracingMiddleware',
+    'config.middleware.ProfilingMiddleware',
+    'config.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.middleware.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'config.middleware.RateLimitMiddleware',
@@ -82,13 +88,51 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': dj_database_url.config(
-        default='sqlite:///db.sqlite3',
-        conn_max_age=600
+# Connection pooling: idle connections kept per process and alias (0 disables).
+# Pooled connections are handed back at the end of every request, so Django's
+# own persistent connections are turned off when pooling is on.
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '0'))
+DATABASE_POOL_MAX_LIFETIME = int(os.getenv('DATABASE_POOL_MAX_LIFETIME', '600'))
+
+_DATABASE_ENGINES = {
+    # WAL, busy timeout and IMMEDIATE write transactions (see config/db/sqlite3)
+    'django.db.backends.sqlite3': 'config.db.sqlite3',
+    'django.db.backends.postgresql': 'config.db.postgresql',
+}
+
+
+def _database(url):
+    database = dj_database_url.parse(
+        url,
+        conn_max_age=0 if DATABASE_POOL_SIZE else 600
     )
+    database['ENGINE'] = _DATABASE_ENGINES.get(database['ENGINE'], database['ENGINE'])
+    if DATABASE_POOL_SIZE:
+        database['POOL'] = {
+            'max_idle': DATABASE_POOL_SIZE,
+            'max_lifetime': DATABASE_POOL_MAX_LIFETIME,
+        }
+    return database
+
+
+DATABASES = {
+    'default': _database(os.getenv('DATABASE_URL') or 'sqlite:///db.sqlite3')
 }
 
+# Read replicas: comma-separated database URLs. List and download views read
+# from them (see config/db/routers.py); a user who just wrote something reads
+# from the primary for REPLICA_PIN_SECONDS so they see their own writes
+# (marked by a signed cookie, which every worker process can check).
+DATABASE_REPLICAS = []
+for _index, _url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(','))):
+    _alias = f'replica_{_index}'
+    DATABASES[_alias] = _database(_url.strip())
+    DATABASES[_alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['config.db.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -117,7 +161,17 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STORAGES = {
+    # Encrypted blobs in sharded directories, spread over BLOB_VOLUMES
+    # (see files/storage.py), or `files.s3.S3Storage` for an S3-compatible
+    # object store (see the S3_* settings)
+    'default': {
+        'BACKEND': os.getenv('BLOB_STORAGE_BACKEND', 'files.storage.VolumeStorage'),
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # Media files
 MEDIA_URL = 'media/'
@@ -184,6 +238,7 @@ CORS_ALLOW_HEADERS = [
 
 # Security settings
 SECURE_SSL_REDIRECT = not DEBUG
+SECURE_REDIRECT_EXEMPT = [r'^api/health/']  # Container health checks use plain HTTP
 SESSION_COOKIE_SECURE = not DEBUG
 CSRF_COOKIE_SECURE = not DEBUG
 SECURE_BROWSER_XSS_FILTER = True
@@ -217,6 +272,147 @@ CACHES = {
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Request profiling
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_DUMP_DIR = Path(os.getenv('PROFILING_DUMP_DIR', BASE_DIR / 'profiles'))
+PROFILING_MAX_DUMPS = int(os.getenv('PROFILING_MAX_DUMPS', '50'))
+
+# Request tracing. The JSON-lines exporter buffers spans in memory and appends
+# them to TRACING_EXPORT_PATH every TRACING_FLUSH_INTERVAL seconds (0: only at
+# exit); at most TRACING_BUFFER_SIZE spans are buffered, further ones dropped.
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', '1').lower() in ['true', 't', '1']
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'config.tracing.JSONLinesExporter')
+TRACING_EXPORT_PATH = os.getenv('TRACING_EXPORT_PATH', str(BASE_DIR / 'traces' / 'spans.jsonl'))
+TRACING_MAX_BYTES = int(os.getenv('TRACING_MAX_BYTES', str(64 * 1024 * 1024)))
+TRACING_FLUSH_INTERVAL = float(os.getenv('TRACING_FLUSH_INTERVAL', '2'))
+TRACING_BUFFER_SIZE = int(os.getenv('TRACING_BUFFER_SIZE', '10000'))
+
+# Per-request memory accounting
+MEMORY_ACCOUNTING_ENABLED = os.getenv('MEMORY_ACCOUNTING_ENABLED', '0').lower() in ['true', 't', '1']
+MEMORY_LOG_THRESHOLD = int(os.getenv('MEMORY_LOG_THRESHOLD', str(64 * 1024 * 1024)))
+
+# Background jobs (see jobs/queue.py; workers run `manage.py run_jobs`)
+JOBS_CONCURRENCY = int(os.getenv('JOBS_CONCURRENCY', '4'))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '1'))
+JOBS_DEFAULT_TIMEOUT = int(os.getenv('JOBS_DEFAULT_TIMEOUT', '300'))
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', '30'))
+JOBS_ENCRYPT_CONCURRENCY = int(os.getenv('JOBS_ENCRYPT_CONCURRENCY', '2'))
+
+# Uploads encrypted in the background are staged here until their job runs.
+# Clients ask for it with `Prefer: respond-async`; uploads of at least
+# ASYNC_UPLOAD_MIN_SIZE bytes always go through a job (0 disables that).
+UPLOAD_STAGING_DIR = Path(os.getenv('UPLOAD_STAGING_DIR', BASE_DIR / 'staging'))
+ASYNC_UPLOAD_MIN_SIZE = int(os.getenv('ASYNC_UPLOAD_MIN_SIZE', '0'))
+
+# Image thumbnails (see files/previews.py): at most PREVIEW_MAX_DIMENSION
+# pixels on either side, JPEG at PREVIEW_QUALITY, cacheable by the browser
+# for PREVIEW_CACHE_SECONDS.
+PREVIEW_MAX_DIMENSION = int(os.getenv('PREVIEW_MAX_DIMENSION', '320'))
+PREVIEW_QUALITY = int(os.getenv('PREVIEW_QUALITY', '80'))
+PREVIEW_CACHE_SECONDS = int(os.getenv('PREVIEW_CACHE_SECONDS', '86400'))
+
+# File versions are stored as content-defined chunks (see files/chunking.py)
+# between CHUNK_MIN_SIZE and CHUNK_MAX_SIZE bytes, CHUNK_AVG_SIZE (a power
+# of two) on average. Changing these stops new versions sharing chunks with
+# old ones. Old versions are pruned by `manage.py gc_storage` unless among a
+# file's VERSION_KEEP_LAST newest or younger than VERSION_KEEP_DAYS days;
+# unreferenced chunks are kept for CHUNK_GC_GRACE_SECONDS so that uploads
+# in progress can still commit them.
+CHUNK_MIN_SIZE = int(os.getenv('CHUNK_MIN_SIZE', str(256 * 1024)))
+CHUNK_AVG_SIZE = int(os.getenv('CHUNK_AVG_SIZE', str(1024 * 1024)))
+CHUNK_MAX_SIZE = int(os.getenv('CHUNK_MAX_SIZE', str(4 * 1024 * 1024)))
+VERSION_KEEP_LAST = int(os.getenv('VERSION_KEEP_LAST', '10'))
+VERSION_KEEP_DAYS = int(os.getenv('VERSION_KEEP_DAYS', '30'))
+CHUNK_GC_GRACE_SECONDS = int(os.getenv('CHUNK_GC_GRACE_SECONDS', '86400'))
+
+# Admin changelists of large tables (see config/admin.py) count at most
+# ADMIN_COUNT_LIMIT rows and show PostgreSQL's estimate for bigger tables.
+ADMIN_COUNT_LIMIT = int(os.getenv('ADMIN_COUNT_LIMIT', '100000'))
+
+# Bulk endpoints (see files/bulk.py) act on at most BULK_MAX_ITEMS files or
+# links per request.
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '5000'))
+
+# Change feeds (see files/changes.py) serve up to CHANGE_FEED_PAGE_SIZE
+# changes per request, each once it is CHANGE_FEED_SETTLE_SECONDS old, and
+# keep changes for CHANGE_FEED_RETENTION_DAYS days. A long poll waits at most
+# CHANGE_FEED_MAX_WAIT_SECONDS, checking every CHANGE_FEED_POLL_SECONDS.
+CHANGE_FEED_PAGE_SIZE = int(os.getenv('CHANGE_FEED_PAGE_SIZE', '500'))
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv('CHANGE_FEED_SETTLE_SECONDS', '1'))
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', '30'))
+CHANGE_FEED_MAX_WAIT_SECONDS = int(os.getenv('CHANGE_FEED_MAX_WAIT_SECONDS', '30'))
+CHANGE_FEED_POLL_SECONDS = float(os.getenv('CHANGE_FEED_POLL_SECONDS', '1'))
+
+# Bytes each user may store unless their storage_quota says otherwise
+# (0: unlimited). Uploads over quota get 413, before the body is read when
+# Content-Length tells. `manage.py reconcile_quotas` recounts usage.
+STORAGE_QUOTA_DEFAULT = int(os.getenv('STORAGE_QUOTA_DEFAULT', str(10 * 1024 ** 3)))
+
+# Blob volumes: comma-separated `name=path[:weight]` entries, e.g.
+# `default=/app/media:1,disk2=/mnt/disk2:2`. New blobs are placed by weight
+# times free space; a weight of 0 drains a volume. `default` is MEDIA_ROOT
+# (its path is ignored) and only takes new blobs when listed or when no other
+# volume is configured. Run `manage.py rebalance_volumes` after adding one.
+BLOB_VOLUMES = {}
+for _spec in filter(None, os.getenv('BLOB_VOLUMES', '').split(',')):
+    _name, _, _location = _spec.strip().partition('=')
+    _path, _, _weight = _location.rpartition(':') if ':' in _location else (_location, '', '')
+    BLOB_VOLUMES[_name] = {'path': _path, 'weight': float(_weight or 1)}
+BLOB_VOLUME_MIN_FREE = int(os.getenv('BLOB_VOLUME_MIN_FREE', str(1024 * 1024 * 1024)))
+# Old copies of moved blobs are deleted this long after the move
+BLOB_MOVE_GRACE_SECONDS = int(os.getenv('BLOB_MOVE_GRACE_SECONDS', '300'))
+
+# Audit log of downloads and sharing, written behind the request in batches
+# of AUDIT_FLUSH_SIZE at least every AUDIT_FLUSH_INTERVAL seconds (0: only at
+# exit). At most AUDIT_BUFFER_SIZE events are buffered; when full, requests
+# wait up to AUDIT_BLOCK_SECONDS for room before the event is dropped.
+AUDIT_FLUSH_SIZE = int(os.getenv('AUDIT_FLUSH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '2'))
+AUDIT_BUFFER_SIZE = int(os.getenv('AUDIT_BUFFER_SIZE', '10000'))
+AUDIT_BLOCK_SECONDS = float(os.getenv('AUDIT_BLOCK_SECONDS', '0.05'))
+
+# Hot/cold tiering (`manage.py tier_blobs`, daily). TIER_COLD_VOLUME names
+# the BLOB_VOLUMES entry for cold blobs; new uploads never go there. Files
+# matching any TIER_COLD_RULES entry `days:max_accesses` (not read for `days`
+# days and read at most `max_accesses` times) are moved to it, and reading a
+# cold file moves it back.
+TIER_COLD_VOLUME = os.getenv('TIER_COLD_VOLUME', '')
+TIER_COLD_RULES = [
+    tuple(int(part) for part in rule.split(':'))
+    for rule in filter(None, os.getenv('TIER_COLD_RULES', '7:0,30:3').split(','))
+]
+# Download statistics are buffered per process and written every
+# ACCESS_FLUSH_INTERVAL seconds (0: only at exit), for at most
+# ACCESS_BUFFER_SIZE distinct files per interval.
+ACCESS_FLUSH_INTERVAL = float(os.getenv('ACCESS_FLUSH_INTERVAL', '10'))
+ACCESS_BUFFER_SIZE = int(os.getenv('ACCESS_BUFFER_SIZE', '10000'))
+
+# Usage rollups (per user per day, per file per hour) are summed per process
+# and added to the tables every ROLLUP_FLUSH_INTERVAL seconds (0: only at
+# exit). `manage.py rebuild_rollups` recomputes them from scratch.
+ROLLUP_FLUSH_INTERVAL = float(os.getenv('ROLLUP_FLUSH_INTERVAL', '5'))
+
+# S3-compatible object storage (BLOB_STORAGE_BACKEND=files.s3.S3Storage).
+# Uploads stream into multipart uploads of S3_PART_SIZE bytes (at least
+# 5 MiB) with at most S3_MAX_IN_FLIGHT_PARTS parts per upload in memory.
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', 'http://localhost:9000')
+S3_BUCKET = os.getenv('S3_BUCKET', 'secure-file')
+S3_REGION = os.getenv('S3_REGION', 'us-east-1')
+S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY', '')
+S3_PART_SIZE = int(os.getenv('S3_PART_SIZE', str(8 * 1024 * 1024)))
+S3_MAX_IN_FLIGHT_PARTS = int(os.getenv('S3_MAX_IN_FLIGHT_PARTS', '4'))
+# Idle keep-alive connections kept per process; also the upload thread count
+S3_POOL_SIZE = int(os.getenv('S3_POOL_SIZE', '10'))
+S3_TIMEOUT = float(os.getenv('S3_TIMEOUT', '60'))
+
+# Garbage collection of orphaned blobs and dead links (`manage.py gc_storage`)
+GC_BATCH_SIZE = int(os.getenv('GC_BATCH_SIZE', '500'))
+GC_GRACE_SECONDS = int(os.getenv('GC_GRACE_SECONDS', str(24 * 60 * 60)))
+GC_MAX_DELETES_PER_SECOND = float(os.getenv('GC_MAX_DELETES_PER_SECOND', '50'))
+GC_LINK_RETENTION_DAYS = int(os.getenv('GC_LINK_RETENTION_DAYS', '7'))
+
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -225,3 +421,7 @@ AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
     'guardian.backends.ObjectPermissionBackend',
 )
+
+# The custom user model has no username and requires a full name, so guardian
+# cannot create its anonymous user.
+ANONYMOUS_USER_NAME = None
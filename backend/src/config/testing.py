@@ -0,0 +1,93 @@
+"""Shared helpers for API tests."""
+
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+from analytics.rollups import usage
+from audit.buffer import audit_log
+from files.access import recorder
+
+
+async def _collect(chunks):
+    return b''.join([chunk async for chunk in chunks])
+
+
+class EndpointBudgetTestCase(TestCase):
+    """
+    Test case for pinning the SQL query count and wall time of endpoints.
+
+    Uploaded blobs go to a throwaway MEDIA_ROOT and spans to an in-memory
+    exporter, so the tests leave nothing behind. Read replicas are switched
+    off so every query is counted on the default connection, and download
+    statistics, audit events and usage rollups stay buffered until a test flushes them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._settings = override_settings(
+            MEDIA_ROOT=cls._media_root,
+            TRACING_EXPORTER='config.tracing.InMemoryExporter',
+            DATABASE_REPLICAS=[],
+            ACCESS_FLUSH_INTERVAL=0,
+            AUDIT_FLUSH_INTERVAL=0,
+            ROLLUP_FLUSH_INTERVAL=0,
+        )
+        cls._settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._settings.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+    def setUp(self):
+        # Rate limit counters live in the cache; start every test clean.
+        cache.clear()
+        # Write buffered events inside the test's transaction so they are
+        # rolled back with it.
+        self.addCleanup(recorder.flush)
+        self.addCleanup(audit_log.flush)
+        self.addCleanup(usage.flush)
+
+    def request(self, method, url, user=None, **kwargs):
+        """Issue a request over HTTPS, authenticated as ``user`` if given."""
+        if user is not None:
+            kwargs['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(user)}'
+        response = getattr(self.client, method.lower())(url, secure=True, **kwargs)
+        if getattr(response, 'streaming', False):
+            if response.is_async:
+                response.content_bytes = async_to_sync(_collect)(response.streaming_content)
+            else:
+                response.content_bytes = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    @contextmanager
+    def assertWithinBudget(self, label, max_queries, max_seconds):
+        """Fail if the block runs more than ``max_queries`` or takes too long."""
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+
+        problems = []
+        if len(captured) > max_queries:
+            problems.append(f'{len(captured)} queries (budget {max_queries})')
+        if elapsed > max_seconds:
+            problems.append(f'{elapsed:.3f}s (budget {max_seconds:.3f}s)')
+        if problems:
+            queries = '\n'.join(
+                f'  {i}. {query["sql"]}'
+                for i, query in enumerate(captured.captured_queries, 1)
+            )
+            self.fail(f'{label} exceeded its budget: {", ".join(problems)}\n{queries}')
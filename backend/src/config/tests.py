@@ -0,0 +1,412 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+from . import profiling, tracing, warmup
+from .db import routers
+from .db.pool import ConnectionPool
+from .testing import EndpointBudgetTestCase
+
+User = get_user_model()
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.connections = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+            'pooled': {
+                'ENGINE': 'config.db.sqlite3',
+                'NAME': os.path.join(directory.name, 'pool.sqlite3'),
+                'POOL': {'max_idle': 1, 'max_lifetime': 60},
+            },
+        })
+        self.addCleanup(lambda: self.connections['pooled'].pool.clear())
+
+    def test_closed_connection_is_reused(self):
+        wrapper = self.connections['pooled']
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertEqual(len(wrapper.pool), 1)
+
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+        self.assertEqual(len(wrapper.pool), 0)
+        wrapper.close()
+
+    def test_open_transaction_is_rolled_back(self):
+        wrapper = self.connections['pooled']
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        wrapper.close()
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            self.assertEqual(cursor.fetchone(), (0,))
+        wrapper.close()
+
+    def test_idle_connections_are_bounded(self):
+        pool = ConnectionPool(max_idle=1, max_lifetime=60)
+        first, second = mock.Mock(), mock.Mock()
+        pool.release(first, created_at=float('inf'))
+        pool.release(second, created_at=float('inf'))
+        self.assertEqual(len(pool), 1)
+        second.close.assert_called_once_with()
+
+    def test_expired_connections_are_closed(self):
+        pool = ConnectionPool(max_idle=2, max_lifetime=60)
+        conn = mock.Mock()
+        pool._idle.append((conn, float('-inf')))
+        self.assertIsNone(pool.acquire())
+        conn.close.assert_called_once_with()
+
+
+class PrimaryReplicaRouterTests(EndpointBudgetTestCase):
+    """
+    Routing decisions for list views. The "replica" is the default database
+    itself, so only the router's choice is observed, not the data.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader@example.com', 'router-test-password', full_name='Reader')
+
+    def setUp(self):
+        super().setUp()
+        self.settings = override_settings(DATABASE_REPLICAS=['default'], REPLICA_PIN_SECONDS=5)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        patcher = mock.patch.object(routers.random, 'choice', return_value='default')
+        self.choice = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_outside_views_use_primary(self):
+        self.assertEqual(routers.PrimaryReplicaRouter().db_for_read(User), 'default')
+        self.choice.assert_not_called()
+
+    def test_list_view_reads_from_replica(self):
+        response = self.request('GET', reverse('files:file-list'), self.user)
+        self.assertEqual(response.status_code, 200)
+        self.choice.assert_called()
+
+    def test_writes_pin_user_to_primary(self):
+        upload = SimpleUploadedFile('new.txt', b'x' * 1024, content_type='text/plain')
+        response = self.request(
+            'POST', reverse('files:file-list'), self.user,
+            data={'name': 'new.txt', 'file': upload}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        # Nothing is kept in the process: another worker sees the pin too.
+        cache.clear()
+        self.choice.reset_mock()
+        response = self.request('GET', reverse('files:file-list'), self.user)
+        self.assertEqual(response.status_code, 200)
+        self.choice.assert_not_called()
+
+    def test_pin_belongs_to_the_user_who_wrote(self):
+        self.request(
+            'POST', reverse('files:file-list'), self.user,
+            data={'name': 'new.txt', 'file': SimpleUploadedFile('new.txt', b'x', content_type='text/plain')}
+        )
+        other = User.objects.create_user('other-reader@example.com', 'router-test-password', full_name='Other')
+        self.choice.reset_mock()
+        self.request('GET', reverse('files:file-list'), other)
+        self.choice.assert_called()
+
+    def test_pin_expires(self):
+        self.request(
+            'POST', reverse('files:file-list'), self.user,
+            data={'name': 'new.txt', 'file': SimpleUploadedFile('new.txt', b'x', content_type='text/plain')}
+        )
+        self.choice.reset_mock()
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 60):
+            self.request('GET', reverse('files:file-list'), self.user)
+        self.choice.assert_called()
+
+
+class ProfilingTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('profiled@example.com', 'profiling-test-password', full_name='User')
+        cls.admin = User.objects.create_superuser('admin@example.com', 'profiling-test-password', full_name='Admin')
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            PROFILING_DUMP_DIR=directory.name, PROFILING_TOKEN='profile-me', PROFILING_SAMPLE_RATE=0
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def get(self, **headers):
+        response = self.request('GET', reverse('health-live'), **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_requests_are_not_profiled_by_default(self):
+        self.assertNotIn('X-Profile-Id', self.get())
+        self.assertEqual(profiling.dump_store().list(), [])
+
+    def test_token_header_profiles_the_request(self):
+        response = self.get(HTTP_X_PROFILE_TOKEN='profile-me')
+        [dump] = profiling.dump_store().list()
+        self.assertEqual(dump['name'], response['X-Profile-Id'])
+        self.assertEqual((dump['reason'], dump['path'], dump['status_code']), ('header', '/api/health/live/', 200))
+        self.assertIsNotNone(profiling.dump_store().path(dump['name']))
+
+    def test_wrong_tokens_are_ignored(self):
+        for token in ('wrong', 'pr\u00f6file-me'):
+            self.assertNotIn('X-Profile-Id', self.get(HTTP_X_PROFILE_TOKEN=token))
+        self.assertEqual(profiling.dump_store().list(), [])
+
+    def test_one_request_is_profiled_at_a_time(self):
+        with profiling.profile_request(mock.Mock(method='GET', path='/'), 'header') as session:
+            self.assertIsNotNone(session)
+            self.assertNotIn('X-Profile-Id', self.get(HTTP_X_PROFILE_TOKEN='profile-me'))
+        self.assertEqual(profiling.dump_store().list(), [])
+        self.assertIn('X-Profile-Id', self.get(HTTP_X_PROFILE_TOKEN='profile-me'))
+
+    async def test_async_dumps_are_saved_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        save = profiling.DumpStore.save
+        threads = []
+
+        def saved(store, session):
+            threads.append(threading.get_ident())
+            save(store, session)
+
+        with mock.patch.object(profiling.DumpStore, 'save', saved):
+            response = await self.async_client.get(
+                reverse('health-live'), secure=True, headers={'X-Profile-Token': 'profile-me'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Profile-Id', response)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+    def test_sampling(self):
+        with self.settings(PROFILING_SAMPLE_RATE=0.1):
+            with mock.patch.object(profiling.random, 'random', return_value=0.5):
+                self.assertNotIn('X-Profile-Id', self.get())
+            with mock.patch.object(profiling.random, 'random', return_value=0.05):
+                self.assertIn('X-Profile-Id', self.get())
+        self.assertEqual([dump['reason'] for dump in profiling.dump_store().list()], ['sampled'])
+
+    def test_ring_buffer_keeps_the_newest_dumps(self):
+        with self.settings(PROFILING_MAX_DUMPS=3):
+            for _ in range(5):
+                self.get(HTTP_X_PROFILE_TOKEN='profile-me')
+                time.sleep(0.001)
+        store = profiling.dump_store()
+        names = [dump['name'] for dump in store.list()]
+        self.assertEqual(len(names), 3)
+        self.assertEqual(names, sorted(names, reverse=True))
+        self.assertEqual(len(os.listdir(store.directory)), 6)
+
+    def test_dump_endpoints_are_for_admins(self):
+        name = self.get(HTTP_X_PROFILE_TOKEN='profile-me')['X-Profile-Id']
+        for url in (reverse('profile-list'), reverse('profile-download', args=[name])):
+            self.assertEqual(self.request('GET', url).status_code, 401)
+            self.assertEqual(self.request('GET', url, self.user).status_code, 403)
+
+        response = self.request('GET', reverse('profile-list'), self.admin)
+        self.assertEqual([dump['name'] for dump in response.json()], [name])
+        response = self.request('GET', reverse('profile-download', args=[name]), self.admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_bytes)
+        for bad in ('..settings', f'{"0" * 20}-{"0" * 32}'):
+            self.assertEqual(self.request('GET', reverse('profile-download', args=[bad]), self.admin).status_code, 404)
+
+
+@override_settings(TRACING_ENABLED=True)
+class TracingTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('traced@example.com', 'tracing-test-password', full_name='User')
+
+    def setUp(self):
+        super().setUp()
+        tracing.get_exporter().clear()
+
+    def spans(self, response):
+        """The names of a request's spans, each mapped to its parent's name."""
+        trace = [s for s in tracing.get_exporter().spans if s['trace_id'] == response['X-Trace-Id']]
+        names = {s['span_id']: s['name'] for s in trace}
+        return {(s['name'], names.get(s['parent_id'])) for s in trace}
+
+    def test_upload_and_download_spans(self):
+        response = self.request(
+            'POST', reverse('files:file-list'), self.user,
+            data={'name': 't.txt', 'file': SimpleUploadedFile('t.txt', b'traced', content_type='text/plain')}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertLessEqual({
+            ('request', None),
+            ('upload.parse', 'request'),
+            ('upload.encrypt', 'request'),
+            ('storage.write', 'request'),
+            ('crypto.encrypt', 'storage.write'),
+            ('upload.db_insert', 'request'),
+        }, self.spans(response))
+
+        file_id = response.json()['id']
+        for url in ('files:file-download', 'files:file-download-stream'):
+            response = self.request('GET', reverse(url, args=[file_id]), self.user)
+            self.assertEqual(response.content_bytes, b'traced')
+            self.assertLessEqual({
+                ('request', None),
+                ('crypto.unwrap_key', 'request'),
+                ('download.decrypt', 'request'),
+            }, self.spans(response))
+        self.assertIn(('download.lookup', 'request'), self.spans(
+            self.request('GET', reverse('files:file-download', args=[file_id]), self.user)
+        ))
+
+    def test_streamed_content_is_traced_until_it_is_consumed(self):
+        upload = SimpleUploadedFile('s.bin', b's' * 300 * 1024)
+        file_id = self.request(
+            'POST', reverse('files:file-list'), self.user, data={'name': 's.bin', 'file': upload}
+        ).json()['id']
+        exporter = tracing.get_exporter()
+        exporter.clear()
+        response = self.client.get(
+            reverse('files:file-download', args=[file_id]), secure=True,
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}'
+        )
+        self.assertEqual(exporter.spans, [])
+        self.assertEqual(len(b''.join(response.streaming_content)), 300 * 1024)
+        response.close()
+        [decrypt] = [s for s in exporter.spans if s['name'] == 'download.decrypt']
+        [root] = [s for s in exporter.spans if s['name'] == 'request']
+        self.assertEqual(decrypt['parent_id'], root['span_id'])
+        self.assertEqual(decrypt['attributes']['size'], 300 * 1024)
+        self.assertGreater(decrypt['duration_ms'], 0)
+
+    def test_trace_id_header(self):
+        response = self.request('GET', reverse('health-live'), HTTP_X_TRACE_ID='client-trace-0001')
+        self.assertEqual(response['X-Trace-Id'], 'client-trace-0001')
+        response = self.request('GET', reverse('health-live'), HTTP_X_TRACE_ID='bad id!')
+        self.assertNotEqual(response['X-Trace-Id'], 'bad id!')
+        self.assertEqual(len(self.spans(response)), 1)
+
+    def test_disabled(self):
+        with self.settings(TRACING_ENABLED=False):
+            response = self.request('GET', reverse('health-live'))
+            self.assertEqual(tracing.get_exporter().spans, [])
+        self.assertNotIn('X-Trace-Id', response)
+
+
+class JSONLinesExporterTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'traces', 'spans.jsonl')
+        overrides = override_settings(
+            TRACING_EXPORT_PATH=self.path, TRACING_FLUSH_INTERVAL=0,
+            TRACING_BUFFER_SIZE=3, TRACING_MAX_BYTES=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.exporter = tracing.JSONLinesExporter()
+
+    def test_spans_are_written_by_flush(self):
+        self.exporter.export([{'name': 'a'}, {'name': 'b'}])
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.exporter.flush(), 2)
+        self.exporter.export([{'name': 'c'}])
+        self.exporter.flush()
+        with open(self.path) as fh:
+            self.assertEqual([line for line in fh], ['{"name": "a"}\n', '{"name": "b"}\n', '{"name": "c"}\n'])
+        self.assertEqual(self.exporter.flush(), 0)
+
+    def test_full_buffer_drops_spans(self):
+        self.exporter.export([{'name': 'a'}, {'name': 'b'}])
+        self.exporter.export([{'name': 'c'}, {'name': 'd'}])
+        self.assertEqual(self.exporter.dropped, 1)
+        self.assertEqual(self.exporter.flush(), 3)
+
+    def test_rotation(self):
+        self.exporter.max_bytes = 10
+        self.exporter.export([{'name': 'first'}])
+        self.exporter.flush()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+
+
+class HealthTests(EndpointBudgetTestCase):
+
+    def test_liveness(self):
+        response = self.request('GET', reverse('health-live'))
+        self.assertEqual((response.status_code, response.json()), (200, {'status': 'alive'}))
+
+    def test_readiness(self):
+        url = reverse('health-ready')
+        with mock.patch.object(warmup, '_ready', False):
+            response = self.request('GET', url)
+            self.assertEqual((response.status_code, response.json()), (503, {'status': 'starting'}))
+        with mock.patch.object(warmup, '_ready', True):
+            response = self.request('GET', url)
+            self.assertEqual((response.status_code, response.json()), (200, {'status': 'ready'}))
+            with mock.patch.object(connection, 'ensure_connection', side_effect=OperationalError):
+                response = self.request('GET', url)
+            self.assertEqual((response.status_code, response.json()), (503, {'status': 'database unavailable'}))
+
+
+class WarmUpTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(warmup, '_ready', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conn = mock.Mock()
+        patcher = mock.patch.object(warmup.connections, 'all', return_value=[self.conn])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_warm_up(self):
+        with mock.patch.object(warmup.connections, 'close_all') as close_all:
+            warmup.warm_up()
+        self.conn.ensure_connection.assert_called_once_with()
+        close_all.assert_called_once_with()
+        self.assertTrue(warmup.is_ready())
+
+    def test_unreachable_database_leaves_the_process_not_ready(self):
+        self.conn.ensure_connection.side_effect = OperationalError('connection refused')
+        with mock.patch.object(warmup.connections, 'close_all') as close_all:
+            with self.assertLogs('config.warmup', 'ERROR'):
+                warmup.warm_up()
+        close_all.assert_called_once_with()
+        self.assertFalse(warmup.is_ready())
+
+
+class MiddlewareModeTests(SimpleTestCase):
+
+    @override_settings(DEBUG=True)
+    def test_asgi_chain_is_not_adapted_to_sync(self):
+        # In debug mode Django logs every middleware it has to run in a thread.
+        with self.assertNoLogs('django.request', level='DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
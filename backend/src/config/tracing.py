@@ -0,0 +1,289 @@
+"""
+Lightweight request tracing.
+
+Every request gets a trace ID (taken from a well-formed ``X-Trace-Id`` header
+when the caller supplies one) and the stages we care about are wrapped in
+:func:`span`. Finished spans are collected on the request's trace and handed
+to the configured exporter in a single batch when the request completes, so
+the per-span cost is a couple of clock reads and a list append. The default
+exporter only buffers the batch; a background thread writes it out.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from . import profiling
+from .buffers import BackgroundFlusher
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = 'HTTP_X_TRACE_ID'
+_TRACE_ID_RE = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+_current_trace = contextvars.ContextVar('tracing_trace', default=None)
+
+
+class Span:
+    """A single timed stage within a trace."""
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'duration', 'attributes')
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.duration = 0.0
+        self.attributes = attributes
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def as_dict(self, trace_id):
+        return {
+            'trace_id': trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+        }
+
+
+class Trace:
+    """Spans recorded while handling one request."""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self._stack = []
+        self._open_streams = 0
+        self._finished = False
+
+    def export(self):
+        return [s.as_dict(self.trace_id) for s in self.spans]
+
+    def _finish(self):
+        """Hand the spans to the exporter once the request and its streams are done."""
+        if not self._finished or self._open_streams or not self.spans:
+            return
+        try:
+            get_exporter().export(self.export())
+        except Exception:
+            logger.exception('Failed to export trace %s', self.trace_id)
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a span of the current trace.
+
+    The first dotted component of ``name`` doubles as the profiling section,
+    so ``crypto.*`` and ``storage.*`` spans also feed request profiles.
+    """
+    with profiling.section(name.partition('.')[0]):
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+        parent = trace._stack[-1].span_id if trace._stack else None
+        current = Span(name, parent, attributes)
+        trace._stack.append(current)
+        start = time.perf_counter()
+        try:
+            yield current
+        except BaseException as exc:
+            current.attributes['error'] = type(exc).__name__
+            raise
+        finally:
+            current.duration = time.perf_counter() - start
+            trace._stack.pop()
+            trace.spans.append(current)
+
+
+@contextmanager
+def start_trace(trace_id=None):
+    """Make a new trace current for the enclosed block and export it after."""
+    if not trace_id or not _TRACE_ID_RE.match(trace_id):
+        trace_id = os.urandom(16).hex()
+    trace = Trace(trace_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace._finished = True
+        trace._finish()
+
+
+def traced_stream(name, chunks, **attributes):
+    """
+    Time producing the chunks of a streamed response as a span.
+
+    The content of a streamed response is produced after the view returned,
+    so the trace stays open until the stream is exhausted or closed. The span
+    covers only the time spent in ``chunks`` (not sending them), and spans
+    opened while a chunk is produced become its children.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return chunks
+    parent = trace._stack[-1].span_id if trace._stack else None
+    return _TracedStream(trace, Span(name, parent, attributes), chunks)
+
+
+class _TracedStream:
+
+    def __init__(self, trace, span, chunks):
+        self._trace = trace
+        self._span = span
+        self._chunks = iter(chunks)
+        self._done = False
+        trace._open_streams += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = _current_trace.set(self._trace)
+        self._trace._stack.append(self._span)
+        start = time.perf_counter()
+        ended = False
+        try:
+            return next(self._chunks)
+        except BaseException as exc:
+            if not isinstance(exc, StopIteration):
+                self._span.attributes['error'] = type(exc).__name__
+            ended = True
+            raise
+        finally:
+            self._span.duration += time.perf_counter() - start
+            self._trace._stack.pop()
+            _current_trace.reset(token)
+            if ended:
+                self._end()
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+        self._end()
+
+    def _end(self):
+        if self._done:
+            return
+        self._done = True
+        self._trace.spans.append(self._span)
+        self._trace._open_streams -= 1
+        self._trace._finish()
+
+
+class InMemoryExporter:
+    """Keep exported spans in a list; intended for tests."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def flush(self):
+        return 0
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+
+class JSONLinesExporter(BackgroundFlusher):
+    """
+    Append spans to a JSON-lines file, rotating it once it grows too big.
+
+    ``export`` only buffers the spans; they are encoded and written every
+    ``TRACING_FLUSH_INTERVAL`` seconds. At most ``TRACING_BUFFER_SIZE`` spans
+    wait in the buffer, further ones are counted in ``dropped``.
+    """
+    interval_setting = 'TRACING_FLUSH_INTERVAL'
+    thread_name = 'trace-exporter'
+
+    def __init__(self):
+        super().__init__()
+        self.path = settings.TRACING_EXPORT_PATH
+        self.max_bytes = settings.TRACING_MAX_BYTES
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._spans = []
+        self._reported_drops = 0
+        self.dropped = 0
+
+    def export(self, spans):
+        with self._lock:
+            if self._ensure_flusher():
+                self._spans = []
+            room = settings.TRACING_BUFFER_SIZE - len(self._spans)
+            if room < len(spans):
+                self.dropped += len(spans) - max(room, 0)
+                spans = spans[:max(room, 0)]
+            self._spans.extend(spans)
+
+    def after_flush(self):
+        if self.dropped > self._reported_drops:
+            logger.warning(
+                'Dropped %d spans because the buffer was full',
+                self.dropped - self._reported_drops
+            )
+            self._reported_drops = self.dropped
+
+    def flush(self):
+        """Write the buffered spans; returns how many were written."""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans:
+            return 0
+        payload = ''.join(json.dumps(s, default=str) + '\n' for s in spans)
+        with self._write_lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a') as fh:
+                fh.write(payload)
+                size = fh.tell()
+            if self.max_bytes and size >= self.max_bytes:
+                os.replace(self.path, f'{self.path}.1')
+        return len(spans)
+
+
+class NullExporter:
+    """Discard spans."""
+
+    def export(self, spans):
+        pass
+
+    def flush(self):
+        return 0
+
+
+@lru_cache(maxsize=None)
+def get_exporter():
+    return import_string(settings.TRACING_EXPORTER)()
+
+
+@receiver(setting_changed)
+def _reset_exporter(setting, **kwargs):
+    if setting.startswith('TRACING_'):
+        get_exporter.cache_clear()
@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenRefreshView
+from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,7 +27,20 @@ urlpatterns = [
     # API URLs
     path('api/auth/', include('accounts.urls')),
     path('api/files/', include('files.urls')),
+    path('api/jobs/', include('jobs.urls')),
+    path('api/audit/', include('audit.urls')),
+    path('api/analytics/', include('analytics.urls')),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    
+    # Health checks
+    path('api/health/live/', views.LivenessView.as_view(), name='health-live'),
+    path('api/health/ready/', views.ReadinessView.as_view(), name='health-ready'),
+    
+    # Diagnostics
+    path('api/profiles/', views.ProfileDumpListView.as_view(), name='profile-list'),
+    path('api/profiles/<str:name>/', views.ProfileDumpDownloadView.as_view(), name='profile-download'),
+    path('api/memory/', views.MemoryHistogramView.as_view(), name='memory-histogram'),
+    path('api/memory/metrics/', views.MemoryMetricsView.as_view(), name='memory-metrics'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,73 @@
+from django.db import connection
+from django.http import FileResponse, Http404, HttpResponse
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from . import memory, profiling, warmup
+
+
+class ProfileDumpListView(APIView):
+    """View for listing stored request profiles."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(profiling.dump_store().list())
+
+
+class ProfileDumpDownloadView(APIView):
+    """View for downloading a stored cProfile dump."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, name):
+        path = profiling.dump_store().path(name)
+        if path is None:
+            raise Http404
+        return FileResponse(
+            open(path, 'rb'),
+            content_type='application/octet-stream',
+            as_attachment=True,
+            filename=f'{name}.prof'
+        )
+
+
+class MemoryHistogramView(APIView):
+    """View for the per-request memory histogram."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(memory.histogram.snapshot())
+
+
+class MemoryMetricsView(APIView):
+    """View exposing the memory histogram in Prometheus text format."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            memory.histogram.prometheus(),
+            content_type='text/plain; version=0.0.4'
+        )
+
+
+class LivenessView(APIView):
+    """View reporting that the process is up."""
+    permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
+
+    def get(self, request):
+        return Response({'status': 'alive'})
+
+
+class ReadinessView(APIView):
+    """View reporting whether the process has warmed up and can serve traffic."""
+    permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
+
+    def get(self, request):
+        if not warmup.is_ready():
+            return Response({'status': 'starting'}, status=503)
+        try:
+            connection.ensure_connection()
+        except Exception:
+            return Response({'status': 'database unavailable'}, status=503)
+        return Response({'status': 'ready'})
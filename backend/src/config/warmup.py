@@ -0,0 +1,46 @@
+"""
+Process warm-up and readiness.
+
+``warm_up`` does the expensive one-off work of a fresh process: importing every
+view through the URL resolver (which derives the master key in
+``files.key_management``) and checking that the database answers. When the app
+is preloaded by gunicorn this runs once in the master and the workers inherit
+the result. The readiness endpoint reports 503 until it has finished; if the
+database cannot be reached at boot the error is logged and the process stays
+not ready instead of failing to start.
+"""
+
+import logging
+import time
+
+from django.db import OperationalError, connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+_ready = False
+
+
+def warm_up():
+    global _ready
+    start = time.perf_counter()
+
+    # Importing the URLconf pulls in every view, serializer and the key manager.
+    get_resolver().url_patterns
+
+    try:
+        for conn in connections.all():
+            conn.ensure_connection()
+    except OperationalError:
+        logger.exception('Warm-up could not reach the database')
+        return
+    finally:
+        # Never hand an open connection to forked workers.
+        connections.close_all()
+
+    _ready = True
+    logger.info('Warm-up finished in %.2fs', time.perf_counter() - start)
+
+
+def is_ready():
+    return _ready
@@ -0,0 +1,94 @@
+"""
+Per-file access statistics, recorded off the request path.
+
+Downloads call ``recorder.record(file_obj)``, which only touches an in-memory
+buffer. A daemon thread folds the buffer into ``EncryptedFile.access_count``
+and ``last_accessed_at`` every ``ACCESS_FLUSH_INTERVAL`` seconds, one UPDATE
+per batch of files, and queues the promotion of cold blobs that were read.
+At most ``ACCESS_BUFFER_SIZE`` distinct files are buffered between flushes;
+accesses to further files are counted in ``dropped`` and otherwise ignored.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+from config.buffers import BackgroundFlusher
+from jobs.queue import enqueue
+from .models import EncryptedFile
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+class AccessRecorder(BackgroundFlusher):
+    interval_setting = 'ACCESS_FLUSH_INTERVAL'
+    thread_name = 'access-recorder'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending = {}  # pk -> [count, last_accessed_at, cold]
+        self.dropped = 0
+
+    def record(self, file_obj):
+        now = timezone.now()
+        with self._lock:
+            if self._ensure_flusher():
+                self._pending = {}
+            entry = self._pending.get(file_obj.pk)
+            if entry is None:
+                if len(self._pending) >= settings.ACCESS_BUFFER_SIZE:
+                    self.dropped += 1
+                    self.wake()
+                    return
+                entry = self._pending[file_obj.pk] = [0, now, False]
+            entry[0] += 1
+            entry[1] = now
+            entry[2] = entry[2] or file_obj.tier == EncryptedFile.COLD
+
+    def flush(self):
+        """Write the buffered statistics; returns the number of files updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        start = 0
+        try:
+            for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                batch = items[start:start + FLUSH_BATCH_SIZE]
+                EncryptedFile.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                    access_count=F('access_count') + Case(
+                        *[When(pk=pk, then=Value(count)) for pk, (count, _, _) in batch],
+                        default=Value(0)
+                    ),
+                    last_accessed_at=Case(
+                        *[When(pk=pk, then=Value(last)) for pk, (_, last, _) in batch],
+                        output_field=DateTimeField()
+                    ),
+                )
+        except Exception:
+            # Keep what was not written for the next flush.
+            self._restore(items[start:])
+            raise
+
+        for pk, (_, _, cold) in items:
+            if cold:
+                enqueue('files.promote_blob', {'file_id': str(pk)})
+        return len(items)
+
+    def _restore(self, items):
+        with self._lock:
+            for pk, (count, last, cold) in items:
+                entry = self._pending.setdefault(pk, [0, last, False])
+                entry[0] += count
+                entry[1] = max(entry[1], last)
+                entry[2] = entry[2] or cold
+
+
+recorder = AccessRecorder()
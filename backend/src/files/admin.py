@@ -1,32 +1,46 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
+from config.admin import LargeTableAdminMixin
 from .models import EncryptedFile, FileShare, ShareableLink
 
 
 @admin.register(EncryptedFile)
-class EncryptedFileAdmin(admin.ModelAdmin):
+class EncryptedFileAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for EncryptedFile model."""
-    list_display = ('name', 'owner', 'mime_type', 'size', 'created_at')
-    list_filter = ('mime_type', 'created_at')
-    search_fields = ('name', 'owner__username', 'owner__email')
+    list_display = ('name', 'owner', 'mime_type', 'size', 'status', 'tier', 'created_at')
+    list_select_related = ('owner',)
+    list_filter = ('status', 'tier', 'created_at')
+    search_fields = ('name', 'owner__email')
+    search_email_field = 'owner__email'
+    search_prefix_field = 'name'
+    search_help_text = _('An owner email address, or the start of a file name (case-sensitive).')
     readonly_fields = ('id', 'created_at', 'updated_at')
-    date_hierarchy = 'created_at'
+    raw_id_fields = ('owner',)
 
 
 @admin.register(FileShare)
-class FileShareAdmin(admin.ModelAdmin):
+class FileShareAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for FileShare model."""
     list_display = ('file', 'shared_with', 'can_write', 'created_at')
+    list_select_related = ('file', 'shared_with')
     list_filter = ('can_write', 'created_at')
-    search_fields = ('file__name', 'shared_with__username', 'shared_with__email')
+    search_fields = ('file__name', 'shared_with__email')
+    search_email_field = 'shared_with__email'
+    search_prefix_field = 'file__name'
+    search_help_text = _('A recipient email address, or the start of a file name (case-sensitive).')
     readonly_fields = ('id', 'created_at')
+    raw_id_fields = ('file', 'shared_with')
 
 
 @admin.register(ShareableLink)
-class ShareableLinkAdmin(admin.ModelAdmin):
+class ShareableLinkAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for ShareableLink model."""
     list_display = ('file', 'created_by', 'expires_at', 'access_count', 'created_at')
+    list_select_related = ('file', 'created_by')
     list_filter = ('created_at', 'expires_at')
-    search_fields = ('file__name', 'created_by__username', 'created_by__email')
+    search_fields = ('file__name', 'created_by__email')
+    search_email_field = 'created_by__email'
+    search_prefix_field = 'file__name'
+    search_help_text = _('A creator email address, or the start of a file name (case-sensitive).')
     readonly_fields = ('id', 'created_at', 'access_count')
-    date_hierarchy = 'created_at'
+    raw_id_fields = ('file', 'created_by')
@@ -0,0 +1,263 @@
+"""
+Async streaming download and change feed long-poll views.
+
+These are served by the ASGI application (``config.asgi``). While a client
+reads the response only a coroutine is parked on the event loop; every disk
+read and decrypt step runs in a worker thread, so slow clients do not pin a
+worker process for the length of the transfer.
+
+DRF views are synchronous, so authentication and the JSON error responses are
+done by hand here, mirroring ``FileDownloadView`` and ``PublicFileDownloadView``.
+
+A single ``Range: bytes=...`` request header gets a 206 with just that part
+of the file, decrypted from the ciphertext blocks that cover it, unless an
+``If-Range`` validator shows the file changed. Conditional requests are
+answered by ``files.conditional`` before anything is read.
+
+A long poll of the change feed likewise parks a coroutine between checks of
+the feed, and gives its database connection back while it sleeps.
+
+All of this holds only while every middleware in ``MIDDLEWARE`` can run
+async (see ``config.middleware``). Django runs the whole request in a thread
+from the first sync-only middleware down, so one such middleware would make
+every waiter hold a thread for as long as it waits.
+"""
+
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from analytics.rollups import usage
+from audit import buffer as audit
+from audit.models import AuditEvent
+from config.db import routers
+from config.tracing import traced_stream
+from . import changes, conditional, versions
+from .access import recorder
+from .models import EncryptedFile, FileShare, ShareableLink
+from .serializers import ChangeFeedQuerySerializer
+from .views import change_feed_response
+
+_jwt = JWTAuthentication()
+
+
+def _authenticate(request):
+    result = _jwt.authenticate(request)
+    return result[0] if result else None
+
+
+def _error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def _not_ready(file_obj):
+    if file_obj.status == EncryptedFile.PROCESSING:
+        return _error('This file is still being processed.', 409)
+    if file_obj.status == EncryptedFile.FAILED:
+        return _error('Processing this file failed.', 409)
+    return None
+
+
+def _release_connection():
+    # Outside tests' transactions; the connection is reopened on next use.
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+async def _iterate_in_thread(iterator):
+    """Drive a blocking iterator from the event loop, one step per thread hop."""
+    step = sync_to_async(next, thread_sensitive=False)
+    done = object()
+    try:
+        while True:
+            chunk = await step(iterator, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close, thread_sensitive=False)()
+
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` for a single-range ``Range`` header.
+
+    Returns None to serve the whole file (no header, multiple ranges or
+    another unit) and raises ValueError if the range is unsatisfiable.
+    """
+    match = _RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes.
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    if start >= size or start > end:
+        raise ValueError('Unsatisfiable range.')
+    return start, end
+
+
+async def _stream(file_obj, request=None):
+    header = request and conditional.range_applies(request, file_obj) and request.headers.get('Range')
+    try:
+        byte_range = parse_range(header, file_obj.size)
+    except ValueError:
+        response = _error('Requested range not satisfiable.', 416)
+        response['Content-Range'] = f'bytes */{file_obj.size}'
+        return response
+
+    recorder.record(file_obj)
+    # Look the chunks of a version up here; the decrypting threads run
+    # outside the request's database connection.
+    entries = await versions.amanifest(file_obj)
+    if byte_range is None:
+        chunks = await sync_to_async(versions.iter_content, thread_sensitive=False)(file_obj, entries)
+        status, length = 200, file_obj.size
+    else:
+        chunks = await sync_to_async(versions.iter_content_range, thread_sensitive=False)(
+            file_obj, *byte_range, entries
+        )
+        status, length = 206, byte_range[1] - byte_range[0] + 1
+    response = StreamingHttpResponse(
+        _iterate_in_thread(traced_stream('download.decrypt', chunks, size=length)),
+        content_type=file_obj.mime_type,
+        status=status
+    )
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range is not None:
+        response['Content-Range'] = f'bytes {byte_range[0]}-{byte_range[1]}/{file_obj.size}'
+    usage.downloaded(file_obj, length)
+    response['Content-Disposition'] = content_disposition_header(True, file_obj.name)
+    return conditional.set_validators(response, file_obj)
+
+
+async def _user_or_error(request):
+    """``(user, None)``, or ``(None, response)`` if authentication failed."""
+    try:
+        user = await sync_to_async(_authenticate)(request)
+    except exceptions.AuthenticationFailed as exc:
+        detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+        return None, JsonResponse(detail, status=401)
+    if user is None:
+        return None, _error('Authentication credentials were not provided.', 401)
+    return user, None
+
+
+@require_GET
+async def file_download(request, pk):
+    """Stream a file to its owner or a user it is shared with."""
+    user, error = await _user_or_error(request)
+    if error is not None:
+        return error
+
+    pinned = routers.is_pinned(request, user)
+    with routers.replica_reads(not pinned):
+        file_obj = await EncryptedFile.objects.filter(pk=pk).afirst()
+        if file_obj is None:
+            return _error('Not found.', 404)
+        if file_obj.owner_id != user.id and not await FileShare.objects.filter(
+            file=file_obj, shared_with=user
+        ).aexists():
+            return _error('You do not have permission to perform this action.', 403)
+
+    not_ready = _not_ready(file_obj)
+    if not_ready is not None:
+        return not_ready
+    not_modified = conditional.not_modified(request, file_obj)
+    if not_modified is not None:
+        return not_modified
+    audit.record(AuditEvent.DOWNLOAD, actor=user, file=file_obj, request=request, block=False)
+    return await _stream(file_obj, request)
+
+
+@csrf_exempt
+@require_POST
+async def public_file_download(request, token):
+    """Stream a file through a public shareable link."""
+    link = await ShareableLink.objects.select_related('file').filter(id=token).afirst()
+    if link is None:
+        return _error('Not found.', 404)
+
+    if not link.is_valid():
+        return _error('This link has expired or reached its access limit.', 400)
+
+    if link.password:
+        if request.content_type == 'application/json':
+            try:
+                password = json.loads(request.body or b'{}').get('password')
+            except (ValueError, AttributeError):
+                password = None
+        else:
+            password = request.POST.get('password')
+        if not password or password != link.password:
+            return _error('Invalid password.', 400)
+
+    # Only callers who may download learn about the file's state.
+    not_ready = _not_ready(link.file)
+    if not_ready is not None:
+        return not_ready
+    not_modified = conditional.not_modified(request, link.file)
+    if not_modified is not None:
+        return not_modified
+    await ShareableLink.objects.filter(pk=link.pk).aupdate(
+        access_count=F('access_count') + 1
+    )
+    audit.record(AuditEvent.PUBLIC_DOWNLOAD, file=link.file, target=link.pk, request=request, block=False)
+    return await _stream(link.file, request)
+
+
+@require_GET
+async def change_feed_wait(request):
+    """
+    Long-poll a user's change feed (``ChangeFeedView``): answer as soon as
+    there are changes after ``?cursor=``, or with none after ``?wait=``
+    seconds (at most ``CHANGE_FEED_MAX_WAIT_SECONDS``, the default). The
+    feed is checked every ``CHANGE_FEED_POLL_SECONDS`` with one indexed query.
+    """
+    user, error = await _user_or_error(request)
+    if error is not None:
+        return error
+    query = ChangeFeedQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=400)
+    cursor = query.validated_data.get('cursor')
+    if cursor is None:
+        return _error('A cursor is required.', 400)
+    wait = query.validated_data.get('wait', settings.CHANGE_FEED_MAX_WAIT_SECONDS)
+
+    pinned = routers.is_pinned(request, user)
+    with routers.replica_reads(not pinned):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while not await changes.pending(user.pk, cursor).aexists():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await sync_to_async(_release_connection)()
+            await asyncio.sleep(min(settings.CHANGE_FEED_POLL_SECONDS, remaining))
+        try:
+            page = await sync_to_async(changes.page)(user.pk, cursor, query.validated_data.get('limit'))
+        except changes.CursorExpired:
+            return _error('This cursor has expired; list the files again.', 410)
+    return JsonResponse(change_feed_response(page))
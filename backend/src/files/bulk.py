@@ -0,0 +1,193 @@
+"""
+Bulk operations on files, shares and links.
+
+Each operation takes what the user selected, a list of IDs or a filter, and
+finds what of it the user owns with one query. The change is then applied
+to all of it with set-based SQL in one transaction, so a request either
+changes everything or nothing. The result has an entry per selected item;
+IDs that do not exist or belong to someone else come back as ``not_found``,
+which does not tell them apart. A filter selects at most ``BULK_MAX_ITEMS``
+items per call; repeat the call until it affects nothing. Blobs of deleted
+files are removed by queued ``files.delete_blobs`` jobs.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from analytics.rollups import usage
+from audit import buffer as audit
+from audit.models import AuditEvent
+from jobs.queue import enqueue
+from . import changes, quota
+from .models import EncryptedFile, FileChange, FileShare, ShareableLink
+
+User = get_user_model()
+
+NOT_FOUND = 'not_found'
+
+# Blob names per ``files.delete_blobs`` job.
+BLOB_BATCH_SIZE = 500
+
+
+def select_files(user, ids=None, filters=None):
+    """The files ``user`` owns among ``ids``, or matching ``filters``."""
+    queryset = EncryptedFile.objects.filter(owner=user)
+    if ids is not None:
+        return queryset.filter(pk__in=ids)
+    filters = filters or {}
+    if 'name' in filters:
+        queryset = queryset.filter(name__icontains=filters['name'])
+    if 'mime_type' in filters:
+        queryset = queryset.filter(mime_type=filters['mime_type'])
+    if 'created_before' in filters:
+        queryset = queryset.filter(created_at__lt=filters['created_before'])
+    if 'created_after' in filters:
+        queryset = queryset.filter(created_at__gte=filters['created_after'])
+    if 'shared_with' in filters:
+        queryset = queryset.filter(shares__shared_with__email=filters['shared_with'])
+    return queryset
+
+
+def select_links(user, ids=None, filters=None):
+    """The links ``user`` created among ``ids``, or matching ``filters``."""
+    queryset = ShareableLink.objects.filter(created_by=user)
+    if ids is not None:
+        return queryset.filter(pk__in=ids)
+    filters = filters or {}
+    if 'file' in filters:
+        queryset = queryset.filter(file_id__in=filters['file'])
+    if filters.get('expired'):
+        queryset = queryset.filter(expires_at__lt=timezone.now())
+    return queryset
+
+
+def _limit(queryset, ids):
+    return queryset if ids is not None else queryset[:settings.BULK_MAX_ITEMS]
+
+
+def _results(ids, statuses):
+    """One result per requested ID (in order), or per affected item."""
+    if ids is None:
+        return [{'id': pk, 'status': status} for pk, status in statuses.items()]
+    return [{'id': pk, 'status': statuses.get(pk, NOT_FOUND)} for pk in dict.fromkeys(ids)]
+
+
+def delete_files(user, ids=None, filters=None):
+    """Delete the selected files and queue the deletion of their blobs."""
+    with transaction.atomic():
+        selected = select_files(user, ids, filters).select_for_update()
+        rows = list(_limit(selected.values_list('pk', 'file', 'preview', 'size'), ids))
+        if rows:
+            pks = [pk for pk, _, _, _ in rows]
+            changes.record(FileChange.DELETED, [(pk, user.pk) for pk in pks])
+            EncryptedFile.objects.filter(pk__in=pks).delete()
+            nbytes = sum(size for _, _, _, size in rows)
+            quota.release(user.pk, nbytes, files=len(rows))
+            names = [name for _, blob, preview, _ in rows for name in (blob, preview) if name]
+            for start in range(0, len(names), BLOB_BATCH_SIZE):
+                enqueue('files.delete_blobs', {'names': names[start:start + BLOB_BATCH_SIZE]})
+    if rows:
+        usage.files_deleted(user.pk, len(rows), nbytes)
+    return _results(ids, {pk: 'deleted' for pk, _, _, _ in rows})
+
+
+def share_files(user, recipient, can_write=False, ids=None, filters=None, request=None):
+    """
+    Share the selected files with ``recipient``. Files already shared with
+    them keep their share, with ``can_write`` updated.
+    """
+    with transaction.atomic():
+        pks = list(_limit(select_files(user, ids, filters).values_list('pk', flat=True), ids))
+        shares = FileShare.objects.filter(file_id__in=pks, shared_with=recipient)
+        existing = set(shares.values_list('file_id', flat=True))
+        shares.exclude(can_write=can_write).update(can_write=can_write)
+        created = [pk for pk in pks if pk not in existing]
+        FileShare.objects.bulk_create(
+            [FileShare(file_id=pk, shared_with=recipient, can_write=can_write) for pk in created],
+            ignore_conflicts=True
+        )
+        changes.add(
+            FileChange.SHARED,
+            [(pk, user_id) for pk in created for user_id in (user.pk, recipient.pk)]
+        )
+    for pk in created:
+        audit.record(AuditEvent.SHARE, actor=user, file=pk, target=recipient.email, request=request)
+    statuses = {pk: 'updated' for pk in existing}
+    statuses.update((pk, 'shared') for pk in created)
+    return _results(ids, statuses)
+
+
+def share_with_users(user, file_obj, emails, can_write=False, request=None):
+    """
+    Share one file with the users having ``emails``, resolved with one query.
+
+    Returns the emails grouped by outcome: ``shared``, ``already_shared``
+    (those shares are left as they are) and ``not_found``, which includes
+    the owner's own address.
+    """
+    emails = list(dict.fromkeys(User.objects.normalize_email(email) for email in emails))
+    recipients = dict(
+        User.objects.filter(email__in=emails).exclude(pk=user.pk).values_list('email', 'pk')
+    )
+    with transaction.atomic():
+        existing = set(
+            FileShare.objects.filter(file=file_obj, shared_with__in=recipients.values())
+            .values_list('shared_with_id', flat=True)
+        )
+        shared_with = [pk for pk in recipients.values() if pk not in existing]
+        # A concurrent share of the same file with the same user is skipped.
+        FileShare.objects.bulk_create(
+            [FileShare(file=file_obj, shared_with_id=pk, can_write=can_write) for pk in shared_with],
+            ignore_conflicts=True
+        )
+        if shared_with:
+            changes.add(
+                FileChange.SHARED,
+                [(file_obj.pk, pk) for pk in [user.pk] + shared_with]
+            )
+    results = {'shared': [], 'already_shared': [], 'not_found': []}
+    for email in emails:
+        if email not in recipients:
+            results['not_found'].append(email)
+        elif recipients[email] in existing:
+            results['already_shared'].append(email)
+        else:
+            results['shared'].append(email)
+            audit.record(AuditEvent.SHARE, actor=user, file=file_obj, target=email, request=request)
+    return results
+
+
+def unshare_files(user, recipient, ids=None, filters=None, request=None):
+    """
+    Stop sharing the selected files with ``recipient``. A filter only selects
+    files shared with ``recipient``; listed IDs of files that are not come
+    back as ``not_shared``.
+    """
+    selected = select_files(user, ids, filters)
+    if ids is None:
+        selected = selected.filter(shares__shared_with=recipient)
+    with transaction.atomic():
+        pks = list(_limit(selected.values_list('pk', flat=True), ids))
+        shares = FileShare.objects.filter(file_id__in=pks, shared_with=recipient)
+        unshared = set(shares.values_list('file_id', flat=True))
+        shares.delete()
+        changes.add(
+            FileChange.UNSHARED,
+            [(pk, user_id) for pk in unshared for user_id in (user.pk, recipient.pk)]
+        )
+    for pk in unshared:
+        audit.record(AuditEvent.UNSHARE, actor=user, file=pk, target=recipient.email, request=request)
+    statuses = {pk: 'unshared' if pk in unshared else 'not_shared' for pk in pks}
+    return _results(ids, statuses)
+
+
+def revoke_links(user, ids=None, filters=None, request=None):
+    """Delete the selected shareable links."""
+    with transaction.atomic():
+        selected = select_links(user, ids, filters).select_for_update()
+        links = list(_limit(selected.values_list('pk', 'file_id'), ids))
+        ShareableLink.objects.filter(pk__in=[pk for pk, _ in links]).delete()
+    for pk, file_id in links:
+        audit.record(AuditEvent.LINK_DELETE, actor=user, file=file_id, target=pk, request=request)
+    return _results(ids, {pk: 'revoked' for pk, _ in links})
@@ -0,0 +1,125 @@
+"""
+Per-user change feeds for client sync.
+
+Every create, update, delete, share and unshare of a file appends a
+``FileChange`` row for each user who sees it, in the transaction that makes
+the change: the owner and the users the file is shared with, and for a share
+or unshare the owner and that recipient. A client keeps the ``id`` of the
+last change it saw as its cursor and asks for the changes after it, a page
+at a time, instead of listing all of its files.
+
+A new client first takes the current cursor (``page`` without one), then
+lists the files, then follows the feed from that cursor. Changes younger
+than ``CHANGE_FEED_SETTLE_SECONDS`` are held back: IDs are handed out when a
+row is inserted but become visible when its transaction commits, so a slow
+transaction may commit a lower ID than one already served. Changes older
+than ``CHANGE_FEED_RETENTION_DAYS`` are deleted by ``gc_storage``; a cursor
+from before the oldest change left is ``CursorExpired`` and the client has
+to list its files again.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from .models import FileChange, FileShare
+
+
+class CursorExpired(Exception):
+    """The changes after a cursor were partly deleted already."""
+
+
+def audience(file_obj):
+    """The owner of ``file_obj`` and the users it is shared with (prefetched or not)."""
+    return [file_obj.owner_id] + [share.shared_with_id for share in file_obj.shares.all()]
+
+
+def add(action, entries):
+    """Append ``action`` for each distinct ``(file_id, user_id)`` in ``entries``."""
+    FileChange.objects.bulk_create([
+        FileChange(file_id=file_id, user_id=user_id, action=action)
+        for file_id, user_id in dict.fromkeys(entries)
+    ])
+
+
+def record_file(action, file_obj):
+    """Append ``action`` on ``file_obj`` for everyone in its ``audience``."""
+    add(action, ((file_obj.pk, user_id) for user_id in audience(file_obj)))
+
+
+def record(action, files):
+    """
+    Append ``action`` on ``files``, ``(file_id, owner_id)`` pairs, for their
+    owners and the users they are shared with; one query for the shares.
+    """
+    recipients = defaultdict(list)
+    for file_id, owner_id in files:
+        recipients[file_id].append(owner_id)
+    if not recipients:
+        return
+    shares = FileShare.objects.filter(file_id__in=list(recipients)).values_list('file_id', 'shared_with_id')
+    for file_id, user_id in shares:
+        recipients[file_id].append(user_id)
+    add(action, ((file_id, user_id) for file_id, users in recipients.items() for user_id in users))
+
+
+def _settled():
+    return timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+
+
+def pending(user_id, cursor):
+    """The settled changes of a user's feed after ``cursor``."""
+    return FileChange.objects.filter(user_id=user_id, id__gt=cursor, created_at__lte=_settled())
+
+
+def head():
+    """The newest settled cursor of any feed."""
+    newest = FileChange.objects.filter(created_at__lte=_settled()).order_by('-id')
+    return newest.values_list('id', flat=True).first() or 0
+
+
+def page(user_id, cursor=None, limit=None):
+    """
+    Up to ``limit`` changes (``FileChange``) of a user's feed after
+    ``cursor``, as ``{'cursor', 'has_more', 'changes'}``; ``cursor`` is
+    where to continue.
+    Without a cursor there are no changes, just the current cursor.
+
+    Raises ``CursorExpired`` if changes after ``cursor`` were deleted.
+    """
+    if cursor is None:
+        return {'cursor': head(), 'has_more': False, 'changes': []}
+    limit = limit or settings.CHANGE_FEED_PAGE_SIZE
+    rows = list(pending(user_id, cursor).only('id', 'file_id', 'action', 'created_at')[:limit + 1])
+    # Checked after the read: expired changes are deleted oldest first.
+    oldest = FileChange.objects.order_by('id').values_list('id', flat=True).first()
+    if oldest is not None and cursor < oldest - 1:
+        raise CursorExpired
+    if not rows:
+        # Move an idle feed along with the others, so it does not expire.
+        return {'cursor': max(cursor, head()), 'has_more': False, 'changes': []}
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {'cursor': rows[-1].id, 'has_more': has_more, 'changes': rows}
+
+
+def prune(batch_size, dry_run=False):
+    """
+    Delete changes older than ``CHANGE_FEED_RETENTION_DAYS``; returns how
+    many. The newest change is always kept, so expired cursors stay
+    recognizable.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS)
+    newest = FileChange.objects.aggregate(newest=Max('id'))['newest'] or 0
+    expired = FileChange.objects.filter(created_at__lt=cutoff, id__lt=newest)
+    if dry_run:
+        return expired.count()
+    deleted = 0
+    while True:
+        pks = list(expired.order_by('id').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        FileChange.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
@@ -0,0 +1,78 @@
+"""
+Content-defined chunking.
+
+File versions are stored as chunks whose boundaries depend on the content
+around them rather than on fixed offsets, so inserting or deleting a few
+bytes only changes the chunks next to the edit and every other chunk is
+shared with the previous version.
+
+This is FastCDC: a gear hash, ``fp = (fp << 1) + GEAR[byte]`` modulo 2**64,
+is rolled over the data starting ``min_size`` bytes into a chunk; the chunk
+ends after the first byte where the top bits selected by a mask are all zero.
+Before ``avg_size`` the mask has two more bits than ``log2(avg_size)`` and
+after it two fewer, which keeps chunk sizes close to ``avg_size``; no chunk
+is longer than ``max_size``. ``GEAR[i]`` is the first 8 bytes (big-endian) of
+``SHA-256(bytes([i]))``, so clients can compute the same boundaries and
+upload only the chunks the server lacks.
+"""
+
+import hashlib
+
+from django.conf import settings
+
+GEAR = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big') for i in range(256))
+MASK_64 = (1 << 64) - 1
+
+
+def parameters():
+    """The chunk sizes in use; clients must chunk with the same ones."""
+    return {
+        'algorithm': 'fastcdc-gear-sha256',
+        'min_size': settings.CHUNK_MIN_SIZE,
+        'avg_size': settings.CHUNK_AVG_SIZE,
+        'max_size': settings.CHUNK_MAX_SIZE,
+    }
+
+
+def _top_bits(count):
+    return ((1 << count) - 1) << (64 - count)
+
+
+def cut_point(data, min_size, avg_size, max_size):
+    """Length of the first chunk of ``data``."""
+    length = min(len(data), max_size)
+    if length <= min_size:
+        return length
+    bits = avg_size.bit_length() - 1
+    strict, loose = _top_bits(bits + 2), _top_bits(bits - 2)
+    normal = min(avg_size, length)
+    view = memoryview(data)
+    gear, fp = GEAR, 0
+    for i, byte in enumerate(view[min_size:normal], min_size):
+        fp = ((fp << 1) + gear[byte]) & MASK_64
+        if not fp & strict:
+            return i + 1
+    for i, byte in enumerate(view[normal:length], normal):
+        fp = ((fp << 1) + gear[byte]) & MASK_64
+        if not fp & loose:
+            return i + 1
+    return length
+
+
+def iter_chunks(stream, min_size=None, avg_size=None, max_size=None):
+    """Yield the content-defined chunks of a binary file object."""
+    min_size = min_size or settings.CHUNK_MIN_SIZE
+    avg_size = avg_size or settings.CHUNK_AVG_SIZE
+    max_size = max_size or settings.CHUNK_MAX_SIZE
+    buffer = b''
+    eof = False
+    while True:
+        while not eof and len(buffer) < max_size:
+            block = stream.read(max_size)
+            eof = not block
+            buffer += block
+        if not buffer:
+            return
+        cut = cut_point(buffer, min_size, avg_size, max_size)
+        yield buffer[:cut]
+        buffer = buffer[cut:]
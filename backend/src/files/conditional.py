@@ -0,0 +1,63 @@
+"""
+Validators and conditional requests for file downloads.
+
+Every download carries a strong ``ETag`` and a ``Last-Modified`` taken from
+the file row alone: the ETag is the plaintext checksum (or, for files stored
+before checksums were recorded, the id and modification time), and
+Last-Modified is ``updated_at``. A client that already has the file gets a
+304 from ``not_modified`` before the blob is read or its key unwrapped, and
+``range_applies`` implements ``If-Range`` so a resumed download never mixes
+parts of two versions.
+"""
+
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+
+def etag_of(file_obj, variant=''):
+    """The file's ETag; ``variant`` tells derived representations apart."""
+    if file_obj.checksum:
+        tag = file_obj.checksum
+    else:
+        tag = f'{file_obj.pk.hex}-{file_obj.updated_at.timestamp():.6f}'
+    return quote_etag(f'{tag}-{variant}' if variant else tag)
+
+
+def last_modified_of(file_obj):
+    return int(file_obj.updated_at.timestamp())
+
+
+def set_validators(response, file_obj, variant=''):
+    response['ETag'] = etag_of(file_obj, variant)
+    response['Last-Modified'] = http_date(last_modified_of(file_obj))
+    return response
+
+
+def _weak_match(etag, candidates):
+    opaque = etag.removeprefix('W/')
+    return any(candidate == '*' or candidate.removeprefix('W/') == opaque for candidate in candidates)
+
+
+def not_modified(request, file_obj, variant=''):
+    """A 304 response if the client's copy is current, else None."""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # If-Modified-Since is ignored when If-None-Match is sent.
+        matched = _weak_match(etag_of(file_obj, variant), parse_etags(if_none_match))
+    else:
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        matched = since is not None and last_modified_of(file_obj) <= since
+    if not matched:
+        return None
+    return set_validators(HttpResponseNotModified(), file_obj, variant)
+
+
+def range_applies(request, file_obj):
+    """Whether to serve the Range header: no If-Range, or it is still current."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Strong comparison: a weak validator never matches.
+        return if_range == etag_of(file_obj)
+    return parse_http_date_safe(if_range) == last_modified_of(file_obj)
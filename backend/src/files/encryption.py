@@ -1,10 +1,15 @@
+import hashlib
 import os
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
+from config.tracing import span
 from .key_management import key_manager
 
+# Ciphertext read per step when streaming; a multiple of the AES block size.
+CHUNK_SIZE = 64 * 1024
+
 
 def generate_key():
     """Generate a random 32-byte key for AES-256."""
@@ -58,19 +63,111 @@ def encrypt_file(file_obj):
     encryptor = cipher.encryptor()
     
     # Read and encrypt file data
-    file_data = file_obj.read()
-    padded_data = pad_data(file_data)
-    encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
+    with span('storage.read'):
+        file_data = file_obj.read()
+    with span('crypto.encrypt', bytes=len(file_data)):
+        padded_data = pad_data(file_data)
+        encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
     
     # Create a new file with encrypted data
     encrypted_file = ContentFile(encrypted_data)
     
     # Encrypt the key with the master key
-    encrypted_key = key_manager.encrypt_key(key)
+    with span('crypto.wrap_key'):
+        encrypted_key = key_manager.encrypt_key(key)
     
     return encrypted_file, encrypted_key, iv
 
 
+class EncryptedStream(File):
+    """
+    A file whose ``chunks()`` encrypt the source on the fly.
+
+    Storages consume uploads through ``chunks()``, so saving one of these
+    never holds the whole ciphertext in memory. It can be read only once;
+    afterwards ``checksum`` is the SHA-256 hex digest of the plaintext.
+    """
+
+    def __init__(self, source, key, iv, chunk_size=CHUNK_SIZE):
+        super().__init__(None, getattr(source, 'name', None))
+        self._source = source
+        self._key = key
+        self._iv = iv
+        self._chunk_size = chunk_size
+        self.checksum = None
+        # PKCS7 always adds between 1 and 16 bytes.
+        self.size = (source.size // 16 + 1) * 16
+
+    def chunks(self, chunk_size=None):
+        encryptor = Cipher(
+            algorithms.AES(self._key),
+            modes.CBC(self._iv),
+            backend=default_backend()
+        ).encryptor()
+        padder = padding.PKCS7(128).padder()
+        digest = hashlib.sha256()
+
+        self._source.seek(0)
+        with span('crypto.encrypt', bytes=self._source.size):
+            for chunk in self._source.chunks(self._chunk_size):
+                digest.update(chunk)
+                data = encryptor.update(padder.update(chunk))
+                if data:
+                    yield data
+            self.checksum = digest.hexdigest()
+            yield encryptor.update(padder.finalize()) + encryptor.finalize()
+
+    def __bool__(self):
+        return True
+
+
+def encrypt_stream(file_obj, chunk_size=CHUNK_SIZE):
+    """
+    Encrypt a file using AES-256-CBC as it is written to storage.
+
+    Args:
+        file_obj: A Django File to encrypt
+        chunk_size: Number of plaintext bytes to encrypt per step
+
+    Returns:
+        tuple: (encrypted_file, encrypted_key, iv)
+            - encrypted_file: EncryptedStream to pass to ``Storage.save``
+            - encrypted_key: The encrypted key (bytes)
+            - iv: The initialization vector (bytes)
+    """
+    key = generate_key()
+    iv = generate_iv()
+    with span('crypto.wrap_key'):
+        encrypted_key = key_manager.encrypt_key(key)
+    return EncryptedStream(file_obj, key, iv, chunk_size), encrypted_key, iv
+
+
+def encrypt_with_key(data, encrypted_key):
+    """
+    Encrypt bytes derived from a file under that file's key.
+    
+    Args:
+        data: The plaintext (bytes)
+        encrypted_key: The file's encrypted key (bytes)
+        
+    Returns:
+        tuple: (encrypted_file, iv)
+            - encrypted_file: Django ContentFile with encrypted data
+            - iv: A fresh initialization vector (bytes)
+    """
+    with span('crypto.unwrap_key'):
+        key = key_manager.decrypt_key(encrypted_key)
+    iv = generate_iv()
+    encryptor = Cipher(
+        algorithms.AES(key),
+        modes.CBC(iv),
+        backend=default_backend()
+    ).encryptor()
+    with span('crypto.encrypt', bytes=len(data)):
+        encrypted_data = encryptor.update(pad_data(data)) + encryptor.finalize()
+    return ContentFile(encrypted_data), iv
+
+
 def decrypt_file(file_obj, encrypted_key, iv):
     """
     Decrypt a file using AES-256-CBC.
@@ -84,7 +181,8 @@ def decrypt_file(file_obj, encrypted_key, iv):
         ContentFile: A new file-like object containing the decrypted data
     """
     # Decrypt the key using the master key
-    key = key_manager.decrypt_key(encrypted_key)
+    with span('crypto.unwrap_key'):
+        key = key_manager.decrypt_key(encrypted_key)
     
     # Create cipher
     cipher = Cipher(
@@ -95,9 +193,150 @@ def decrypt_file(file_obj, encrypted_key, iv):
     decryptor = cipher.decryptor()
     
     # Read and decrypt file data
-    encrypted_data = file_obj.read()
-    padded_data = decryptor.update(encrypted_data) + decryptor.finalize()
-    decrypted_data = unpad_data(padded_data)
+    with span('storage.read'):
+        encrypted_data = file_obj.read()
+    with span('crypto.decrypt', bytes=len(encrypted_data)):
+        padded_data = decryptor.update(encrypted_data) + decryptor.finalize()
+        decrypted_data = unpad_data(padded_data)
     
     # Create a new file with decrypted data
-    return ContentFile(decrypted_data) 
\ No newline at end of file
+    return ContentFile(decrypted_data)
+
+
+def iter_decrypt_file(file_obj, encrypted_key, iv, chunk_size=CHUNK_SIZE):
+    """
+    Decrypt a file using AES-256-CBC, one chunk at a time.
+    
+    The key is unwrapped immediately so that a bad key fails before any
+    response is started; the returned generator then reads and decrypts
+    ``chunk_size`` bytes per step.
+    
+    Args:
+        file_obj: Django File object containing encrypted data
+        encrypted_key: The encrypted key (bytes)
+        iv: The initialization vector (bytes)
+        chunk_size: Number of ciphertext bytes to read per step
+        
+    Returns:
+        generator: Yields the decrypted data as bytes
+    """
+    with span('crypto.unwrap_key'):
+        key = key_manager.decrypt_key(encrypted_key)
+    return _decrypt_chunks(file_obj, key, iv, chunk_size)
+
+
+def _decrypt_chunks(file_obj, key, iv, chunk_size):
+    decryptor = Cipher(
+        algorithms.AES(key),
+        modes.CBC(iv),
+        backend=default_backend()
+    ).decryptor()
+    # The unpadder holds back the last block until finalize().
+    unpadder = padding.PKCS7(128).unpadder()
+    
+    file_obj.open('rb')
+    try:
+        for chunk in file_obj.chunks(chunk_size):
+            data = unpadder.update(decryptor.update(chunk))
+            if data:
+                yield data
+        yield unpadder.update(decryptor.finalize()) + unpadder.finalize()
+    finally:
+        file_obj.close()
+
+
+def iter_decrypt_parts(parts, encrypted_key, chunk_size=CHUNK_SIZE):
+    """
+    Decrypt several blobs encrypted under the same key, one after the other.
+    
+    The key is unwrapped once, up front, as in ``iter_decrypt_file``.
+    
+    Args:
+        parts: Iterable of (file_obj, iv) pairs
+        encrypted_key: The encrypted key (bytes)
+        chunk_size: Number of ciphertext bytes to read per step
+        
+    Returns:
+        generator: Yields the decrypted data as bytes
+    """
+    with span('crypto.unwrap_key'):
+        key = key_manager.decrypt_key(encrypted_key)
+    return (
+        data
+        for file_obj, iv in parts
+        for data in _decrypt_chunks(file_obj, key, iv, chunk_size)
+    )
+
+
+def iter_decrypt_range(file_obj, encrypted_key, iv, start, end, chunk_size=CHUNK_SIZE):
+    """
+    Decrypt plaintext bytes ``start`` to ``end`` (inclusive) of a file.
+
+    In CBC mode a block only depends on the ciphertext block before it, so
+    decryption starts at the block holding ``start`` with the previous
+    ciphertext block (or the file's IV) as IV. Only the ciphertext covering
+    the range is read; storages with a ``read_range`` method fetch it in one
+    request. ``end`` must lie before the padding, i.e. within the plaintext.
+
+    Returns:
+        generator: Yields the decrypted data as bytes
+    """
+    with span('crypto.unwrap_key'):
+        key = key_manager.decrypt_key(encrypted_key)
+    return _decrypt_range(file_obj, key, iv, start, end, chunk_size)
+
+
+def _read_span(file_obj, offset, length, chunk_size):
+    raw = getattr(file_obj, 'file', None) or file_obj
+    if hasattr(raw, 'read_range'):
+        yield from raw.read_range(offset, length, chunk_size)
+        return
+    file_obj.seek(offset)
+    while length > 0:
+        data = file_obj.read(min(chunk_size, length))
+        if not data:
+            return
+        length -= len(data)
+        yield data
+
+
+def _decrypt_range(file_obj, key, iv, start, end, chunk_size):
+    first_block = start // 16
+    offset = first_block * 16
+    length = (end // 16 + 1) * 16 - offset
+    skip = start - offset
+    remaining = end - start + 1
+
+    # Read one extra block in front; it is the IV for the first block.
+    if first_block:
+        offset -= 16
+        length += 16
+        skip += 16
+
+    file_obj.open('rb')
+    try:
+        decryptor = None
+        head = b''
+        for chunk in _read_span(file_obj, offset, length, chunk_size):
+            if decryptor is None:
+                head += chunk
+                if first_block and len(head) < 16:
+                    continue
+                if first_block:
+                    iv = head[:16]
+                    chunk, skip = head[16:], skip - 16
+                else:
+                    chunk = head
+                decryptor = Cipher(
+                    algorithms.AES(key),
+                    modes.CBC(iv),
+                    backend=default_backend()
+                ).decryptor()
+            out = decryptor.update(chunk)
+            data = out[skip:skip + remaining]
+            skip = max(0, skip - len(out))
+            remaining -= len(data)
+            if data:
+                yield data
+    finally:
+        file_obj.close()
@@ -0,0 +1,175 @@
+"""
+Garbage collection for encrypted blobs and shareable links.
+
+Blobs anywhere under ``encrypted_files/`` that no ``EncryptedFile``
+references as its file or preview and no ``FileChunk`` stores (the row was
+deleted, possibly by cascade from its owner) are removed, as are links that
+expired more than ``GC_LINK_RETENTION_DAYS`` ago or used up their access
+limit. Work happens in batches of ``batch_size`` with at most ``rate`` blob
+deletions per second, so a run never holds long locks or saturates the disk.
+
+Uploads write the blob before inserting the row that references it, so blobs
+younger than ``grace_seconds`` are never collected; that keeps in-flight
+uploads (including queued background encryption) safe.
+
+Before the blobs, versions are pruned and unused chunks deleted (see
+``files.versions``), so the blobs of the chunks go in the same run. Change
+feed entries older than ``CHANGE_FEED_RETENTION_DAYS`` are deleted as well.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+from . import changes, versions
+from .models import EncryptedFile, FileChunk, ShareableLink
+from .storage import BLOB_ROOT, alternate_name
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GCReport:
+    dry_run: bool = False
+    blobs_scanned: int = 0
+    orphaned_blobs: int = 0
+    bytes_reclaimed: int = 0
+    links_deleted: int = 0
+    versions_pruned: int = 0
+    chunks_deleted: int = 0
+    changes_deleted: int = 0
+    errors: list = field(default_factory=list)
+
+
+class Throttle:
+    """Sleep as needed to stay under ``rate`` operations per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+def walk(storage, top):
+    """Yield the names of all files below ``top`` in ``storage``."""
+    try:
+        directories, files = storage.listdir(top)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f'{top}/{name}'
+    for directory in directories:
+        yield from walk(storage, f'{top}/{directory}')
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def collect_blobs(report, batch_size, grace_seconds, rate, storage=None):
+    storage = storage or default_storage
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    throttle = Throttle(rate)
+
+    roots = getattr(storage, 'blob_roots', [BLOB_ROOT])
+    names = (name for root in roots for name in walk(storage, root))
+    for batch in _batches(names, batch_size):
+        report.blobs_scanned += len(batch)
+        # A row may still name the flat location of a sharded blob (or the
+        # reverse) while ``shard_blobs`` runs; both count as references.
+        alternates = {name: alternate_name(name) for name in batch}
+        candidates = batch + [alt for alt in alternates.values() if alt]
+        referenced = set()
+        for blob, preview in EncryptedFile.objects.filter(
+            Q(file__in=candidates) | Q(preview__in=candidates)
+        ).values_list('file', 'preview'):
+            referenced.update((blob, preview))
+        referenced.update(FileChunk.objects.filter(blob__in=candidates).values_list('blob', flat=True))
+        for name in batch:
+            if name in referenced or alternates[name] in referenced:
+                continue
+            try:
+                if storage.get_modified_time(name) > cutoff:
+                    continue
+                size = storage.size(name)
+                if not report.dry_run:
+                    throttle.wait()
+                    storage.delete(name)
+            except FileNotFoundError:
+                continue
+            except OSError as exc:
+                report.errors.append(f'{name}: {exc}')
+                logger.warning('Could not collect blob %s: %s', name, exc)
+                continue
+            report.orphaned_blobs += 1
+            report.bytes_reclaimed += size
+
+
+def collect_links(report, batch_size):
+    expired_before = timezone.now() - timedelta(days=settings.GC_LINK_RETENTION_DAYS)
+    dead = ShareableLink.objects.filter(
+        Q(expires_at__lt=expired_before) |
+        Q(max_access_count__isnull=False, access_count__gte=F('max_access_count'))
+    )
+    if report.dry_run:
+        report.links_deleted = dead.count()
+        return
+
+    while True:
+        pks = list(dead.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        deleted, _ = ShareableLink.objects.filter(pk__in=pks).delete()
+        report.links_deleted += deleted
+
+
+def collect_versions(report, batch_size):
+    report.versions_pruned = versions.prune(batch_size, dry_run=report.dry_run)
+    report.chunks_deleted = versions.collect_chunks(batch_size, dry_run=report.dry_run)
+
+
+def collect_changes(report, batch_size):
+    report.changes_deleted = changes.prune(batch_size, dry_run=report.dry_run)
+
+
+def collect_garbage(dry_run=False, blobs=True, links=True, batch_size=None,
+                    grace_seconds=None, rate=None, file_versions=True, file_changes=True):
+    """
+    Collect old versions, orphaned blobs, dead links and expired changes and
+    return a ``GCReport``.
+    """
+    report = GCReport(dry_run=dry_run)
+    batch_size = batch_size or settings.GC_BATCH_SIZE
+    if file_versions:
+        collect_versions(report, batch_size)
+    if blobs:
+        collect_blobs(
+            report,
+            batch_size,
+            settings.GC_GRACE_SECONDS if grace_seconds is None else grace_seconds,
+            settings.GC_MAX_DELETES_PER_SECOND if rate is None else rate,
+        )
+    if links:
+        collect_links(report, batch_size)
+    if file_changes:
+        collect_changes(report, batch_size)
+    return report
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from files.gc import collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Prune old file versions and delete unused chunks, orphaned encrypted blobs, '
+        'expired or exhausted shareable links and expired change feed entries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be deleted without deleting anything.'
+        )
+        parser.add_argument('--skip-blobs', action='store_true', help='Leave blobs alone.')
+        parser.add_argument('--skip-links', action='store_true', help='Leave links alone.')
+        parser.add_argument(
+            '--skip-versions', action='store_true', help='Leave file versions and chunks alone.'
+        )
+        parser.add_argument(
+            '--skip-changes', action='store_true', help='Leave change feed entries alone.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Blobs checked / links deleted per query (default: GC_BATCH_SIZE).'
+        )
+        parser.add_argument(
+            '--grace-seconds', type=int,
+            help='Never delete blobs younger than this (default: GC_GRACE_SECONDS).'
+        )
+        parser.add_argument(
+            '--rate', type=float,
+            help='Maximum blob deletions per second, 0 for no limit '
+                 '(default: GC_MAX_DELETES_PER_SECOND).'
+        )
+
+    def handle(self, *args, **options):
+        report = collect_garbage(
+            dry_run=options['dry_run'],
+            blobs=not options['skip_blobs'],
+            links=not options['skip_links'],
+            file_versions=not options['skip_versions'],
+            file_changes=not options['skip_changes'],
+            batch_size=options['batch_size'],
+            grace_seconds=options['grace_seconds'],
+            rate=options['rate'],
+        )
+        verb = 'Would delete' if report.dry_run else 'Deleted'
+        if report.versions_pruned or report.chunks_deleted:
+            self.stdout.write(
+                f'{verb} {report.versions_pruned} old versions and {report.chunks_deleted} unused chunks.'
+            )
+        self.stdout.write(
+            f'Scanned {report.blobs_scanned} blobs. {verb} {report.orphaned_blobs} orphaned '
+            f'blobs ({filesizeformat(report.bytes_reclaimed)}) and {report.links_deleted} links.'
+        )
+        if report.changes_deleted:
+            self.stdout.write(f'{verb} {report.changes_deleted} expired change feed entries.')
+        for error in report.errors:
+            self.stderr.write(error)
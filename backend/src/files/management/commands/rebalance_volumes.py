@@ -0,0 +1,44 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+from jobs.queue import enqueue
+from files.rebalance import rebalance
+
+
+class Command(BaseCommand):
+    help = (
+        'Spread blobs over BLOB_VOLUMES according to their weights and capacity. '
+        'By default this queues a background job; run it after adding a volume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--now', action='store_true',
+            help='Rebalance in this process instead of queueing a job.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Show the current and target usage and what would move.'
+        )
+        parser.add_argument(
+            '--max-files', type=int, default=100,
+            help='Blobs moved per run (the job requeues itself until done).'
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'volumes'):
+            raise CommandError('The configured blob storage has no volumes to rebalance.')
+        if not (options['now'] or options['dry_run']):
+            job = enqueue('files.rebalance_volumes', {'max_files': options['max_files']})
+            self.stdout.write(f'Queued rebalance job {job.pk}.')
+            return
+
+        report = rebalance(max_files=options['max_files'], dry_run=options['dry_run'])
+        for volume, used in sorted(report.usage.items()):
+            target = report.targets.get(volume, 0)
+            self.stdout.write(f'{volume:<16} {filesizeformat(used):>12}  (target {filesizeformat(target)})')
+        verb = 'Would move' if report.dry_run else 'Moved'
+        self.stdout.write(
+            f'{verb} {report.files_moved} blobs ({filesizeformat(report.bytes_moved)}); '
+            f'{"balanced" if report.done else "more to do"}.'
+        )
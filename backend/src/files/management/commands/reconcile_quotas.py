@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from files.quota import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recount the storage usage counters that quotas are checked against.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report users whose counters drifted.'
+        )
+
+    def handle(self, *args, **options):
+        drifts = reconcile(dry_run=options['dry_run'])
+        for drift in drifts:
+            self.stdout.write(
+                f'{drift.email}: {filesizeformat(drift.storage_used)} in {drift.file_count} files '
+                f'counted, {filesizeformat(drift.actual_bytes)} in {drift.actual_files} stored'
+            )
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(f'{verb} the counters of {len(drifts)} users.')
@@ -0,0 +1,64 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from files.gc import Throttle
+from files.models import EncryptedFile
+from files.storage import sharded_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Move blobs from the flat encrypted_files/ directory into the sharded '
+        'layout, updating EncryptedFile.file in batches. Safe to run online.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Files per batch.')
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Maximum blobs moved per second (default: no limit).'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Count the blobs that would be moved without moving them.'
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not hasattr(storage, 'link'):
+            raise CommandError('The default storage cannot move blobs in place.')
+
+        throttle = Throttle(options['rate'])
+        flat = EncryptedFile.objects.filter(file__regex=r'^encrypted_files/[^/]+$').order_by('pk')
+        moved = missing = 0
+        last_pk = None
+        while True:
+            batch = flat if last_pk is None else flat.filter(pk__gt=last_pk)
+            batch = list(batch.values_list('pk', 'file')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            for pk, old in batch:
+                new = sharded_name(old)
+                if options['dry_run']:
+                    moved += 1
+                    continue
+                throttle.wait()
+                # Link first, then repoint the row, then drop the old name:
+                # readers find the blob under either name at every step.
+                try:
+                    storage.link(old, new)
+                except FileNotFoundError:
+                    if not os.path.exists(storage.path(new)):
+                        missing += 1
+                        self.stderr.write(f'Missing blob for file {pk}: {old}')
+                        continue
+                if EncryptedFile.objects.filter(pk=pk, file=old).update(file=new):
+                    storage.delete_exact(old)
+                moved += 1
+            self.stdout.write(f'{moved} blobs {"to move" if options["dry_run"] else "moved"} so far')
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} blobs; {missing} missing.'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+from jobs.queue import enqueue
+from files.tiering import demote, tiering_enabled
+
+
+class Command(BaseCommand):
+    help = (
+        'Move blobs matching TIER_COLD_RULES to TIER_COLD_VOLUME. '
+        'By default this queues a background job; run it daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--now', action='store_true',
+            help='Demote in this process instead of queueing a job.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Show what would be demoted without moving anything.'
+        )
+        parser.add_argument(
+            '--max-files', type=int, default=100,
+            help='Blobs moved per run (the job requeues itself until done).'
+        )
+
+    def handle(self, *args, **options):
+        if not tiering_enabled():
+            raise CommandError('TIER_COLD_VOLUME must name one of the configured BLOB_VOLUMES.')
+        if not (options['now'] or options['dry_run']):
+            job = enqueue('files.tier_blobs', {'max_files': options['max_files']})
+            self.stdout.write(f'Queued tiering job {job.pk}.')
+            return
+
+        report = demote(max_files=options['max_files'], dry_run=options['dry_run'])
+        verb = 'Would demote' if report.dry_run else 'Demoted'
+        self.stdout.write(
+            f'{verb} {report.files_demoted} blobs ({filesizeformat(report.bytes_demoted)}); '
+            f'{"done" if report.done else "more to do"}.'
+        )
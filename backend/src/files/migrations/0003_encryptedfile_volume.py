@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-19 03:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_encryptedfile_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='volume',
+            field=models.CharField(default='default', help_text='Storage volume holding the blob', max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='encryptedfile',
+            index=models.Index(fields=['volume', 'size'], name='file_volume_size_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-19 03:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_encryptedfile_volume'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='access_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of downloads'),
+        ),
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='last_accessed_at',
+            field=models.DateTimeField(blank=True, help_text='Time of the last download', null=True),
+        ),
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='tier',
+            field=models.CharField(choices=[('hot', 'Hot'), ('cold', 'Cold')], default='hot', help_text='Cold blobs live on the slower TIER_COLD_VOLUME', max_length=4),
+        ),
+        migrations.AddIndex(
+            model_name='encryptedfile',
+            index=models.Index(fields=['tier', 'last_accessed_at'], name='file_tier_access_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-19 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_encryptedfile_tiering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='checksum',
+            field=models.CharField(blank=True, help_text='SHA-256 of the plaintext, empty for files stored before it was recorded', max_length=64),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-19 03:30
+
+import files.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_encryptedfile_checksum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='preview',
+            field=models.FileField(blank=True, help_text='Thumbnail of an image, encrypted with the file key', upload_to=files.models.get_file_path),
+        ),
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='preview_iv',
+            field=models.BinaryField(blank=True, default=b'', help_text='Initialization vector used for the preview'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.0 on 2026-10-19 03:35
+
+import django.db.models.deletion
+import files.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_encryptedfile_preview'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Current FileVersion number; 0 serves the originally uploaded blob'),
+        ),
+        migrations.AlterField(
+            model_name='encryptedfile',
+            name='checksum',
+            field=models.CharField(blank=True, help_text='SHA-256 of the plaintext (of the chunk digests for chunked versions), empty for files stored before it was recorded', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='FileChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-256 of the plaintext chunk', max_length=64)),
+                ('size', models.PositiveIntegerField(help_text='Plaintext size in bytes')),
+                ('blob', models.FileField(upload_to=files.models.get_file_path)),
+                ('iv', models.BinaryField(help_text='Initialization vector; the key is the file key')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('file', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='files.encryptedfile')),
+            ],
+            options={
+                'verbose_name': 'file chunk',
+                'verbose_name_plural': 'file chunks',
+            },
+        ),
+        migrations.CreateModel(
+            name='FileVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('size', models.BigIntegerField(help_text='File size in bytes')),
+                ('checksum', models.CharField(help_text='SHA-256 of the chunk digests', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('file', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='files.encryptedfile')),
+            ],
+            options={
+                'verbose_name': 'file version',
+                'verbose_name_plural': 'file versions',
+                'ordering': ['-number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='VersionChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('offset', models.BigIntegerField(help_text='Offset of the chunk in the version')),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='files.filechunk')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='files.fileversion')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filechunk',
+            constraint=models.UniqueConstraint(fields=('file', 'digest'), name='chunk_file_digest_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='fileversion',
+            constraint=models.UniqueConstraint(fields=('file', 'number'), name='version_file_number_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='versionchunk',
+            constraint=models.UniqueConstraint(fields=('version', 'position'), name='entry_version_position_unique'),
+        ),
+    ]
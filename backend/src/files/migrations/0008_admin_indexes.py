@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-19 03:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_file_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='encryptedfile',
+            index=models.Index(fields=['-created_at'], name='file_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='encryptedfile',
+            index=models.Index(fields=['name'], name='file_name_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
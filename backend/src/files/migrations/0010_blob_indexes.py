@@ -0,0 +1,27 @@
+# Generated by Django 5.0 on 2026-10-19 04:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_file_changes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='encryptedfile',
+            index=models.Index(fields=['file'], name='file_blob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='encryptedfile',
+            index=models.Index(fields=['preview'], name='file_preview_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filechunk',
+            index=models.Index(fields=['blob'], name='chunk_blob_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-19 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_blob_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedfile',
+            name='preview_failed',
+            field=models.BooleanField(default=False, help_text='The current content is not an image a preview can be rendered of'),
+        ),
+    ]
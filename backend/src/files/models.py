@@ -1,22 +1,38 @@
-import os
 import uuid
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
 from django.utils import timezone
+from .storage import sharded_name
 
 
 def get_file_path(instance, filename):
-    """Generate a unique path for the uploaded file."""
+    """Generate a unique, sharded path for the uploaded file."""
     ext = filename.split('.')[-1]
     filename = f'{uuid.uuid4()}.{ext}'
-    return os.path.join('encrypted_files', filename)
+    return sharded_name(filename)
 
 
 class EncryptedFile(models.Model):
     """Model for storing encrypted files."""
     
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PROCESSING, _('Processing')),
+        (READY, _('Ready')),
+        (FAILED, _('Failed')),
+    )
+    
+    HOT = 'hot'
+    COLD = 'cold'
+    TIER_CHOICES = (
+        (HOT, _('Hot')),
+        (COLD, _('Cold')),
+    )
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -36,6 +52,58 @@ class EncryptedFile(models.Model):
     encryption_iv = models.BinaryField(
         help_text=_('Initialization vector used for encryption')
     )
+    checksum = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text=_(
+            'SHA-256 of the plaintext (of the chunk digests for chunked versions), '
+            'empty for files stored before it was recorded'
+        )
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text=_('Current FileVersion number; 0 serves the originally uploaded blob')
+    )
+    preview = models.FileField(
+        upload_to=get_file_path,
+        blank=True,
+        help_text=_('Thumbnail of an image, encrypted with the file key')
+    )
+    preview_iv = models.BinaryField(
+        blank=True,
+        default=b'',
+        help_text=_('Initialization vector used for the preview')
+    )
+    preview_failed = models.BooleanField(
+        default=False,
+        help_text=_('The current content is not an image a preview can be rendered of')
+    )
+    volume = models.CharField(
+        max_length=32,
+        default='default',
+        help_text=_('Storage volume holding the blob')
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=READY,
+        help_text=_('Uploads encrypted in the background are processing until done')
+    )
+    tier = models.CharField(
+        max_length=4,
+        choices=TIER_CHOICES,
+        default=HOT,
+        help_text=_('Cold blobs live on the slower TIER_COLD_VOLUME')
+    )
+    access_count = models.PositiveIntegerField(
+        default=0,
+        help_text=_('Number of downloads')
+    )
+    last_accessed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text=_('Time of the last download')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -43,6 +111,16 @@ class EncryptedFile(models.Model):
         verbose_name = _('encrypted file')
         verbose_name_plural = _('encrypted files')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['volume', 'size'], name='file_volume_size_idx'),
+            models.Index(fields=['tier', 'last_accessed_at'], name='file_tier_access_idx'),
+            # The admin changelist's ordering and file name prefix search.
+            models.Index(fields=['-created_at'], name='file_created_idx'),
+            models.Index(fields=['name'], name='file_name_idx', opclasses=['varchar_pattern_ops']),
+            # The garbage collector looks up blob names in batches.
+            models.Index(fields=['file'], name='file_blob_idx'),
+            models.Index(fields=['preview'], name='file_preview_idx'),
+        ]
         
     def __str__(self):
         return self.name
@@ -127,3 +205,140 @@ class ShareableLink(models.Model):
         if self.max_access_count and self.access_count >= self.max_access_count:
             return False
         return True
+
+
+class FileChunk(models.Model):
+    """An encrypted content-defined chunk of one or more versions of a file."""
+    
+    # Not a database constraint, so deleting a file does not have to visit
+    # its chunks; the garbage collector removes them afterwards.
+    file = models.ForeignKey(
+        EncryptedFile,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    digest = models.CharField(max_length=64, help_text=_('SHA-256 of the plaintext chunk'))
+    size = models.PositiveIntegerField(help_text=_('Plaintext size in bytes'))
+    blob = models.FileField(upload_to=get_file_path)
+    iv = models.BinaryField(help_text=_('Initialization vector; the key is the file key'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('file chunk')
+        verbose_name_plural = _('file chunks')
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'digest'], name='chunk_file_digest_unique'),
+        ]
+        indexes = [
+            # The garbage collector looks up blob names in batches.
+            models.Index(fields=['blob'], name='chunk_blob_idx'),
+        ]
+        
+    def __str__(self):
+        return f'{self.digest[:12]} of {self.file_id}'
+
+
+class FileVersion(models.Model):
+    """A version of a file: the ordered list of its chunks."""
+    
+    file = models.ForeignKey(
+        EncryptedFile,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    number = models.PositiveIntegerField()
+    size = models.BigIntegerField(help_text=_('File size in bytes'))
+    checksum = models.CharField(max_length=64, help_text=_('SHA-256 of the chunk digests'))
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('file version')
+        verbose_name_plural = _('file versions')
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'number'], name='version_file_number_unique'),
+        ]
+        
+    def __str__(self):
+        return f'{self.file_id} v{self.number}'
+
+
+class VersionChunk(models.Model):
+    """The chunk at one position of a version."""
+    
+    version = models.ForeignKey(
+        FileVersion,
+        on_delete=models.CASCADE,
+        related_name='entries'
+    )
+    chunk = models.ForeignKey(
+        FileChunk,
+        on_delete=models.PROTECT,
+        related_name='+'
+    )
+    position = models.PositiveIntegerField()
+    offset = models.BigIntegerField(help_text=_('Offset of the chunk in the version'))
+    
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'position'], name='entry_version_position_unique'),
+        ]
+
+
+class FileChange(models.Model):
+    """
+    An entry in one user's change feed. ``id`` is the feed cursor; a change
+    seen by several users has a row for each of them.
+    """
+    
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    SHARED = 'shared'
+    UNSHARED = 'unshared'
+    ACTION_CHOICES = (
+        (CREATED, _('Created')),
+        (UPDATED, _('Updated')),
+        (DELETED, _('Deleted')),
+        (SHARED, _('Shared')),
+        (UNSHARED, _('Unshared')),
+    )
+    
+    # Not database constraints: the rows outlive their files (a deletion is
+    # a change too) and are removed by the garbage collector when expired.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+'
+    )
+    file = models.ForeignKey(
+        EncryptedFile,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+'
+    )
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('file change')
+        verbose_name_plural = _('file changes')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'id'], name='change_user_cursor_idx'),
+        ]
+        
+    def __str__(self):
+        return f'{self.action} {self.file_id} for {self.user_id}'
@@ -10,13 +10,13 @@ class IsOwnerOrSharedWith(permissions.BasePermission):
         # Write permissions are only allowed to the owner
         if request.method in permissions.SAFE_METHODS:
             return (
-                obj.owner == request.user or
+                obj.owner_id == request.user.id or
                 obj.shares.filter(shared_with=request.user).exists()
             )
         
         # For write operations, check if user has write permission
         return (
-            obj.owner == request.user or
+            obj.owner_id == request.user.id or
             obj.shares.filter(
                 shared_with=request.user,
                 can_write=True
@@ -0,0 +1,98 @@
+"""
+Encrypted thumbnails of image files.
+
+Once an image upload is encrypted, a ``files.build_preview`` job decrypts it,
+scales it to fit in ``PREVIEW_MAX_DIMENSION`` pixels and stores the JPEG in
+``EncryptedFile.preview``, encrypted under the file's own key with a fresh IV.
+The preview endpoint serves that blob, a few kilobytes, so a gallery never
+has to fetch the full-size images. A preview that is missing (the file
+predates previews) or lost is queued for rebuilding when it is first asked
+for. Content Pillow cannot render is marked ``preview_failed`` instead, so
+it is not decrypted again until a new version replaces it.
+"""
+
+import io
+import logging
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config.tracing import span
+from jobs.queue import enqueue
+from . import versions
+from .encryption import encrypt_with_key
+from .models import EncryptedFile, get_file_path
+
+logger = logging.getLogger(__name__)
+
+PREVIEWABLE_TYPES = frozenset({
+    'image/bmp', 'image/gif', 'image/jpeg', 'image/png', 'image/tiff', 'image/webp',
+})
+PREVIEW_CONTENT_TYPE = 'image/jpeg'
+
+# Decrypted sources up to this size are rendered from memory.
+SPOOL_SIZE = 16 * 1024 * 1024
+# Requests for a missing preview within this many seconds share one job.
+REBUILD_DEBOUNCE_SECONDS = 60
+
+
+def previewable(file_obj):
+    return file_obj.mime_type in PREVIEWABLE_TYPES
+
+
+def render(source, max_dimension):
+    """JPEG bytes of the image in ``source``, scaled to fit ``max_dimension``."""
+    with Image.open(source) as image:
+        # JPEGs can be decoded at a fraction of their size directly.
+        image.draft('RGB', (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_dimension, max_dimension))
+    if image.mode != 'RGB':
+        # Flatten any transparency onto white; JPEG has no alpha channel.
+        image = image.convert('RGBA')
+        flat = Image.new('RGB', image.size, 'white')
+        flat.paste(image, mask=image.getchannel('A'))
+        image = flat
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=settings.PREVIEW_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def build(file_obj, storage=None):
+    """Render and store the preview of an image file; returns whether it did."""
+    storage = storage or default_storage
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as source:
+        for chunk in versions.iter_content(file_obj):
+            source.write(chunk)
+        source.seek(0)
+        try:
+            with span('preview.render', size=file_obj.size):
+                data = render(source, settings.PREVIEW_MAX_DIMENSION)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+            # Not an image Pillow can read after all; retrying will not help.
+            logger.warning('Cannot render a preview of %s: %s', file_obj.pk, exc)
+            EncryptedFile.objects.filter(
+                pk=file_obj.pk, checksum=file_obj.checksum
+            ).update(preview_failed=True)
+            return False
+
+    encrypted, iv = encrypt_with_key(data, file_obj.encryption_key)
+    name = storage.save(get_file_path(None, 'preview.jpg'), encrypted)
+    updated = EncryptedFile.objects.filter(
+        pk=file_obj.pk, checksum=file_obj.checksum
+    ).update(preview=name, preview_iv=iv)
+    if not updated:
+        # Deleted or replaced while we rendered.
+        storage.delete(name)
+        return False
+    if file_obj.preview and file_obj.preview.name != name:
+        storage.delete(file_obj.preview.name)
+    return True
+
+
+def request_rebuild(file_obj):
+    """Queue a job to rebuild a missing preview, unless one was just queued."""
+    if cache.add(f'preview-rebuild:{file_obj.pk}', True, REBUILD_DEBOUNCE_SECONDS):
+        enqueue('files.build_preview', {'file_id': str(file_obj.pk)})
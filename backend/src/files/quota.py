@@ -0,0 +1,169 @@
+"""
+Per-user storage quotas.
+
+``User.storage_used`` and ``User.file_count`` are denormalized counters of the
+user's files. ``reserve`` and ``release`` adjust them with a single UPDATE in
+the transaction that creates or deletes the file row, so they stay in step
+without ever summing ``EncryptedFile.size``. ``reserve`` only matches while the
+file still fits, which makes the quota check and the increment one atomic
+step even with concurrent uploads.
+
+Chunks uploaded for a version are only counted once the version is
+committed; until then ``check_chunk`` counts them against the free space,
+so uncommitted chunks cannot pile up beyond the quota either.
+
+A user's quota is ``User.storage_quota``, or ``STORAGE_QUOTA_DEFAULT`` when
+that is empty (0 means unlimited). ``reconcile`` (``manage.py
+reconcile_quotas``) recounts the counters where they drifted, e.g. after
+rows were deleted outside the API.
+"""
+
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.template.defaultfilters import filesizeformat
+from rest_framework import exceptions, status
+from .models import EncryptedFile, FileChunk, VersionChunk
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Room for the multipart framing and form fields around an uploaded file: a
+# request body exceeding the free space by more than this cannot fit.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class QuotaExceeded(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Storage quota exceeded.'
+    default_code = 'quota_exceeded'
+
+    def __init__(self, size, free):
+        super().__init__(
+            f'This upload needs {filesizeformat(size)} but only '
+            f'{filesizeformat(max(free, 0))} of your storage quota is free.'
+        )
+
+
+def quota_of(user):
+    """The user's quota in bytes, or None if unlimited."""
+    quota = user.storage_quota
+    if quota is None:
+        quota = settings.STORAGE_QUOTA_DEFAULT or None
+    return quota
+
+
+def check_content_length(request):
+    """
+    Reject an upload whose body cannot fit in the user's quota.
+
+    Runs before the body is read, using the counters loaded with
+    ``request.user``, so it costs no queries. Uploads without a
+    ``Content-Length`` are checked by ``reserve`` once their size is known.
+    """
+    quota = quota_of(request.user)
+    if quota is None:
+        return
+    try:
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return
+    free = quota - request.user.storage_used
+    if length - MULTIPART_OVERHEAD > free:
+        raise QuotaExceeded(length, free)
+
+
+def pending_chunk_bytes(owner_id):
+    """Bytes of the owner's uploaded chunks that no version uses yet."""
+    pending = FileChunk.objects.filter(file__owner_id=owner_id).exclude(
+        Exists(VersionChunk.objects.filter(chunk=OuterRef('pk')))
+    )
+    return pending.aggregate(total=Sum('size'))['total'] or 0
+
+
+def check_chunk(owner, size):
+    """
+    Reject a new chunk of ``size`` bytes that does not fit in ``owner``'s
+    quota together with the chunks not committed yet.
+    """
+    quota = quota_of(owner)
+    if quota is None:
+        return
+    free = quota - owner.storage_used - pending_chunk_bytes(owner.pk)
+    if size > free:
+        raise QuotaExceeded(size, free)
+
+
+def reserve(user, size, files=1):
+    """
+    Count ``size`` more bytes (a new file, unless ``files=0``) against
+    ``user``'s quota.
+
+    Call inside the transaction that creates the file. Raises
+    ``QuotaExceeded`` if it does not fit.
+    """
+    fits = Q(storage_used__lte=F('storage_quota') - size)
+    if settings.STORAGE_QUOTA_DEFAULT:
+        fits |= Q(storage_quota__isnull=True, storage_used__lte=settings.STORAGE_QUOTA_DEFAULT - size)
+    else:
+        fits |= Q(storage_quota__isnull=True)
+    updated = User.objects.filter(fits, pk=user.pk).update(
+        storage_used=F('storage_used') + size,
+        file_count=F('file_count') + files,
+    )
+    if not updated:
+        user.refresh_from_db(fields=['storage_quota', 'storage_used'])
+        raise QuotaExceeded(size, quota_of(user) - user.storage_used)
+
+
+def release(owner_id, size, files=1):
+    """Uncount deleted files; call inside the transaction that deletes them."""
+    User.objects.filter(pk=owner_id).update(
+        storage_used=F('storage_used') - size,
+        file_count=F('file_count') - files,
+    )
+
+
+@dataclass
+class Drift:
+    email: str
+    storage_used: int
+    actual_bytes: int
+    file_count: int
+    actual_files: int
+
+
+def reconcile(dry_run=False):
+    """Recount the counters that drifted from the users' files; returns the drifts."""
+    actual = {
+        row['owner_id']: (row['files'], row['bytes'])
+        for row in EncryptedFile.objects.values('owner_id')
+        .annotate(files=Count('id'), bytes=Sum('size')).order_by()
+    }
+    drifts = []
+    users = User.objects.only('pk', 'email', 'storage_used', 'file_count').order_by('pk')
+    for user in users.iterator():
+        files, used = actual.get(user.pk, (0, 0))
+        if (user.file_count, user.storage_used) == (files, used):
+            continue
+        if not dry_run:
+            # Lock the counters and count again, so uploads and deletes
+            # that ran since the first count are neither lost nor doubled.
+            with transaction.atomic():
+                User.objects.select_for_update().only('pk').filter(pk=user.pk).first()
+                totals = EncryptedFile.objects.filter(owner_id=user.pk).aggregate(
+                    files=Count('id'), bytes=Sum('size')
+                )
+                files, used = totals['files'], totals['bytes'] or 0
+                User.objects.filter(pk=user.pk).update(file_count=files, storage_used=used)
+            logger.info(
+                'Reconciled storage of %s: %d -> %d bytes, %d -> %d files',
+                user.email, user.storage_used, used, user.file_count, files
+            )
+        drifts.append(Drift(user.email, user.storage_used, used, user.file_count, files))
+    return drifts
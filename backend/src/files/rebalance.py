@@ -0,0 +1,111 @@
+"""
+Rebalancing of blobs across storage volumes.
+
+Each volume's fair share of the stored bytes is proportional to its weight
+times its capacity. Blobs move from the volume furthest above its share to the
+one furthest below it until every volume is within ``tolerance`` of its share
+(as a fraction of all stored bytes) or ``max_files`` blobs have moved.
+
+A move copies the blob, repoints the row and queues deletion of the old copy
+``BLOB_MOVE_GRACE_SECONDS`` later, so downloads that already looked up the
+old name still find it. The cold tier (``TIER_COLD_VOLUME``) is managed by
+``files.tiering`` and left out of rebalancing.
+"""
+
+import logging
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Sum
+from jobs.queue import enqueue
+from .models import EncryptedFile
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RebalanceReport:
+    dry_run: bool = False
+    files_moved: int = 0
+    bytes_moved: int = 0
+    done: bool = False
+    usage: dict = field(default_factory=dict)
+    targets: dict = field(default_factory=dict)
+
+
+def hot_volumes(storage):
+    return {
+        name: volume for name, volume in storage.volumes.items()
+        if name != settings.TIER_COLD_VOLUME
+    }
+
+
+def targets(volumes, usage):
+    total = sum(usage.values())
+    shares = {
+        name: volume.weight * volume.disk_usage().total
+        for name, volume in volumes.items()
+    }
+    norm = sum(shares.values()) or 1
+    return {name: total * share / norm for name, share in shares.items()}
+
+
+def move_blob(file_obj, volume, storage=None):
+    """Copy ``file_obj``'s blob to ``volume`` and repoint the row."""
+    storage = storage or default_storage
+    old = file_obj.file.name
+    new = storage.copy_to_volume(old, volume)
+    tier = EncryptedFile.COLD if volume == settings.TIER_COLD_VOLUME else EncryptedFile.HOT
+    updated = EncryptedFile.objects.filter(pk=file_obj.pk, file=old).update(
+        file=new, volume=volume, tier=tier
+    )
+    if updated:
+        enqueue('files.delete_blob', {'name': old}, delay=settings.BLOB_MOVE_GRACE_SECONDS)
+    else:
+        # The file was deleted or replaced meanwhile.
+        storage.delete_exact(new)
+    return bool(updated)
+
+
+def rebalance(max_files=100, tolerance=0.05, dry_run=False, storage=None):
+    storage = storage or default_storage
+    volumes = hot_volumes(storage)
+    usage = dict.fromkeys(volumes, 0)
+    usage.update(
+        EncryptedFile.objects.filter(status=EncryptedFile.READY, tier=EncryptedFile.HOT)
+        .values_list('volume')
+        .annotate(Sum('size'))
+    )
+    report = RebalanceReport(dry_run=dry_run, usage=usage, targets=targets(volumes, usage))
+    slack = tolerance * sum(usage.values())
+    # Rows may name volumes that are no longer configured; leave them alone.
+    known = [name for name in usage if name in volumes]
+    picked = set()
+
+    while report.files_moved < max_files:
+        donor = max(known, key=lambda name: usage[name] - report.targets[name])
+        receiver = max(known, key=lambda name: report.targets[name] - usage[name])
+        excess = usage[donor] - report.targets[donor]
+        deficit = report.targets[receiver] - usage[receiver]
+        if donor == receiver or excess <= slack or deficit <= slack:
+            report.done = True
+            break
+
+        file_obj = EncryptedFile.objects.filter(
+            volume=donor, status=EncryptedFile.READY, tier=EncryptedFile.HOT,
+            size__lte=min(excess, deficit)
+        ).exclude(pk__in=picked).order_by('-size').first()
+        if file_obj is None:
+            report.done = True
+            break
+        picked.add(file_obj.pk)
+
+        if not dry_run and not move_blob(file_obj, receiver, storage):
+            continue
+        usage[donor] -= file_obj.size
+        usage[receiver] += file_obj.size
+        report.files_moved += 1
+        report.bytes_moved += file_obj.size
+        logger.info('Moved %s (%d bytes) from %s to %s', file_obj.pk, file_obj.size, donor, receiver)
+    return report
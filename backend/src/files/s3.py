@@ -0,0 +1,494 @@
+"""
+Streaming storage backend for S3-compatible object stores.
+
+``S3Storage`` talks to the store with a small standard-library client:
+requests are signed with AWS Signature Version 4 and sent over a pool of
+keep-alive ``http.client`` connections. Nothing is buffered whole:
+
+* Saving streams ``content.chunks()`` into a multipart upload. Parts of
+  ``S3_PART_SIZE`` bytes are uploaded by a thread pool, and at most
+  ``S3_MAX_IN_FLIGHT_PARTS`` parts per upload are held in memory; the writer
+  blocks until a slot frees up. Blobs smaller than one part use a single PUT.
+* Reading opens one streaming GET, and ``S3File.read_range`` fetches just a
+  byte range, which is what partial (``Range``) downloads use.
+
+Enable it with ``BLOB_STORAGE_BACKEND=files.s3.S3Storage`` and the ``S3_*``
+settings.
+"""
+
+import datetime
+import hashlib
+import hmac
+import http.client
+import queue
+import threading
+import urllib.parse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+# S3 rejects multipart parts smaller than this, except the last one.
+MIN_PART_SIZE = 5 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+S3_NS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+class S3Error(OSError):
+    """An error response from the object store."""
+
+    def __init__(self, status, code, message):
+        super().__init__(f'{status} {code}: {message}')
+        self.status = status
+        self.code = code
+
+    @classmethod
+    def from_response(cls, status, body):
+        code = message = ''
+        try:
+            root = ET.fromstring(body)
+            code = root.findtext('Code', '')
+            message = root.findtext('Message', '')
+        except ET.ParseError:
+            message = body[:200].decode(errors='replace')
+        if status == 404:
+            return FileNotFoundError(f'{status} {code}: {message}')
+        return cls(status, code, message)
+
+
+def _quote(value, safe='-_.~'):
+    return urllib.parse.quote(str(value), safe=safe)
+
+
+def canonical_query(query):
+    return '&'.join(f'{_quote(k)}={_quote(v)}' for k, v in sorted(query.items()))
+
+
+def sign_v4(method, host, path, query, headers, payload_hash,
+            access_key, secret_key, region, service='s3'):
+    """
+    Return the ``Authorization`` header for a request.
+
+    ``path`` must already be URI-encoded, and ``headers`` must contain the
+    ``x-amz-date`` to sign with. All of ``headers`` plus ``host`` are signed.
+    """
+    amz_date = headers['x-amz-date']
+    scope = f'{amz_date[:8]}/{region}/{service}/aws4_request'
+    signed = {name.lower(): ' '.join(str(value).split()) for name, value in headers.items()}
+    signed['host'] = host
+    names = sorted(signed)
+    canonical_request = '\n'.join([
+        method,
+        path,
+        canonical_query(query),
+        ''.join(f'{name}:{signed[name]}\n' for name in names),
+        ';'.join(names),
+        payload_hash,
+    ])
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256',
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ])
+    key = f'AWS4{secret_key}'.encode()
+    for part in (amz_date[:8], region, service, 'aws4_request'):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return (
+        f'AWS4-HMAC-SHA256 Credential={access_key}/{scope}, '
+        f'SignedHeaders={";".join(names)}, Signature={signature}'
+    )
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one endpoint, reused LIFO."""
+
+    def __init__(self, endpoint_url, size=10, timeout=60):
+        parts = urllib.parse.urlsplit(endpoint_url)
+        self.host = parts.netloc
+        self._connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connection_class(self.host, timeout=self.timeout)
+
+    def release(self, conn):
+        if self._idle.qsize() < self.size:
+            self._idle.put_nowait(conn)
+        else:
+            conn.close()
+
+    def request(self, method, url, headers, body):
+        """Send a request and return ``(connection, response)``."""
+        for attempt in range(2):
+            conn = self._get()
+            try:
+                conn.request(method, url, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection; retry once
+                # on a fresh one.
+                conn.close()
+                if attempt:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def clear(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class S3Response:
+    """A streaming response body; returns its connection to the pool when drained."""
+
+    def __init__(self, pool, conn, response):
+        self._pool = pool
+        self._conn = conn
+        self.response = response
+        self.headers = response.headers
+
+    def read(self, size=None):
+        data = self.response.read(size) if size else self.response.read()
+        if self.response.isclosed() and self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+        return data
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self.response.isclosed():
+            self._pool.release(self._conn)
+        else:
+            # Unread body left on the socket; the connection cannot be reused.
+            self._conn.close()
+        self._conn = None
+
+
+class S3Client:
+    """Minimal path-style S3 client for one bucket."""
+
+    def __init__(self, endpoint_url, bucket, access_key, secret_key,
+                 region='us-east-1', pool_size=10, timeout=60):
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.pool = ConnectionPool(endpoint_url, pool_size, timeout)
+
+    def request(self, method, key='', query=None, headers=None, body=b'',
+                expect=(200,), stream=False):
+        query = query or {}
+        path = _quote(f'/{self.bucket}/{key}' if key else f'/{self.bucket}', safe='/-_.~')
+        payload_hash = hashlib.sha256(body).hexdigest()
+        headers = dict(
+            headers or {},
+            **{
+                'x-amz-date': datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ'),
+                'x-amz-content-sha256': payload_hash,
+            }
+        )
+        headers['Authorization'] = sign_v4(
+            method, self.pool.host, path, query, headers, payload_hash,
+            self.access_key, self.secret_key, self.region
+        )
+        url = f'{path}?{canonical_query(query)}' if query else path
+        conn, response = self.pool.request(method, url, headers, body or None)
+
+        if response.status not in expect:
+            error_body = response.read()
+            self.pool.release(conn)
+            raise S3Error.from_response(response.status, error_body)
+        result = S3Response(self.pool, conn, response)
+        if not stream:
+            result.body = result.read()
+        return result
+
+    def head_object(self, key):
+        return self.request('HEAD', key).headers
+
+    def get_object(self, key, start=None, end=None):
+        """Stream an object, or the inclusive byte range ``start``-``end`` of it."""
+        headers = {}
+        if start is not None:
+            headers['Range'] = f'bytes={start}-{"" if end is None else end}'
+        return self.request('GET', key, headers=headers, expect=(200, 206), stream=True)
+
+    def put_object(self, key, data):
+        self.request('PUT', key, body=data)
+
+    def delete_object(self, key):
+        self.request('DELETE', key, expect=(200, 204))
+
+    def list_objects(self, prefix='', delimiter=''):
+        """Yield ``(common_prefixes, [(key, size), ...])`` page by page."""
+        query = {'list-type': '2', 'prefix': prefix}
+        if delimiter:
+            query['delimiter'] = delimiter
+        while True:
+            root = ET.fromstring(self.request('GET', query=query).body)
+            prefixes = [p.findtext(f'{S3_NS}Prefix') for p in root.iter(f'{S3_NS}CommonPrefixes')]
+            objects = [
+                (c.findtext(f'{S3_NS}Key'), int(c.findtext(f'{S3_NS}Size')))
+                for c in root.iter(f'{S3_NS}Contents')
+            ]
+            yield prefixes, objects
+            token = root.findtext(f'{S3_NS}NextContinuationToken')
+            if root.findtext(f'{S3_NS}IsTruncated') != 'true' or not token:
+                return
+            query['continuation-token'] = token
+
+    def create_multipart_upload(self, key):
+        root = ET.fromstring(self.request('POST', key, query={'uploads': ''}).body)
+        return root.findtext(f'{S3_NS}UploadId')
+
+    def upload_part(self, key, upload_id, number, data):
+        response = self.request(
+            'PUT', key, query={'partNumber': str(number), 'uploadId': upload_id}, body=data
+        )
+        return response.headers['ETag']
+
+    def complete_multipart_upload(self, key, upload_id, etags):
+        root = ET.Element('CompleteMultipartUpload')
+        for number, etag in sorted(etags.items()):
+            part = ET.SubElement(root, 'Part')
+            ET.SubElement(part, 'PartNumber').text = str(number)
+            ET.SubElement(part, 'ETag').text = etag
+        self.request('POST', key, query={'uploadId': upload_id}, body=ET.tostring(root))
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.request('DELETE', key, query={'uploadId': upload_id}, expect=(200, 204))
+
+
+class MultipartWriter:
+    """
+    File-like sink that uploads everything written to it as one object.
+
+    Full parts are uploaded in the background; ``write`` blocks while
+    ``max_in_flight`` parts are pending, so memory stays bounded by about
+    ``(max_in_flight + 1) * part_size``.
+    """
+
+    def __init__(self, client, key, executor, part_size, max_in_flight):
+        self.client = client
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._executor = executor
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._etags = {}
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(part)
+
+    def _submit(self, data):
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(self.key)
+        self._slots.acquire()
+        for future in self._futures:
+            if future.done() and future.exception():
+                self._slots.release()
+                raise future.exception()
+        number = len(self._futures) + 1
+        self._futures.append(self._executor.submit(self._upload_part, number, data))
+
+    def _upload_part(self, number, data):
+        try:
+            self._etags[number] = self.client.upload_part(self.key, self._upload_id, number, data)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Finish the upload; on error the multipart upload is aborted."""
+        try:
+            if self._upload_id is None:
+                self.client.put_object(self.key, bytes(self._buffer))
+                return
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            for future in self._futures:
+                future.result()
+            self.client.complete_multipart_upload(self.key, self._upload_id, self._etags)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        if self._upload_id is None:
+            return
+        for future in self._futures:
+            future.cancel()
+        try:
+            self.client.abort_multipart_upload(self.key, self._upload_id)
+        except OSError:
+            pass
+        self._upload_id = None
+
+
+class S3File(File):
+    """Read-only object handle with seek support and ranged reads."""
+
+    def __init__(self, storage, name):
+        self._storage = storage
+        self.name = name
+        self.mode = 'rb'
+        self.file = None
+        self._position = 0
+        self._stream = None
+
+    @cached_property
+    def size(self):
+        return self._storage.size(self.name)
+
+    @property
+    def closed(self):
+        return self._stream is None
+
+    def open(self, mode='rb'):
+        self.seek(0)
+        return self
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self.size
+        if offset != self._position or self._stream is None:
+            self.close()
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        if self._stream is None:
+            self._stream = self._storage.client.get_object(self.name, start=self._position)
+        data = self._stream.read(size if size and size > 0 else None)
+        self._position += len(data)
+        return data
+
+    def read_range(self, offset, length, chunk_size=READ_CHUNK_SIZE):
+        """Yield ``length`` bytes from ``offset`` using one ranged GET."""
+        if length <= 0:
+            return
+        stream = self._storage.client.get_object(self.name, start=offset, end=offset + length - 1)
+        try:
+            while True:
+                data = stream.read(chunk_size)
+                if not data:
+                    return
+                yield data
+        finally:
+            stream.close()
+
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        while True:
+            data = self.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+@deconstructible
+class S3Storage(Storage):
+    """Django storage backed by an S3-compatible bucket."""
+
+    def __init__(self, endpoint_url=None, bucket=None, access_key=None, secret_key=None,
+                 region=None, part_size=None, max_in_flight=None, pool_size=None):
+        self.options = {
+            'endpoint_url': endpoint_url or settings.S3_ENDPOINT_URL,
+            'bucket': bucket or settings.S3_BUCKET,
+            'access_key': access_key or settings.S3_ACCESS_KEY_ID,
+            'secret_key': secret_key or settings.S3_SECRET_ACCESS_KEY,
+            'region': region or settings.S3_REGION,
+            'pool_size': pool_size or settings.S3_POOL_SIZE,
+            'timeout': settings.S3_TIMEOUT,
+        }
+        self.part_size = part_size or settings.S3_PART_SIZE
+        self.max_in_flight = max_in_flight or settings.S3_MAX_IN_FLIGHT_PARTS
+
+    @cached_property
+    def client(self):
+        return S3Client(**self.options)
+
+    @cached_property
+    def executor(self):
+        return ThreadPoolExecutor(
+            max_workers=self.options['pool_size'],
+            thread_name_prefix='s3-upload'
+        )
+
+    def writer(self, name):
+        return MultipartWriter(self.client, name, self.executor, self.part_size, self.max_in_flight)
+
+    def _save(self, name, content):
+        writer = self.writer(name)
+        try:
+            for chunk in content.chunks():
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        return name
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('S3 objects can only be opened for reading.')
+        return S3File(self, name)
+
+    def delete(self, name):
+        self.client.delete_object(name)
+
+    def exists(self, name):
+        try:
+            self.client.head_object(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name):
+        return int(self.client.head_object(name)['Content-Length'])
+
+    def get_modified_time(self, name):
+        return parsedate_to_datetime(self.client.head_object(name)['Last-Modified'])
+
+    def listdir(self, path):
+        prefix = f'{path.strip("/")}/' if path.strip('/') else ''
+        directories, files = [], []
+        for prefixes, objects in self.client.list_objects(prefix, delimiter='/'):
+            directories += [p[len(prefix):].rstrip('/') for p in prefixes]
+            files += [key[len(prefix):] for key, _ in objects]
+        return directories, files
@@ -1,6 +1,7 @@
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import EncryptedFile, FileShare, ShareableLink
+from .models import EncryptedFile, FileChange, FileShare, FileVersion, ShareableLink
 
 User = get_user_model()
 
@@ -14,18 +15,22 @@ class EncryptedFileSerializer(serializers.ModelSerializer):
     """Serializer for encrypted files."""
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     shared_with = serializers.SerializerMethodField()
+    has_preview = serializers.SerializerMethodField()
     
     class Meta:
         model = EncryptedFile
         fields = (
-            'id', 'name', 'owner_username', 'mime_type',
-            'size', 'created_at', 'updated_at', 'shared_with'
+            'id', 'name', 'owner_username', 'mime_type', 'size', 'checksum',
+            'version', 'status', 'has_preview', 'created_at', 'updated_at', 'shared_with'
         )
         read_only_fields = (
-            'id', 'owner_username', 'mime_type', 'size',
-            'created_at', 'updated_at', 'shared_with'
+            'id', 'owner_username', 'mime_type', 'size', 'checksum', 'version', 'status',
+            'has_preview', 'created_at', 'updated_at', 'shared_with'
         )
     
+    def get_has_preview(self, obj):
+        return bool(obj.preview)
+    
     def get_shared_with(self, obj):
         shares = obj.shares.all()
         return [
@@ -37,6 +42,24 @@ class EncryptedFileSerializer(serializers.ModelSerializer):
         ]
 
 
+class FileVersionSerializer(serializers.ModelSerializer):
+    """Serializer for file versions."""
+    created_by = serializers.EmailField(source='created_by.email', read_only=True, default=None)
+    
+    class Meta:
+        model = FileVersion
+        fields = ('number', 'size', 'checksum', 'created_by', 'created_at')
+        read_only_fields = fields
+
+
+class ChunkListSerializer(serializers.Serializer):
+    """Serializer for a list of chunk digests, in file order."""
+    chunks = serializers.ListField(
+        child=serializers.RegexField(r'^[0-9a-f]{64}$'),
+        allow_empty=True
+    )
+
+
 class FileShareSerializer(serializers.ModelSerializer):
     """Serializer for file sharing."""
     shared_with_username = serializers.CharField(write_only=True)
@@ -75,6 +98,101 @@ class FileShareSerializer(serializers.ModelSerializer):
             )
 
 
+class FileFilterSerializer(serializers.Serializer):
+    """Filter selecting files for a bulk operation."""
+    name = serializers.CharField(required=False)
+    mime_type = serializers.CharField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    shared_with = serializers.EmailField(required=False)
+
+
+class LinkFilterSerializer(serializers.Serializer):
+    """Filter selecting shareable links for a bulk operation."""
+    file = serializers.ListField(child=serializers.UUIDField(), required=False)
+    expired = serializers.BooleanField(required=False)
+
+
+class BulkSelectionSerializer(serializers.Serializer):
+    """Selects the targets of a bulk operation by ``ids`` or by ``filter``."""
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+    filter = FileFilterSerializer(required=False)
+    
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError('Give either ids or a filter.')
+        if len(attrs.get('ids', ())) > settings.BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f'At most {settings.BULK_MAX_ITEMS} items can be changed at once.'
+            )
+        return attrs
+    
+    @property
+    def selection(self):
+        """Keyword arguments selecting the targets in ``files.bulk``."""
+        return {
+            'ids': self.validated_data.get('ids'),
+            'filters': self.validated_data.get('filter'),
+        }
+
+
+class BulkLinkSelectionSerializer(BulkSelectionSerializer):
+    filter = LinkFilterSerializer(required=False)
+
+
+class BulkShareSerializer(BulkSelectionSerializer):
+    """Selects files and the user to share them with (or stop sharing)."""
+    email = serializers.EmailField()
+    can_write = serializers.BooleanField(default=False)
+    
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        try:
+            attrs['recipient'] = User.objects.get(email=attrs.pop('email'))
+        except User.DoesNotExist:
+            raise serializers.ValidationError({'email': 'No user has this email address.'})
+        if attrs['recipient'] == self.context['request'].user:
+            raise serializers.ValidationError('You cannot share a file with yourself.')
+        return attrs
+
+
+class BatchShareSerializer(serializers.Serializer):
+    """Serializer for sharing one file with many users."""
+    emails = serializers.ListField(child=serializers.EmailField(), allow_empty=False)
+    can_write = serializers.BooleanField(default=False)
+    
+    def validate_emails(self, emails):
+        if len(emails) > settings.BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f'At most {settings.BULK_MAX_ITEMS} users can be added at once.'
+            )
+        return emails
+
+
+class FileChangeSerializer(serializers.ModelSerializer):
+    """Serializer for change feed entries."""
+    cursor = serializers.IntegerField(source='id', read_only=True)
+    file = serializers.UUIDField(source='file_id', read_only=True)
+    
+    class Meta:
+        model = FileChange
+        fields = ('cursor', 'file', 'action', 'created_at')
+        read_only_fields = fields
+
+
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    """Query parameters of the change feed."""
+    cursor = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, required=False)
+    wait = serializers.IntegerField(min_value=0, required=False)
+    
+    def validate_limit(self, limit):
+        return min(limit, settings.CHANGE_FEED_PAGE_SIZE)
+    
+    def validate_wait(self, wait):
+        return min(wait, settings.CHANGE_FEED_MAX_WAIT_SECONDS)
+
+
 class ShareableLinkSerializer(serializers.ModelSerializer):
     """Serializer for shareable links."""
     url = serializers.SerializerMethodField()
@@ -0,0 +1,251 @@
+"""
+Blob storage layout.
+
+Encrypted blobs live in nested directories named after a hash of their file
+name, ``encrypted_files/3f/a2/<uuid>.<ext>``, so no directory grows beyond a
+few hundred entries. Blobs written before that layout sit directly in
+``encrypted_files/``; ``manage.py shard_blobs`` moves them.
+
+A blob's flat and sharded names are derived from the same file name, so
+``BlobStorage`` falls back to the other one when a name is not found. Rows
+that still point at a flat name keep working while the migration moves their
+blob, and vice versa.
+
+``VolumeStorage`` spreads blobs over the local volumes in
+``settings.BLOB_VOLUMES``. Names of blobs outside the default volume
+(``MEDIA_ROOT``) carry the volume as a prefix, ``<volume>:<name>``, so reads
+go straight to the right volume.
+"""
+
+import hashlib
+import os
+import posixpath
+import random
+import shutil
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage
+from django.core.signals import setting_changed
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+BLOB_ROOT = 'encrypted_files'
+
+
+def _shard(basename):
+    digest = hashlib.sha1(basename.encode()).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def sharded_name(name):
+    """``encrypted_files/x.bin`` -> ``encrypted_files/ab/cd/x.bin``."""
+    basename = posixpath.basename(name)
+    return posixpath.join(BLOB_ROOT, *_shard(basename), basename)
+
+
+def is_sharded(name):
+    return name == sharded_name(name)
+
+
+def alternate_name(name):
+    """The other location of a blob (flat <-> sharded), or None."""
+    if not name.startswith(BLOB_ROOT + '/'):
+        return None
+    if is_sharded(name):
+        return posixpath.join(BLOB_ROOT, posixpath.basename(name))
+    if posixpath.dirname(name) == BLOB_ROOT:
+        return sharded_name(name)
+    return None
+
+
+class BlobStorage(FileSystemStorage):
+    """File system storage that resolves blobs at either layout location."""
+
+    def _resolve(self, name):
+        if super().exists(name):
+            return name
+        alternate = alternate_name(name)
+        if alternate and super().exists(alternate):
+            return alternate
+        return name
+
+    def _open(self, name, mode='rb'):
+        try:
+            return super()._open(name, mode)
+        except FileNotFoundError:
+            alternate = alternate_name(name)
+            if alternate is None:
+                raise
+            return super()._open(alternate, mode)
+
+    def exists(self, name):
+        if super().exists(name):
+            return True
+        alternate = alternate_name(name)
+        return bool(alternate) and super().exists(alternate)
+
+    def size(self, name):
+        return super().size(self._resolve(name))
+
+    def get_modified_time(self, name):
+        return super().get_modified_time(self._resolve(name))
+
+    def delete(self, name):
+        # Both names refer to the same blob, so remove whichever exists.
+        super().delete(name)
+        alternate = alternate_name(name)
+        if alternate:
+            super().delete(alternate)
+
+    def delete_exact(self, name):
+        """Delete ``name`` only, not the blob's other location."""
+        super().delete(name)
+
+    def link(self, source, target):
+        """Make ``source`` available as ``target`` too (hard link if possible)."""
+        target_path = self.path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(self.path(source), target_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copy2(self.path(source), target_path)
+
+
+DEFAULT_VOLUME = 'default'
+
+
+def split_volume(name):
+    """``'disk2:encrypted_files/x'`` -> ``('disk2', 'encrypted_files/x')``."""
+    volume, sep, inner = name.partition(':')
+    if not sep:
+        return DEFAULT_VOLUME, name
+    return volume, inner
+
+
+def volume_of(name):
+    return split_volume(name)[0]
+
+
+@dataclass
+class Volume:
+    name: str
+    storage: BlobStorage
+    weight: float
+
+    def disk_usage(self):
+        os.makedirs(self.storage.location, exist_ok=True)
+        return shutil.disk_usage(self.storage.location)
+
+    def join(self, inner):
+        return inner if self.name == DEFAULT_VOLUME else f'{self.name}:{inner}'
+
+
+@deconstructible
+class VolumeStorage(Storage):
+    """
+    Blob storage spread over several local volumes.
+
+    New blobs go to a volume picked at random, weighted by ``weight`` times
+    free bytes; volumes with less than ``BLOB_VOLUME_MIN_FREE`` bytes free or
+    a weight of 0 (draining) get nothing, nor does ``TIER_COLD_VOLUME``.
+    Without ``BLOB_VOLUMES`` everything stays in ``MEDIA_ROOT``, as before.
+    """
+
+    def __init__(self):
+        setting_changed.connect(self._settings_changed)
+
+    def _settings_changed(self, setting, **kwargs):
+        if setting in ('BLOB_VOLUMES', 'MEDIA_ROOT'):
+            self.__dict__.pop('volumes', None)
+
+    @cached_property
+    def volumes(self):
+        configured = settings.BLOB_VOLUMES
+        volumes = {
+            name: Volume(name, BlobStorage(location=spec['path']), spec.get('weight', 1.0))
+            for name, spec in configured.items()
+            if name != DEFAULT_VOLUME
+        }
+        default = configured.get(DEFAULT_VOLUME, {})
+        # Blobs without a volume prefix always live in MEDIA_ROOT. It only
+        # takes new blobs if no other volume is configured or it is listed.
+        volumes[DEFAULT_VOLUME] = Volume(
+            DEFAULT_VOLUME,
+            BlobStorage(),
+            default.get('weight', 1.0 if DEFAULT_VOLUME in configured or not volumes else 0.0),
+        )
+        return volumes
+
+    @property
+    def blob_roots(self):
+        """Top-level blob directories, one per volume (used by the GC)."""
+        return [volume.join(BLOB_ROOT) for volume in self.volumes.values()]
+
+    def choose_volume(self, exclude=()):
+        candidates, scores = [], []
+        for volume in self.volumes.values():
+            if volume.name in exclude:
+                continue
+            free = volume.disk_usage().free - settings.BLOB_VOLUME_MIN_FREE
+            if volume.weight > 0 and free > 0:
+                candidates.append(volume)
+                scores.append(volume.weight * free)
+        if not candidates:
+            raise OSError('No blob volume has enough free space.')
+        return random.choices(candidates, weights=scores)[0]
+
+    def _split(self, name):
+        volume, inner = split_volume(name)
+        try:
+            return self.volumes[volume], inner
+        except KeyError:
+            raise FileNotFoundError(f'Unknown blob volume {volume!r} in {name!r}.')
+
+    def save(self, name, content, max_length=None, volume=None):
+        # New blobs are hot; only tiering moves blobs to the cold volume.
+        if volume:
+            volume = self.volumes[volume]
+        else:
+            volume = self.choose_volume(exclude=(settings.TIER_COLD_VOLUME,))
+        return volume.join(volume.storage.save(name, content, max_length=max_length))
+
+    def copy_to_volume(self, name, volume):
+        """Copy a blob to another volume and return its new name."""
+        with self.open(name, 'rb') as source:
+            return self.save(split_volume(name)[1], source, volume=volume)
+
+    def _open(self, name, mode='rb'):
+        volume, inner = self._split(name)
+        return volume.storage._open(inner, mode)
+
+    def listdir(self, path):
+        volume, inner = self._split(path)
+        return volume.storage.listdir(inner)
+
+    def _delegate(method):
+        def delegated(self, name, *args, **kwargs):
+            volume, inner = self._split(name)
+            return getattr(volume.storage, method)(inner, *args, **kwargs)
+        delegated.__name__ = method
+        return delegated
+
+    delete = _delegate('delete')
+    delete_exact = _delegate('delete_exact')
+    exists = _delegate('exists')
+    size = _delegate('size')
+    path = _delegate('path')
+    url = _delegate('url')
+    get_accessed_time = _delegate('get_accessed_time')
+    get_created_time = _delegate('get_created_time')
+    get_modified_time = _delegate('get_modified_time')
+    del _delegate
+
+    def link(self, source, target):
+        volume, inner = self._split(source)
+        target_volume, target_inner = self._split(target)
+        if volume is not target_volume:
+            raise ValueError('Blobs can only be linked within a volume.')
+        volume.storage.link(inner, target_inner)
@@ -0,0 +1,170 @@
+"""Background jobs for the files app."""
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.utils import timezone
+from jobs.queue import enqueue, register
+from . import changes, versions
+from .chunking import iter_chunks
+from .encryption import encrypt_stream
+from .models import EncryptedFile, FileChange, get_file_path
+from .previews import build, previewable
+from .quota import QuotaExceeded
+from .storage import volume_of
+
+# Plaintext uploads waiting for their encryption job; readable by us only.
+staging_storage = FileSystemStorage(
+    location=settings.UPLOAD_STAGING_DIR,
+    file_permissions_mode=0o600,
+    directory_permissions_mode=0o700,
+)
+
+
+def _drop_staged(job):
+    staging_storage.delete(job.payload['staged_name'])
+
+
+def _mark_failed(job):
+    with transaction.atomic():
+        failed = EncryptedFile.objects.filter(
+            pk=job.payload['file_id'], status=EncryptedFile.PROCESSING
+        )
+        files = list(failed.values_list('pk', 'owner_id'))
+        if failed.update(status=EncryptedFile.FAILED):
+            changes.record(FileChange.UPDATED, files)
+    staging_storage.delete(job.payload['staged_name'])
+
+
+@register(
+    'files.encrypt_upload',
+    concurrency=settings.JOBS_ENCRYPT_CONCURRENCY,
+    max_attempts=3,
+    on_failure=_mark_failed,
+)
+def encrypt_upload(job):
+    """Encrypt a staged upload, store the blob and mark the file ready."""
+    file_id = job.payload['file_id']
+    staged_name = job.payload['staged_name']
+    file_obj = EncryptedFile.objects.filter(
+        pk=file_id, status=EncryptedFile.PROCESSING
+    ).only('name', 'mime_type', 'owner_id').first()
+    if file_obj is None:
+        # Deleted before we got to it.
+        staging_storage.delete(staged_name)
+        return {'file_id': file_id, 'skipped': True}
+
+    with staging_storage.open(staged_name, 'rb') as staged:
+        encrypted_data, key, iv = encrypt_stream(staged)
+        blob_name = default_storage.save(get_file_path(None, file_obj.name), encrypted_data)
+
+    with transaction.atomic():
+        updated = EncryptedFile.objects.filter(
+            pk=file_id, status=EncryptedFile.PROCESSING
+        ).update(
+            file=blob_name,
+            volume=volume_of(blob_name),
+            encryption_key=key,
+            encryption_iv=iv,
+            checksum=encrypted_data.checksum,
+            status=EncryptedFile.READY,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            changes.record(FileChange.UPDATED, [(file_obj.pk, file_obj.owner_id)])
+    if not updated:
+        default_storage.delete(blob_name)
+    elif previewable(file_obj):
+        enqueue('files.build_preview', {'file_id': file_id})
+    staging_storage.delete(staged_name)
+    return {'file_id': file_id}
+
+
+@register('files.delete_blob', concurrency=4, max_attempts=5)
+def delete_blob(job):
+    """Remove a deleted file's ciphertext from storage."""
+    default_storage.delete(job.payload['name'])
+
+
+@register('files.delete_blobs', concurrency=4, max_attempts=5)
+def delete_blobs(job):
+    """Remove the ciphertext of a batch of deleted files from storage."""
+    for name in job.payload['names']:
+        default_storage.delete(name)
+    return {'deleted': len(job.payload['names'])}
+
+
+@register('files.rebalance_volumes', concurrency=1, timeout=1800)
+def rebalance_volumes(job):
+    """Move a batch of blobs towards their volumes' fair share, then requeue."""
+    from .rebalance import rebalance
+    report = rebalance(max_files=job.payload.get('max_files', 100))
+    if not report.done:
+        enqueue('files.rebalance_volumes', job.payload, priority=job.priority)
+    return {'files_moved': report.files_moved, 'bytes_moved': report.bytes_moved, 'done': report.done}
+
+
+@register('files.tier_blobs', concurrency=1, timeout=1800)
+def tier_blobs(job):
+    """Demote a batch of blobs to the cold tier, then requeue."""
+    from .tiering import demote
+    report = demote(max_files=job.payload.get('max_files', 100))
+    if not report.done:
+        enqueue('files.tier_blobs', job.payload, priority=job.priority)
+    return {'files_demoted': report.files_demoted, 'bytes_demoted': report.bytes_demoted, 'done': report.done}
+
+
+@register('files.promote_blob', concurrency=2)
+def promote_blob(job):
+    """Move a cold file that was read back to a hot volume."""
+    from .tiering import promote
+    file_obj = EncryptedFile.objects.filter(
+        pk=job.payload['file_id'], tier=EncryptedFile.COLD, status=EncryptedFile.READY
+    ).only('pk', 'file', 'size').first()
+    if file_obj is None:
+        # Deleted, or already promoted by an earlier job.
+        return {'promoted': False}
+    return {'promoted': promote(file_obj)}
+
+
+@register('files.build_preview', concurrency=2)
+def build_preview(job):
+    """Render and store the encrypted thumbnail of an image file."""
+    file_obj = EncryptedFile.objects.filter(
+        pk=job.payload['file_id'], status=EncryptedFile.READY
+    ).first()
+    if file_obj is None:
+        # Deleted in the meantime.
+        return {'built': False}
+    return {'built': build(file_obj)}
+
+
+@register(
+    'files.create_version',
+    concurrency=settings.JOBS_ENCRYPT_CONCURRENCY,
+    max_attempts=3,
+    on_failure=_drop_staged,
+)
+def create_version(job):
+    """Chunk a staged upload and commit it as a new version of its file."""
+    file_id = job.payload['file_id']
+    staged_name = job.payload['staged_name']
+    file_obj = EncryptedFile.objects.filter(pk=file_id, status=EncryptedFile.READY).first()
+    if file_obj is None:
+        staging_storage.delete(staged_name)
+        return {'file_id': file_id, 'skipped': True}
+
+    digests, stored = [], 0
+    with staging_storage.open(staged_name, 'rb') as staged:
+        for data in iter_chunks(staged):
+            chunk, created = versions.store_chunk(file_obj, data)
+            digests.append(chunk.digest)
+            stored += created
+    try:
+        version = versions.commit(file_obj, digests, job.payload.get('user_id'))
+    except QuotaExceeded as exc:
+        # Retrying will not help; the chunks are collected once old enough.
+        staging_storage.delete(staged_name)
+        return {'file_id': file_id, 'error': str(exc.detail)}
+    staging_storage.delete(staged_name)
+    return {'file_id': file_id, 'version': version.number, 'chunks': len(digests), 'chunks_stored': stored}
@@ -1,3 +1,1459 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+from analytics.rollups import usage
+from audit.buffer import audit_log
+from config import memory
+from config.testing import EndpointBudgetTestCase
+from jobs.models import Job
+from jobs.queue import claim, run
+from . import changes, previews, quota, versions
+from .access import recorder
+from .chunking import iter_chunks
+from .encryption import encrypt_file
+from .gc import collect_garbage
+from .models import EncryptedFile, FileChange, FileChunk, FileShare, FileVersion, ShareableLink, get_file_path
+from .rebalance import rebalance
+from .storage import sharded_name
+from .tiering import demote
+
+User = get_user_model()
+
+PASSWORD = 'budget-test-password-1234'
+FILES_PER_USER = 2000
+LINKS_PER_USER = 500
+
+# Endpoint budgets: (max SQL queries, max seconds).
+BUDGETS = {
+    'file-list': (3, 3.0),
+    'file-list-shared': (3, 5.0),
+    'file-upload': (7, 1.0),
+    'file-detail': (3, 0.5),
+    'file-update': (9, 0.5),
+    'file-delete': (11, 0.5),
+    'file-download': (2, 0.5),
+    'file-download-shared': (3, 0.5),
+    'file-download-stream': (2, 0.5),
+    'file-preview': (2, 0.5),
+    'file-share': (8, 0.5),
+    'share-list': (2, 2.0),
+    'share-detail': (2, 0.5),
+    'share-delete': (6, 0.5),
+    'create-link': (3, 0.5),
+    'link-list': (2, 1.0),
+    'link-detail': (2, 0.5),
+    'link-delete': (3, 0.5),
+    'public-download': (2, 0.5),
+    'public-download-stream': (2, 0.5),
+    'chunking': (1, 0.5),
+    'missing-chunks': (3, 0.5),
+    'chunk-upload': (7, 0.5),
+    'version-list': (3, 0.5),
+    'version-commit': (13, 0.5),
+    'version-restore': (15, 0.5),
+    # Bulk writes of 2000 rows (and their change feed entries) are split
+    # into several statements by SQLite's limit on bound parameters.
+    'bulk-delete': (56, 2.0),
+    'bulk-share': (35, 2.0),
+    'bulk-unshare': (24, 2.0),
+    'bulk-link-revoke': (6, 1.0),
+    'file-share-batch': (12, 1.0),
+    'change-feed': (3, 0.5),
+    'change-feed-wait': (4, 0.5),
+}
+
+
+def image_bytes(format, size=(1200, 800), mode='RGBA'):
+    output = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(output, format)
+    return output.getvalue()
+
+
+class FileEndpointBudgetTests(EndpointBudgetTestCase):
+    """Query and latency budgets for every endpoint in files/urls.py."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner@example.com', PASSWORD, full_name='Owner')
+        cls.recipient = User.objects.create_user('recipient@example.com', PASSWORD, full_name='Recipient')
+        cls.other = User.objects.create_user('other@example.com', PASSWORD, full_name='Other')
+
+        for user in (cls.owner, cls.recipient):
+            EncryptedFile.objects.bulk_create([
+                EncryptedFile(
+                    owner=user,
+                    name=f'seed-{i}.txt',
+                    file=f'encrypted_files/seed-{user.pk}-{i}.txt',
+                    mime_type='text/plain',
+                    size=1024,
+                    encryption_key=b'',
+                    encryption_iv=b'',
+                )
+                for i in range(FILES_PER_USER)
+            ])
+        owner_files = list(EncryptedFile.objects.filter(owner=cls.owner))
+        FileShare.objects.bulk_create([
+            FileShare(file=f, shared_with=cls.recipient) for f in owner_files
+        ])
+        ShareableLink.objects.bulk_create([
+            ShareableLink(file=f, created_by=cls.owner) for f in owner_files[:LINKS_PER_USER]
+        ])
+
+        encrypted, key, iv = encrypt_file(ContentFile(b'budget test payload' * 512))
+        cls.file = EncryptedFile.objects.create(
+            owner=cls.owner,
+            name='payload.txt',
+            file=default_storage.save('encrypted_files/payload.txt', encrypted),
+            mime_type='text/plain',
+            size=19 * 512,
+            encryption_key=key,
+            encryption_iv=iv,
+        )
+        cls.share = FileShare.objects.create(file=cls.file, shared_with=cls.recipient)
+        cls.link = ShareableLink.objects.create(file=cls.file, created_by=cls.owner)
+
+    def budget(self, name):
+        return self.assertWithinBudget(name, *BUDGETS[name])
+
+    def test_list_files(self):
+        with self.budget('file-list'):
+            response = self.request('GET', reverse('files:file-list'), self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), FILES_PER_USER + 1)
+
+    def test_list_files_including_shared(self):
+        with self.budget('file-list-shared'):
+            response = self.request('GET', reverse('files:file-list'), self.recipient)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2 * FILES_PER_USER + 1)
+
+    def test_upload_file(self):
+        upload = SimpleUploadedFile('new.txt', b'x' * 4096, content_type='text/plain')
+        with self.budget('file-upload'):
+            response = self.request(
+                'POST', reverse('files:file-list'), self.owner,
+                data={'name': 'new.txt', 'file': upload}
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_retrieve_file(self):
+        with self.budget('file-detail'):
+            response = self.request('GET', reverse('files:file-detail', args=[self.file.pk]), self.owner)
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_file(self):
+        with self.budget('file-update'):
+            response = self.request(
+                'PATCH', reverse('files:file-detail', args=[self.file.pk]), self.owner,
+                data={'name': 'renamed.txt'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_file(self):
+        with self.budget('file-delete'):
+            response = self.request('DELETE', reverse('files:file-detail', args=[self.file.pk]), self.owner)
+        self.assertEqual(response.status_code, 204)
+
+    def test_download_file(self):
+        with self.budget('file-download'):
+            response = self.request('GET', reverse('files:file-download', args=[self.file.pk]), self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, b'budget test payload' * 512)
+
+    def test_download_shared_file(self):
+        with self.budget('file-download-shared'):
+            response = self.request('GET', reverse('files:file-download', args=[self.file.pk]), self.recipient)
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_file_stream(self):
+        with self.budget('file-download-stream'):
+            response = self.request('GET', reverse('files:file-download-stream', args=[self.file.pk]), self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, b'budget test payload' * 512)
+
+    def test_preview(self):
+        encrypted, key, iv = encrypt_file(ContentFile(image_bytes('PNG')))
+        image = EncryptedFile.objects.create(
+            owner=self.owner, name='photo.png', file=default_storage.save('encrypted_files/photo.png', encrypted),
+            mime_type='image/png', size=encrypted.size, encryption_key=key, encryption_iv=iv,
+        )
+        self.assertTrue(previews.build(image))
+        with self.budget('file-preview'):
+            response = self.request('GET', reverse('files:file-preview', args=[image.pk]), self.owner)
+        self.assertEqual(response.status_code, 200)
+
+    def test_share_file(self):
+        with self.budget('file-share'):
+            response = self.request(
+                'POST', reverse('files:file-share', args=[self.file.pk]), self.owner,
+                data={
+                    'shared_with': self.other.pk,
+                    'shared_with_username': self.other.email,
+                    'shared_with_email': self.other.email,
+                },
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_share_file_with_many_users(self):
+        team = User.objects.bulk_create([
+            User(email=f'member-{i}@example.com', full_name=f'Member {i}') for i in range(500)
+        ])
+        emails = [user.email for user in team] + [self.recipient.email, 'stranger@example.com']
+        with self.budget('file-share-batch'):
+            response = self.request(
+                'POST', reverse('files:file-share-batch', args=[self.file.pk]), self.owner,
+                data={'emails': emails}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['shared']), 500)
+        self.assertEqual(response.json()['already_shared'], [self.recipient.email])
+        self.assertEqual(response.json()['not_found'], ['stranger@example.com'])
+
+    def test_list_shares(self):
+        with self.budget('share-list'):
+            response = self.request('GET', reverse('files:share-list'), self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), FILES_PER_USER + 1)
+
+    def test_retrieve_share(self):
+        with self.budget('share-detail'):
+            response = self.request('GET', reverse('files:share-detail', args=[self.share.pk]), self.owner)
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_share(self):
+        with self.budget('share-delete'):
+            response = self.request('DELETE', reverse('files:share-detail', args=[self.share.pk]), self.owner)
+        self.assertEqual(response.status_code, 204)
+
+    def test_create_link(self):
+        with self.budget('create-link'):
+            response = self.request(
+                'POST', reverse('files:create-link', args=[self.file.pk]), self.owner,
+                data={}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_list_links(self):
+        with self.budget('link-list'):
+            response = self.request('GET', reverse('files:link-list'), self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), LINKS_PER_USER + 1)
+
+    def test_retrieve_link(self):
+        with self.budget('link-detail'):
+            response = self.request('GET', reverse('files:link-detail', args=[self.link.pk]), self.owner)
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_link(self):
+        with self.budget('link-delete'):
+            response = self.request('DELETE', reverse('files:link-detail', args=[self.link.pk]), self.owner)
+        self.assertEqual(response.status_code, 204)
+
+    def test_public_download(self):
+        with self.budget('public-download'):
+            response = self.request(
+                'POST', reverse('files:public-download', args=[self.link.pk]),
+                data={}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, b'budget test payload' * 512)
+
+    def test_public_download_stream(self):
+        with self.budget('public-download-stream'):
+            response = self.request(
+                'POST', reverse('files:public-download-stream', args=[self.link.pk]),
+                data={}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, b'budget test payload' * 512)
+
+    def test_chunking_parameters(self):
+        with self.budget('chunking'):
+            response = self.request('GET', reverse('files:chunking'), self.owner)
+        self.assertEqual(response.json()['avg_size'], 1024 * 1024)
+
+    def test_missing_chunks(self):
+        digests = [hashlib.sha256(b'%d' % i).hexdigest() for i in range(1000)]
+        with self.budget('missing-chunks'):
+            response = self.request(
+                'POST', reverse('files:missing-chunks', args=[self.file.pk]), self.owner,
+                data={'chunks': digests}, content_type='application/json'
+            )
+        self.assertEqual(len(response.json()['missing']), 1000)
+
+    def test_chunk_upload(self):
+        data = b'chunk' * 1000
+        url = reverse('files:chunk-upload', args=[self.file.pk, hashlib.sha256(data).hexdigest()])
+        with self.budget('chunk-upload'):
+            response = self.request('PUT', url, self.owner, data=data, content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 201)
+
+    def test_versions(self):
+        chunks = [versions.store_chunk(self.file, b'%d' % i)[0] for i in range(100)]
+        digests = [chunk.digest for chunk in chunks]
+        url = reverse('files:version-list', args=[self.file.pk])
+        with self.budget('version-commit'):
+            response = self.request('POST', url, self.owner, data={'chunks': digests}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        versions.commit(self.file, digests[:10])
+        with self.budget('version-list'):
+            response = self.request('GET', url, self.owner)
+        self.assertEqual(response.json()['current'], 2)
+        with self.budget('version-restore'):
+            response = self.request('POST', reverse('files:version-restore', args=[self.file.pk, 1]), self.owner)
+        self.assertEqual(response.status_code, 201)
+
+    def test_bulk_delete(self):
+        with self.budget('bulk-delete'):
+            response = self.request(
+                'POST', reverse('files:bulk-delete'), self.owner,
+                data={'filter': {'name': 'seed-'}}, content_type='application/json'
+            )
+        self.assertEqual(len(response.json()['results']), FILES_PER_USER)
+        self.assertEqual(EncryptedFile.objects.filter(owner=self.owner).count(), 1)
+
+    def test_bulk_share(self):
+        ids = list(EncryptedFile.objects.filter(owner=self.owner).values_list('pk', flat=True))
+        with self.budget('bulk-share'):
+            response = self.request(
+                'POST', reverse('files:bulk-share'), self.owner,
+                data={'ids': [str(pk) for pk in ids], 'email': self.other.email},
+                content_type='application/json'
+            )
+        self.assertEqual({result['status'] for result in response.json()['results']}, {'shared'})
+
+    def test_bulk_unshare(self):
+        with self.budget('bulk-unshare'):
+            response = self.request(
+                'POST', reverse('files:bulk-unshare'), self.owner,
+                data={'filter': {}, 'email': self.recipient.email}, content_type='application/json'
+            )
+        self.assertEqual(len(response.json()['results']), FILES_PER_USER + 1)
+        self.assertFalse(FileShare.objects.filter(file__owner=self.owner).exists())
+
+    def test_bulk_link_revoke(self):
+        with self.budget('bulk-link-revoke'):
+            response = self.request(
+                'POST', reverse('files:bulk-link-revoke'), self.owner,
+                data={'filter': {}}, content_type='application/json'
+            )
+        self.assertEqual(len(response.json()['results']), LINKS_PER_USER + 1)
+
+    def test_change_feed(self):
+        FileChange.objects.bulk_create([
+            FileChange(user=self.recipient, file_id=file_id, action=FileChange.UPDATED)
+            for file_id in EncryptedFile.objects.filter(owner=self.owner).values_list('pk', flat=True)
+        ])
+        with self.settings(CHANGE_FEED_SETTLE_SECONDS=0):
+            with self.budget('change-feed'):
+                response = self.request('GET', reverse('files:change-feed') + '?cursor=0', self.recipient)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['changes']), settings.CHANGE_FEED_PAGE_SIZE)
+            self.assertTrue(response.json()['has_more'])
+
+            with self.budget('change-feed-wait'):
+                response = self.request('GET', reverse('files:change-feed-wait') + '?cursor=0', self.recipient)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['changes']), settings.CHANGE_FEED_PAGE_SIZE)
+
+class ConditionalDownloadTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('etag@example.com', PASSWORD, full_name='ETag')
+
+    def setUp(self):
+        super().setUp()
+        self.content = b'conditional payload ' * 100
+        response = self.request(
+            'POST', reverse('files:file-list'), self.owner,
+            data={'name': 'c.txt', 'file': SimpleUploadedFile('c.txt', self.content, content_type='text/plain')}
+        )
+        self.file = EncryptedFile.objects.get(pk=response.json()['id'])
+        self.link = ShareableLink.objects.create(file=self.file, created_by=self.owner)
+
+    def test_downloads_carry_validators(self):
+        self.assertEqual(self.file.checksum, hashlib.sha256(self.content).hexdigest())
+        for url in ('files:file-download', 'files:file-download-stream'):
+            response = self.request('GET', reverse(url, args=[self.file.pk]), self.owner)
+            self.assertEqual(response['ETag'], f'"{self.file.checksum}"')
+            self.assertEqual(response['Last-Modified'], http_date(self.file.updated_at.timestamp()))
+
+    def test_unchanged_file_is_not_read_again(self):
+        etag = f'"{self.file.checksum}"'
+        for url in ('files:file-download', 'files:file-download-stream'):
+            with self.assertNumQueries(2):
+                response = self.request('GET', reverse(url, args=[self.file.pk]), self.owner, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+        since = http_date(self.file.updated_at.timestamp() + 60)
+        response = self.request(
+            'GET', reverse('files:file-download', args=[self.file.pk]), self.owner, HTTP_IF_MODIFIED_SINCE=since
+        )
+        self.assertEqual(response.status_code, 304)
+        before = http_date(self.file.updated_at.timestamp() - 60)
+        response = self.request(
+            'GET', reverse('files:file-download', args=[self.file.pk]), self.owner, HTTP_IF_MODIFIED_SINCE=before
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # A 304 is not a download.
+        self.assertEqual(audit_log.flush(), 1)
+
+    def test_public_downloads_honor_if_none_match(self):
+        for url in ('files:public-download', 'files:public-download-stream'):
+            response = self.request('POST', reverse(url, args=[self.link.pk]), HTTP_IF_NONE_MATCH=f'"{self.file.checksum}"')
+            self.assertEqual(response.status_code, 304)
+            response = self.request('POST', reverse(url, args=[self.link.pk]), HTTP_IF_NONE_MATCH='"stale"')
+            self.assertEqual(response.status_code, 200)
+        self.link.refresh_from_db()
+        self.assertEqual(self.link.access_count, 2)
+
+    def test_public_links_are_checked_before_the_file_state(self):
+        self.link.password = 'open sesame'
+        self.link.save()
+        etag = f'"{self.file.checksum}"'
+        for url in ('files:public-download', 'files:public-download-stream'):
+            url = reverse(url, args=[self.link.pk])
+            response = self.request('POST', url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 400)
+            response = self.request(
+                'POST', url, data={'password': 'open sesame'}, content_type='application/json',
+                HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 304)
+
+        EncryptedFile.objects.filter(pk=self.file.pk).update(status=EncryptedFile.PROCESSING)
+        for url in ('files:public-download', 'files:public-download-stream'):
+            url = reverse(url, args=[self.link.pk])
+            self.assertEqual(self.request('POST', url).status_code, 400)
+            response = self.request('POST', url, data={'password': 'open sesame'}, content_type='application/json')
+            self.assertEqual(response.status_code, 409)
+        ShareableLink.objects.filter(pk=self.link.pk).update(expires_at=timezone.now() - timedelta(hours=1))
+        response = self.request(
+            'POST', reverse('files:public-download', args=[self.link.pk]),
+            data={'password': 'open sesame'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_if_range(self):
+        url = reverse('files:file-download-stream', args=[self.file.pk])
+        response = self.request('GET', url, self.owner, HTTP_RANGE='bytes=20-39', HTTP_IF_RANGE=f'"{self.file.checksum}"')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content_bytes, self.content[20:40])
+
+        # The file changed since the client's first part: send all of it.
+        response = self.request('GET', url, self.owner, HTTP_RANGE='bytes=20-39', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, self.content)
+
+        last_modified = http_date(self.file.updated_at.timestamp())
+        response = self.request('GET', url, self.owner, HTTP_RANGE='bytes=20-39', HTTP_IF_RANGE=last_modified)
+        self.assertEqual(response.status_code, 206)
+
+    def test_files_without_checksum_get_an_etag(self):
+        EncryptedFile.objects.filter(pk=self.file.pk).update(checksum='')
+        url = reverse('files:file-download', args=[self.file.pk])
+        etag = self.request('GET', url, self.owner)['ETag']
+        self.assertIn(self.file.pk.hex, etag)
+        self.assertEqual(self.request('GET', url, self.owner, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+class PreviewTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('preview@example.com', PASSWORD, full_name='Preview')
+
+    def upload(self, name, content, content_type):
+        response = self.request(
+            'POST', reverse('files:file-list'), self.owner,
+            data={'name': name, 'file': SimpleUploadedFile(name, content, content_type=content_type)}
+        )
+        return EncryptedFile.objects.get(pk=response.json()['id'])
+
+    def preview(self, file_obj, **headers):
+        return self.request('GET', reverse('files:file-preview', args=[file_obj.pk]), self.owner, **headers)
+
+    def run_preview_jobs(self):
+        results = []
+        while (job := claim('w', kinds=['files.build_preview'])) is not None:
+            run(job)
+            job.refresh_from_db()
+            results.append(job.result)
+        return results
+
+    def test_images_get_an_encrypted_thumbnail(self):
+        file_obj = self.upload('photo.png', image_bytes('PNG'), 'image/png')
+        self.assertEqual(self.run_preview_jobs(), [{'built': True}])
+        file_obj.refresh_from_db()
+        self.assertTrue(self.request('GET', reverse('files:file-list'), self.owner).json()[0]['has_preview'])
+        with default_storage.open(file_obj.preview.name) as stored:
+            self.assertFalse(stored.read().startswith(b'\xff\xd8'))
+
+        response = self.preview(file_obj)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age=', response['Cache-Control'])
+        with Image.open(io.BytesIO(response.content)) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 213))
+
+        response = self.preview(file_obj, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(response['ETag'], f'"{file_obj.checksum}"')
+
+    def test_missing_preview_is_rebuilt_on_request(self):
+        file_obj = self.upload('photo.jpg', image_bytes('JPEG', mode='RGB'), 'image/jpeg')
+        Job.objects.filter(kind='files.build_preview').delete()
+
+        for _ in range(2):
+            response = self.preview(file_obj)
+            self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.run_preview_jobs(), [{'built': True}])
+        self.assertEqual(self.preview(file_obj).status_code, 200)
+
+        # A lost blob is rebuilt too.
+        file_obj.refresh_from_db()
+        default_storage.delete(file_obj.preview.name)
+        cache.clear()
+        self.assertEqual(self.preview(file_obj).status_code, 202)
+        self.assertEqual(self.run_preview_jobs(), [{'built': True}])
+
+    def test_other_files_have_no_preview(self):
+        file_obj = self.upload('notes.txt', b'no pixels here', 'text/plain')
+        self.assertEqual(self.run_preview_jobs(), [])
+        self.assertEqual(self.preview(file_obj).status_code, 404)
+
+        broken = self.upload('broken.png', b'not really a png', 'image/png')
+        self.assertEqual(self.run_preview_jobs(), [{'built': False}])
+        broken.refresh_from_db()
+        self.assertFalse(broken.preview)
+        self.assertTrue(broken.preview_failed)
+        # The failure is remembered: no job decrypts the file again.
+        cache.clear()
+        self.assertEqual(self.preview(broken).status_code, 404)
+        self.assertFalse(Job.objects.filter(kind='files.build_preview', status=Job.QUEUED).exists())
+
+    def test_deleting_the_file_deletes_the_preview(self):
+        file_obj = self.upload('photo.png', image_bytes('PNG'), 'image/png')
+        self.run_preview_jobs()
+        file_obj.refresh_from_db()
+        self.request('DELETE', reverse('files:file-detail', args=[file_obj.pk]), self.owner)
+        self.assertIn(
+            {'name': file_obj.preview.name},
+            list(Job.objects.filter(kind='files.delete_blob').values_list('payload', flat=True))
+        )
+
+
+@override_settings(CHUNK_MIN_SIZE=256, CHUNK_AVG_SIZE=1024, CHUNK_MAX_SIZE=4096)
+class VersionTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('versions@example.com', PASSWORD, full_name='Versions')
+        cls.reader = User.objects.create_user('reader@example.com', PASSWORD, full_name='Reader')
+        cls.original = random.Random(46).randbytes(20000)
+
+    def setUp(self):
+        super().setUp()
+        response = self.request(
+            'POST', reverse('files:file-list'), self.owner,
+            data={'name': 'data.bin', 'file': SimpleUploadedFile('data.bin', self.original)}
+        )
+        self.file = EncryptedFile.objects.get(pk=response.json()['id'])
+
+    def chunks(self, content):
+        return list(iter_chunks(io.BytesIO(content)))
+
+    def upload_version(self, content, user=None):
+        """Upload ``content`` the way a client would; returns (response, chunks sent)."""
+        user = user or self.owner
+        chunks = self.chunks(content)
+        digests = [hashlib.sha256(chunk).hexdigest() for chunk in chunks]
+        chunks = dict(zip(digests, chunks))
+        missing = self.request(
+            'POST', reverse('files:missing-chunks', args=[self.file.pk]), user,
+            data={'chunks': digests}, content_type='application/json'
+        ).json()['missing']
+        for digest in missing:
+            response = self.request(
+                'PUT', reverse('files:chunk-upload', args=[self.file.pk, digest]), user,
+                data=chunks[digest], content_type='application/octet-stream'
+            )
+            self.assertEqual(response.status_code, 201)
+        response = self.request(
+            'POST', reverse('files:version-list', args=[self.file.pk]), user,
+            data={'chunks': digests}, content_type='application/json'
+        )
+        return response, len(missing)
+
+    def download(self):
+        """The file's content, checking both download endpoints agree."""
+        sync = self.request('GET', reverse('files:file-download', args=[self.file.pk]), self.owner)
+        stream = self.request('GET', reverse('files:file-download-stream', args=[self.file.pk]), self.owner)
+        self.assertEqual(sync.content_bytes, stream.content_bytes)
+        self.assertEqual(int(sync['Content-Length']), len(sync.content_bytes))
+        return stream.content_bytes
+
+    def test_boundaries_resynchronise_after_an_edit(self):
+        edited = self.original[:9000] + b'inserted' + self.original[9000:]
+        before, after = self.chunks(self.original), self.chunks(edited)
+        self.assertEqual(b''.join(after), edited)
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in after))
+        shared = set(before) & set(after)
+        self.assertGreaterEqual(len(shared), len(before) - 2)
+
+    def test_new_versions_upload_only_changed_chunks(self):
+        EncryptedFile.objects.filter(pk=self.file.pk).update(preview_failed=True)
+        response, sent = self.upload_version(self.original)
+        self.assertEqual(response.status_code, 201)
+        # New content gets a new chance at a preview.
+        self.assertFalse(EncryptedFile.objects.get(pk=self.file.pk).preview_failed)
+        self.assertEqual(response.json()['number'], 1)
+        self.assertEqual(sent, len(set(self.chunks(self.original))))
+
+        edited = self.original[:9000] + b'inserted' + self.original[9000:]
+        response, sent = self.upload_version(edited)
+        self.assertEqual(response.json()['number'], 2)
+        self.assertLessEqual(sent, 2)
+
+        self.file.refresh_from_db()
+        self.assertEqual((self.file.version, self.file.size), (2, len(edited)))
+        self.assertEqual(self.download(), edited)
+        partial = self.request(
+            'GET', reverse('files:file-download-stream', args=[self.file.pk]), self.owner,
+            HTTP_RANGE='bytes=8990-9020'
+        )
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.content_bytes, edited[8990:9021])
+
+        listing = self.request('GET', reverse('files:version-list', args=[self.file.pk]), self.owner).json()
+        self.assertEqual(listing['current'], 2)
+        self.assertEqual([version['number'] for version in listing['versions']], [2, 1])
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.storage_used, len(edited))
+
+    def test_commit_reports_missing_chunks(self):
+        digests = [hashlib.sha256(chunk).hexdigest() for chunk in self.chunks(self.original)]
+        response = self.request(
+            'POST', reverse('files:version-list', args=[self.file.pk]), self.owner,
+            data={'chunks': digests}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['missing'], list(dict.fromkeys(digests)))
+        self.assertFalse(FileVersion.objects.exists())
+
+    def test_chunks_must_match_their_digest_and_size(self):
+        url = reverse('files:chunk-upload', args=[self.file.pk, hashlib.sha256(b'a').hexdigest()])
+        response = self.request('PUT', url, self.owner, data=b'b', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+        large = b'x' * 4097
+        url = reverse('files:chunk-upload', args=[self.file.pk, hashlib.sha256(large).hexdigest()])
+        response = self.request('PUT', url, self.owner, data=large, content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(FileChunk.objects.exists())
+
+    def test_uncommitted_chunks_count_against_the_quota(self):
+        self.owner.refresh_from_db()
+        User.objects.filter(pk=self.owner.pk).update(storage_quota=self.owner.storage_used + 5000)
+
+        def put(data):
+            url = reverse('files:chunk-upload', args=[self.file.pk, hashlib.sha256(data).hexdigest()])
+            return self.request('PUT', url, self.owner, data=data, content_type='application/octet-stream')
+
+        self.assertEqual(put(b'a' * 3000).status_code, 201)
+        response = put(b'b' * 3000)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('only 2.0\xa0KB of your storage quota is free', response.json()['detail'])
+        # Chunks the file has already are not counted twice.
+        self.assertEqual(put(b'a' * 3000).status_code, 200)
+        self.assertEqual(FileChunk.objects.filter(file=self.file).count(), 1)
+
+    def test_readers_cannot_add_versions(self):
+        FileShare.objects.create(file=self.file, shared_with=self.reader, can_write=False)
+        response = self.request(
+            'POST', reverse('files:version-list', args=[self.file.pk]), self.reader,
+            data={'chunks': []}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(
+            self.request('GET', reverse('files:version-list', args=[self.file.pk]), self.reader).status_code,
+            200
+        )
+
+    def test_restore(self):
+        self.upload_version(self.original)
+        self.upload_version(b'replaced' * 1000)
+        response = self.request('POST', reverse('files:version-restore', args=[self.file.pk, 1]), self.owner)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['number'], 3)
+        self.assertEqual(self.download(), self.original)
+        response = self.request('POST', reverse('files:version-restore', args=[self.file.pk, 9]), self.owner)
+        self.assertEqual(response.status_code, 404)
+
+    def test_uploaded_file_is_chunked_by_a_job(self):
+        edited = self.original + b'appended'
+        response = self.request(
+            'POST', reverse('files:version-list', args=[self.file.pk]), self.owner,
+            data={'file': SimpleUploadedFile('data.bin', edited)}
+        )
+        self.assertEqual(response.status_code, 202)
+        job = claim('w', kinds=['files.create_version'])
+        run(job)
+        job.refresh_from_db()
+        self.assertEqual(job.result['version'], 1)
+        self.assertEqual(self.download(), edited)
+
+    def test_old_versions_and_unused_chunks_are_collected(self):
+        for content in (self.original, b'second' * 1000, b'third' * 1000):
+            self.upload_version(content)
+        FileVersion.objects.update(created_at=timezone.now() - timedelta(days=60))
+        with self.settings(VERSION_KEEP_LAST=2, CHUNK_GC_GRACE_SECONDS=0):
+            report = collect_garbage(blobs=False, links=False)
+            self.assertEqual(report.versions_pruned, 1)
+            self.assertEqual(report.chunks_deleted, len(set(self.chunks(self.original))))
+            self.assertEqual(self.download(), b'third' * 1000)
+
+            self.request('DELETE', reverse('files:file-detail', args=[self.file.pk]), self.owner)
+            report = collect_garbage(blobs=False, links=False)
+            self.assertEqual(report.versions_pruned, 2)
+        self.assertFalse(FileChunk.objects.exists())
+
+
+class BulkOperationTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('bulk@example.com', PASSWORD, full_name='Bulk')
+        cls.recipient = User.objects.create_user('bulk-recipient@example.com', PASSWORD, full_name='Recipient')
+        cls.files = [
+            EncryptedFile.objects.create(
+                owner=cls.owner, name=f'{i}.{kind}', file=f'encrypted_files/{i}.bin',
+                mime_type=f'text/{kind}', size=100, encryption_key=b'', encryption_iv=b''
+            )
+            for i, kind in enumerate(['plain', 'plain', 'csv'])
+        ]
+        cls.foreign = EncryptedFile.objects.create(
+            owner=cls.recipient, name='theirs.txt', file='encrypted_files/theirs.bin',
+            mime_type='text/plain', size=100, encryption_key=b'', encryption_iv=b''
+        )
+        User.objects.filter(pk=cls.owner.pk).update(storage_used=300, file_count=3)
+
+    def post(self, name, data):
+        response = self.request('POST', reverse(f'files:{name}'), self.owner, data=data, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {result['id']: result['status'] for result in response.json()['results']}
+
+    def test_delete_reports_each_id_and_queues_blobs(self):
+        results = self.post('bulk-delete', {'ids': [str(self.files[0].pk), str(self.foreign.pk)]})
+        self.assertEqual(results, {str(self.files[0].pk): 'deleted', str(self.foreign.pk): 'not_found'})
+        self.assertTrue(EncryptedFile.objects.filter(pk=self.foreign.pk).exists())
+        self.owner.refresh_from_db()
+        self.assertEqual((self.owner.storage_used, self.owner.file_count), (200, 2))
+
+        job = claim('w', kinds=['files.delete_blobs'])
+        self.assertEqual(job.payload, {'names': ['encrypted_files/0.bin']})
+
+    def test_delete_by_filter(self):
+        results = self.post('bulk-delete', {'filter': {'mime_type': 'text/plain'}})
+        self.assertEqual(set(results), {str(self.files[0].pk), str(self.files[1].pk)})
+        with self.settings(BULK_MAX_ITEMS=0):
+            self.assertEqual(self.post('bulk-delete', {'filter': {}}), {})
+
+    def test_anonymous_callers_are_refused(self):
+        for name in ('bulk-delete', 'bulk-share', 'bulk-unshare', 'bulk-link-revoke'):
+            response = self.request(
+                'POST', reverse(f'files:{name}'), data={'filter': {}}, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 401, name)
+        self.assertEqual(EncryptedFile.objects.count(), 4)
+
+    def test_selection_is_validated(self):
+        for data in ({}, {'ids': [], 'filter': {}}, {'ids': ['not-a-uuid']}):
+            response = self.request(
+                'POST', reverse('files:bulk-delete'), self.owner, data=data, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(EncryptedFile.objects.count(), 4)
+
+    def test_share_and_unshare(self):
+        FileShare.objects.create(file=self.files[0], shared_with=self.recipient)
+        ids = [str(file_obj.pk) for file_obj in self.files[:2]] + [str(self.foreign.pk)]
+        results = self.post('bulk-share', {'ids': ids, 'email': self.recipient.email, 'can_write': True})
+        self.assertEqual(list(results.values()), ['updated', 'shared', 'not_found'])
+        self.assertEqual(FileShare.objects.filter(shared_with=self.recipient, can_write=True).count(), 2)
+
+        results = self.post('bulk-unshare', {'filter': {'shared_with': self.recipient.email}, 'email': self.recipient.email})
+        self.assertEqual(set(results.values()), {'unshared'})
+        self.assertEqual(len(results), 2)
+        self.assertFalse(FileShare.objects.exists())
+
+        response = self.request(
+            'POST', reverse('files:bulk-share'), self.owner,
+            data={'ids': ids, 'email': 'nobody@example.com'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_unshare_by_filter_reports_only_shared_files(self):
+        FileShare.objects.create(file=self.files[2], shared_with=self.recipient)
+        results = self.post('bulk-unshare', {'filter': {}, 'email': self.recipient.email})
+        self.assertEqual(results, {str(self.files[2].pk): 'unshared'})
+        self.assertEqual(self.post('bulk-unshare', {'filter': {}, 'email': self.recipient.email}), {})
+
+        ids = [str(self.files[0].pk), str(self.files[2].pk)]
+        results = self.post('bulk-unshare', {'ids': ids, 'email': self.recipient.email})
+        self.assertEqual(list(results.values()), ['not_shared', 'not_shared'])
+
+    def test_share_one_file_with_many_users(self):
+        url = reverse('files:file-share-batch', args=[self.files[0].pk])
+        response = self.request(
+            'POST', url, self.owner, content_type='application/json',
+            data={'emails': ['bulk-recipient@EXAMPLE.com', self.owner.email, 'ghost@example.com'], 'can_write': True}
+        )
+        self.assertEqual(response.json(), {
+            'shared': ['bulk-recipient@example.com'],
+            'already_shared': [],
+            'not_found': [self.owner.email, 'ghost@example.com'],
+        })
+        self.assertTrue(FileShare.objects.get(file=self.files[0]).can_write)
+        response = self.request(
+            'POST', reverse('files:file-share-batch', args=[self.foreign.pk]), self.owner,
+            data={'emails': [self.recipient.email]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.request(
+            'POST', reverse('files:file-share-batch', args=[self.files[1].pk]),
+            data={'emails': [self.recipient.email]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoke_links(self):
+        links = [ShareableLink.objects.create(file=file_obj, created_by=self.owner) for file_obj in self.files]
+        expired = ShareableLink.objects.create(
+            file=self.files[0], created_by=self.owner, expires_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(self.post('bulk-link-revoke', {'filter': {'expired': True}}), {str(expired.pk): 'revoked'})
+        results = self.post('bulk-link-revoke', {'filter': {'file': [str(self.files[1].pk)]}})
+        self.assertEqual(results, {str(links[1].pk): 'revoked'})
+        self.assertEqual(ShareableLink.objects.count(), 2)
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('feed@example.com', PASSWORD, full_name='Feed')
+        cls.recipient = User.objects.create_user('feed-recipient@example.com', PASSWORD, full_name='Recipient')
+        cls.other = User.objects.create_user('feed-other@example.com', PASSWORD, full_name='Other')
+        cls.file = EncryptedFile.objects.create(
+            owner=cls.owner, name='notes.txt', file='encrypted_files/notes.bin',
+            mime_type='text/plain', size=100, encryption_key=b'', encryption_iv=b''
+        )
+        User.objects.filter(pk=cls.owner.pk).update(storage_used=100, file_count=1)
+
+    def feed(self, user, cursor=None, name='change-feed', **params):
+        if cursor is not None:
+            params['cursor'] = cursor
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.request('GET', f'{reverse(f"files:{name}")}?{query}', user)
+
+    def changes(self, user, cursor=0):
+        response = self.feed(user, cursor)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(change['file'], change['action']) for change in response.json()['changes']]
+
+    def share(self):
+        response = self.request(
+            'POST', reverse('files:file-share', args=[self.file.pk]), self.owner,
+            data={
+                'shared_with': self.recipient.pk,
+                'shared_with_username': self.recipient.email,
+                'shared_with_email': self.recipient.email,
+            },
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def test_changes_reach_the_owner_and_the_users_shared_with(self):
+        file_id = str(self.file.pk)
+        self.share()
+        self.request(
+            'PATCH', reverse('files:file-detail', args=[self.file.pk]), self.owner,
+            data={'name': 'renamed.txt'}, content_type='application/json'
+        )
+        self.request('DELETE', reverse('files:file-detail', args=[self.file.pk]), self.owner)
+
+        expected = [(file_id, 'shared'), (file_id, 'updated'), (file_id, 'deleted')]
+        self.assertEqual(self.changes(self.owner), expected)
+        self.assertEqual(self.changes(self.recipient), expected)
+        self.assertEqual(self.changes(self.other), [])
+
+    def test_unshare_is_the_last_change_the_recipient_sees(self):
+        share_id = self.share()
+        self.request('DELETE', reverse('files:share-detail', args=[share_id]), self.owner)
+        versions.commit(self.file, [], self.owner.pk)
+
+        file_id = str(self.file.pk)
+        self.assertEqual(self.changes(self.recipient), [(file_id, 'shared'), (file_id, 'unshared')])
+        self.assertEqual(self.changes(self.owner)[-1], (file_id, 'updated'))
+
+    def test_bulk_operations_are_recorded(self):
+        self.request(
+            'POST', reverse('files:bulk-share'), self.owner, content_type='application/json',
+            data={'ids': [str(self.file.pk)], 'email': self.recipient.email}
+        )
+        self.request(
+            'POST', reverse('files:bulk-delete'), self.owner, content_type='application/json',
+            data={'ids': [str(self.file.pk)]}
+        )
+        file_id = str(self.file.pk)
+        self.assertEqual(self.changes(self.recipient), [(file_id, 'shared'), (file_id, 'deleted')])
+
+    def test_pages_follow_the_cursor(self):
+        changes.add(FileChange.UPDATED, [(self.file.pk, self.owner.pk)])
+        start = self.feed(self.owner).json()
+        self.assertEqual(start['changes'], [])
+        for _ in range(3):
+            changes.add(FileChange.UPDATED, [(self.file.pk, self.owner.pk)])
+
+        first = self.feed(self.owner, start['cursor'], limit=2).json()
+        self.assertEqual(len(first['changes']), 2)
+        self.assertTrue(first['has_more'])
+        second = self.feed(self.owner, first['cursor'], limit=2).json()
+        self.assertEqual(len(second['changes']), 1)
+        self.assertFalse(second['has_more'])
+        self.assertEqual(self.feed(self.owner, second['cursor']).json()['changes'], [])
+
+    def test_recent_changes_are_held_back(self):
+        changes.add(FileChange.CREATED, [(self.file.pk, self.owner.pk)])
+        with self.settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            self.assertEqual(self.changes(self.owner), [])
+        self.assertEqual(len(self.changes(self.owner)), 1)
+
+    def test_expired_cursor_is_gone(self):
+        changes.add(FileChange.CREATED, [(self.file.pk, self.owner.pk)])
+        changes.add(FileChange.UPDATED, [(self.file.pk, self.owner.pk)])
+        FileChange.objects.update(created_at=timezone.now() - timedelta(days=365))
+        self.assertEqual(collect_garbage(blobs=False, links=False).changes_deleted, 1)
+
+        self.assertEqual(self.feed(self.owner, 0).status_code, 410)
+        self.assertEqual(self.feed(self.owner, 0, name='change-feed-wait').status_code, 410)
+        cursor = self.feed(self.owner).json()['cursor']
+        self.assertEqual(self.feed(self.owner, cursor).status_code, 200)
+
+    def test_idle_feeds_move_along(self):
+        changes.add(FileChange.CREATED, [(self.file.pk, self.owner.pk)])
+        self.assertEqual(self.feed(self.other, 0).json()['cursor'], FileChange.objects.get().pk)
+
+    async def test_long_poll_under_asgi(self):
+        await FileChange.objects.acreate(file=self.file, user=self.owner, action=FileChange.CREATED)
+        response = await self.async_client.get(
+            reverse('files:change-feed-wait') + '?cursor=0&wait=5', secure=True,
+            headers={'Authorization': f'Bearer {AccessToken.for_user(self.owner)}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['changes'][0]['action'], 'created')
+
+    def test_long_poll(self):
+        self.assertEqual(self.feed(self.owner, name='change-feed-wait').status_code, 400)
+        self.assertEqual(self.feed(self.owner, 0, name='change-feed-wait', wait='x').status_code, 400)
+        with self.settings(CHANGE_FEED_POLL_SECONDS=0.01):
+            start = time.monotonic()
+            response = self.feed(self.owner, 0, name='change-feed-wait', wait=1)
+            self.assertGreaterEqual(time.monotonic() - start, 1)
+        self.assertEqual(response.json(), {'cursor': 0, 'has_more': False, 'changes': []})
+
+        changes.add(FileChange.CREATED, [(self.file.pk, self.owner.pk)])
+        response = self.feed(self.owner, 0, name='change-feed-wait', wait=30)
+        self.assertEqual(response.json()['changes'][0]['action'], 'created')
+        self.assertEqual(self.request('GET', reverse('files:change-feed-wait') + '?cursor=0').status_code, 401)
+        self.assertEqual(self.request('GET', reverse('files:change-feed')).status_code, 401)
+
+
+# The admin templates need static files, which are not collected for tests.
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class AdminChangelistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', PASSWORD, full_name='Admin')
+        cls.owner = User.objects.create_user('listed@example.com', PASSWORD, full_name='Listed')
+        files = EncryptedFile.objects.bulk_create([
+            EncryptedFile(
+                owner=cls.owner if i % 2 else cls.admin, name=f'seed-{i}.txt',
+                file=f'encrypted_files/seed-{i}.txt', mime_type='text/plain', size=1,
+                encryption_key=b'', encryption_iv=b''
+            )
+            for i in range(300)
+        ])
+        FileShare.objects.bulk_create([FileShare(file=f, shared_with=cls.owner) for f in files[::2]])
+        ShareableLink.objects.bulk_create([ShareableLink(file=f, created_by=f.owner) for f in files])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        return self.client.get(reverse(f'admin:{model}_changelist'), params, secure=True)
+
+    def test_changelists_do_not_query_per_row(self):
+        for model in (
+            'files_encryptedfile', 'files_fileshare', 'files_shareablelink',
+            'accounts_user', 'accounts_mfabackupcode', 'audit_auditevent',
+        ):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.changelist(model)
+            self.assertEqual(response.status_code, 200, model)
+            self.assertLess(len(captured), 10, model)
+
+    def test_search_matches_emails_exactly_and_names_by_prefix(self):
+        response = self.changelist('files_encryptedfile', q='listed@example.com')
+        self.assertEqual(response.context['cl'].result_count, 150)
+        response = self.changelist('files_encryptedfile', q='seed-29')
+        self.assertEqual(response.context['cl'].result_count, 11)
+        response = self.changelist('files_encryptedfile', q='eed-29')
+        self.assertEqual(response.context['cl'].result_count, 0)
+        response = self.changelist('files_fileshare', q='seed-1')
+        self.assertEqual(response.context['cl'].result_count, 55)
+
+    def test_counts_stop_at_the_limit(self):
+        with self.settings(ADMIN_COUNT_LIMIT=100):
+            response = self.changelist('files_shareablelink')
+        self.assertEqual(response.context['cl'].result_count, 100)
+
+
+class MediaRootTestCase(TestCase):
+    """Test case with a throwaway MEDIA_ROOT."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('storage@example.com', PASSWORD, full_name='Storage')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.settings = override_settings(MEDIA_ROOT=media_root)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+
+class GarbageCollectorTests(MediaRootTestCase):
+
+    def blob(self, name, age):
+        name = default_storage.save(name, ContentFile(b'x' * 100))
+        stamp = time.time() - age
+        os.utime(default_storage.path(name), (stamp, stamp))
+        return name
+
+    def test_collects_old_unreferenced_blobs_only(self):
+        referenced = self.blob('encrypted_files/kept.bin', age=7200)
+        being_sharded = self.blob(sharded_name('moving.bin'), age=7200)
+        orphan = self.blob(sharded_name('orphan.bin'), age=7200)
+        in_flight = self.blob('encrypted_files/new.bin', age=0)
+        for name in (referenced, 'encrypted_files/moving.bin'):
+            EncryptedFile.objects.create(
+                owner=self.owner, name='kept', file=name, mime_type='text/plain',
+                size=100, encryption_key=b'', encryption_iv=b''
+            )
+
+        report = collect_garbage(dry_run=True, grace_seconds=3600, rate=0)
+        self.assertEqual((report.blobs_scanned, report.orphaned_blobs), (4, 1))
+        self.assertTrue(default_storage.exists(orphan))
+
+        report = collect_garbage(grace_seconds=3600, rate=0, batch_size=2)
+        self.assertEqual(report.bytes_reclaimed, 100)
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(referenced))
+        self.assertTrue(default_storage.exists(being_sharded))
+        self.assertTrue(default_storage.exists(in_flight))
+
+    def test_reference_lookups_use_indexes(self):
+        self.blob('encrypted_files/orphan.bin', age=7200)
+        with CaptureQueriesContext(connection) as captured:
+            collect_garbage(links=False, file_versions=False, file_changes=False, grace_seconds=3600, rate=0)
+        lookups = [q['sql'] for q in captured if ' IN (' in q['sql']]
+        self.assertEqual(len(lookups), 2)
+        with connection.cursor() as cursor:
+            for sql in lookups:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertRegex(plan, r'USING (COVERING )?INDEX')
+                self.assertNotRegex(plan, r'SCAN files_(encryptedfile|filechunk)\b')
+
+    def test_deletes_expired_and_exhausted_links(self):
+        file_obj = EncryptedFile.objects.create(
+            owner=self.owner, name='f', file='encrypted_files/f.bin', mime_type='text/plain',
+            size=1, encryption_key=b'', encryption_iv=b''
+        )
+        long_ago = timezone.now() - timedelta(days=30)
+        live = ShareableLink.objects.create(file=file_obj, created_by=self.owner)
+        recently_expired = ShareableLink.objects.create(
+            file=file_obj, created_by=self.owner, expires_at=timezone.now() - timedelta(hours=1)
+        )
+        ShareableLink.objects.create(file=file_obj, created_by=self.owner, expires_at=long_ago)
+        ShareableLink.objects.create(
+            file=file_obj, created_by=self.owner, max_access_count=3, access_count=3
+        )
+
+        report = collect_garbage(blobs=False, batch_size=1)
+        self.assertEqual(report.links_deleted, 2)
+        self.assertQuerySetEqual(
+            ShareableLink.objects.order_by('created_at'), [live, recently_expired]
+        )
+
+
+class ShardedStorageTests(MediaRootTestCase):
+
+    def create_file(self, name, content=b'ciphertext'):
+        name = default_storage.save(name, ContentFile(content))
+        return EncryptedFile.objects.create(
+            owner=self.owner, name='f.txt', file=name, mime_type='text/plain',
+            size=len(content), encryption_key=b'', encryption_iv=b''
+        )
+
+    def test_new_blobs_are_sharded(self):
+        name = get_file_path(None, 'report.pdf')
+        self.assertRegex(name, r'^encrypted_files/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f-]{36}\.pdf$')
+        self.assertEqual(name, sharded_name(name))
+
+    def test_shard_blobs_moves_flat_blobs(self):
+        flat = self.create_file('encrypted_files/old.bin')
+        sharded = self.create_file(sharded_name('new.bin'))
+
+        call_command('shard_blobs', batch_size=1, stdout=io.StringIO())
+
+        flat.refresh_from_db()
+        self.assertEqual(flat.file.name, sharded_name('old.bin'))
+        self.assertFalse(os.path.exists(default_storage.path('encrypted_files/old.bin')))
+        with flat.file.open('rb') as blob:
+            self.assertEqual(blob.read(), b'ciphertext')
+        sharded.refresh_from_db()
+        self.assertEqual(sharded.file.name, sharded_name('new.bin'))
+
+    def test_old_names_resolve_after_move(self):
+        file_obj = self.create_file(sharded_name('moved.bin'))
+        stale = EncryptedFile.objects.get(pk=file_obj.pk)
+        stale.file.name = 'encrypted_files/moved.bin'
+        with stale.file.open('rb') as blob:
+            self.assertEqual(blob.read(), b'ciphertext')
+        self.assertEqual(default_storage.size(stale.file.name), len(b'ciphertext'))
+
+
+class VolumeStorageTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.volume_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.volume_root, ignore_errors=True)
+
+    def use_volumes(self, **weights):
+        volumes = {
+            name: {'path': os.path.join(self.volume_root, name), 'weight': weight}
+            for name, weight in weights.items()
+        }
+        settings = override_settings(BLOB_VOLUMES=volumes, BLOB_VOLUME_MIN_FREE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_placement_follows_weights(self):
+        self.use_volumes(disk1=1, disk2=0)
+        name = default_storage.save(get_file_path(None, 'a.txt'), ContentFile(b'data'))
+        self.assertTrue(name.startswith('disk1:encrypted_files/'))
+        self.assertTrue(os.path.exists(os.path.join(self.volume_root, 'disk1', name.partition(':')[2])))
+        with default_storage.open(name) as blob:
+            self.assertEqual(blob.read(), b'data')
+
+    def test_default_volume_keeps_unprefixed_names(self):
+        name = default_storage.save('encrypted_files/plain.bin', ContentFile(b'data'))
+        self.assertEqual(name, 'encrypted_files/plain.bin')
+        self.use_volumes(disk1=1)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_upload_records_volume(self):
+        self.use_volumes(disk1=1)
+        cache.clear()
+        response = self.client.post(
+            reverse('files:file-list'),
+            {'name': 'v.txt', 'file': SimpleUploadedFile('v.txt', b'v' * 64, content_type='text/plain')},
+            secure=True,
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.owner)}',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(EncryptedFile.objects.get(pk=response.json()['id']).volume, 'disk1')
+
+    def test_rebalance_moves_blobs_to_new_volume(self):
+        for i in range(4):
+            name = default_storage.save(get_file_path(None, 'x.bin'), ContentFile(b'x' * 1000))
+            EncryptedFile.objects.create(
+                owner=self.owner, name=f'{i}.bin', file=name, volume='default',
+                mime_type='application/octet-stream', size=1000,
+                encryption_key=b'', encryption_iv=b''
+            )
+        self.use_volumes(default=1, disk2=1)
+
+        self.assertEqual(rebalance(dry_run=True).files_moved, 2)
+        self.assertEqual(EncryptedFile.objects.filter(volume='disk2').count(), 0)
+
+        report = rebalance()
+        self.assertTrue(report.done)
+        self.assertEqual(report.files_moved, 2)
+        moved = EncryptedFile.objects.filter(volume='disk2')
+        self.assertEqual(moved.count(), 2)
+        for file_obj in moved:
+            self.assertTrue(file_obj.file.name.startswith('disk2:'))
+            with file_obj.file.open('rb') as blob:
+                self.assertEqual(blob.read(), b'x' * 1000)
+        self.assertEqual(Job.objects.filter(kind='files.delete_blob').count(), 2)
+
+
+@override_settings(TIER_COLD_VOLUME='cold', TIER_COLD_RULES=[(7, 0), (30, 5)],
+                   ACCESS_FLUSH_INTERVAL=0, AUDIT_FLUSH_INTERVAL=0,
+                   ROLLUP_FLUSH_INTERVAL=0)
+class TieringTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        volume_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, volume_root, ignore_errors=True)
+        settings = override_settings(
+            BLOB_VOLUMES={
+                'default': {'path': '', 'weight': 1.0},
+                'cold': {'path': os.path.join(volume_root, 'cold'), 'weight': 1.0},
+            },
+            BLOB_VOLUME_MIN_FREE=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        recorder.flush()
+        self.addCleanup(audit_log.flush)
+        self.addCleanup(usage.flush)
+
+    def upload(self, name, age_days, **fields):
+        response = self.client.post(
+            reverse('files:file-list'),
+            {'name': name, 'file': SimpleUploadedFile(name, name.encode() * 10, content_type='text/plain')},
+            secure=True,
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.owner)}',
+        )
+        EncryptedFile.objects.filter(pk=response.json()['id']).update(
+            created_at=timezone.now() - timedelta(days=age_days), **fields
+        )
+        return EncryptedFile.objects.get(pk=response.json()['id'])
+
+    def download(self, file_obj):
+        response = self.client.get(
+            reverse('files:file-download', args=[file_obj.pk]),
+            secure=True,
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.owner)}',
+        )
+        return b''.join(response.streaming_content)
+
+    def test_cold_files_are_demoted_and_promoted_on_access(self):
+        idle = self.upload('idle.txt', age_days=10)
+        popular = self.upload('popular.txt', age_days=40, access_count=9,
+                              last_accessed_at=timezone.now() - timedelta(days=35))
+        recent = self.upload('recent.txt', age_days=40, access_count=1,
+                             last_accessed_at=timezone.now() - timedelta(days=1))
+        self.assertEqual({idle.volume, popular.volume, recent.volume}, {'default'})
+
+        report = demote()
+        self.assertEqual(report.files_demoted, 1)
+        self.assertTrue(report.done)
+        idle.refresh_from_db()
+        self.assertEqual((idle.tier, idle.volume), (EncryptedFile.COLD, 'cold'))
+        self.assertEqual(self.download(idle), b'idle.txt' * 10)
+
+        self.assertEqual(recorder.flush(), 1)
+        idle.refresh_from_db()
+        self.assertEqual(idle.access_count, 1)
+        self.assertIsNotNone(idle.last_accessed_at)
+        job = Job.objects.get(kind='files.promote_blob')
+        run(claim('w', kinds=['files.promote_blob']))
+        job.refresh_from_db()
+        self.assertEqual(job.result, {'promoted': True})
+
+        idle.refresh_from_db()
+        self.assertEqual((idle.tier, idle.volume), (EncryptedFile.HOT, 'default'))
+        self.assertEqual(self.download(idle), b'idle.txt' * 10)
+
+    def test_access_counts_are_batched(self):
+        file_obj = self.upload('counted.txt', age_days=0)
+        for _ in range(3):
+            self.download(file_obj)
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.access_count, 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(recorder.flush(), 1)
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.access_count, 3)
+
+
+class QuotaTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('quota@example.com', PASSWORD, full_name='Quota', storage_quota=300 * 1024)
+
+    def upload(self, name, size):
+        upload = SimpleUploadedFile(name, b'q' * size, content_type='text/plain')
+        return self.request(
+            'POST', reverse('files:file-list'), self.owner,
+            data={'name': name, 'file': upload}
+        )
+
+    def test_uploads_and_deletes_keep_the_counters(self):
+        first = self.upload('a.txt', 100 * 1024).json()['id']
+        self.upload('b.txt', 50 * 1024)
+        self.owner.refresh_from_db()
+        self.assertEqual((self.owner.storage_used, self.owner.file_count), (150 * 1024, 2))
+
+        self.request('DELETE', reverse('files:file-detail', args=[first]), self.owner)
+        self.owner.refresh_from_db()
+        self.assertEqual((self.owner.storage_used, self.owner.file_count), (50 * 1024, 1))
+
+        response = self.request('GET', reverse('accounts:profile'), self.owner)
+        self.assertEqual(response.json()['storage_quota'], 300 * 1024)
+        self.assertEqual(response.json()['storage_used'], 50 * 1024)
+
+    def test_oversized_upload_is_rejected_before_reading_the_body(self):
+        self.upload('a.txt', 200 * 1024)
+        # Only the authentication query: the counters come with the user.
+        with self.assertNumQueries(1):
+            response = self.upload('b.txt', 200 * 1024)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('only 100.0\xa0KB of your storage quota is free', response.json()['detail'])
+        self.assertEqual(EncryptedFile.objects.filter(owner=self.owner).count(), 1)
+
+    def test_counters_are_checked_when_the_file_is_saved(self):
+        stale = User.objects.get(pk=self.owner.pk)
+        # Another upload used up the quota after ``stale`` was loaded.
+        quota.reserve(self.owner, 250 * 1024)
+        with self.assertRaises(quota.QuotaExceeded):
+            quota.reserve(stale, 100 * 1024)
+        self.assertEqual(stale.storage_used, 250 * 1024)
+        quota.reserve(stale, 50 * 1024)
+
+    def test_unlimited_quota(self):
+        User.objects.filter(pk=self.owner.pk).update(storage_quota=None)
+        with self.settings(STORAGE_QUOTA_DEFAULT=0):
+            response = self.upload('a.txt', 400 * 1024)
+        self.assertEqual(response.status_code, 201)
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.storage_used, 400 * 1024)
+
+    def test_reconcile_fixes_drift(self):
+        self.upload('a.txt', 1024)
+        EncryptedFile.objects.create(
+            owner=self.owner, name='raw.txt', file='encrypted_files/raw.txt',
+            mime_type='text/plain', size=10, encryption_key=b'', encryption_iv=b''
+        )
+        output = io.StringIO()
+        call_command('reconcile_quotas', '--dry-run', stdout=output)
+        self.assertIn('Would fix the counters of 1 users.', output.getvalue())
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.file_count, 1)
+
+        call_command('reconcile_quotas', stdout=io.StringIO())
+        self.owner.refresh_from_db()
+        self.assertEqual((self.owner.storage_used, self.owner.file_count), (1034, 2))
+
+
+@override_settings(MEMORY_ACCOUNTING_ENABLED=True)
+class MemoryAccountingTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('memory@example.com', PASSWORD, full_name='Memory', storage_quota=None)
+
+    def setUp(self):
+        super().setUp()
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        memory.histogram.reset()
+        self.addCleanup(memory.histogram.reset)
+
+    def upload(self, content):
+        response = self.request(
+            'POST', reverse('files:file-list'), self.owner,
+            data={'name': 'm.bin', 'file': SimpleUploadedFile('m.bin', content)}
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def series(self, operation):
+        [series] = [s for s in memory.histogram.snapshot() if s['operation'] == operation]
+        return series
+
+    def test_peaks_are_recorded_per_operation(self):
+        with self.settings(MEMORY_LOG_THRESHOLD=10 ** 12), self.assertNoLogs('config.memory'):
+            pk = self.upload(b'm' * 1000)
+            response = self.request('GET', reverse('files:file-download', args=[pk]), self.owner)
+        self.assertEqual(response.content_bytes, b'm' * 1000)
+        for operation in ('upload', 'download'):
+            series = self.series(operation)
+            self.assertEqual((series['count'], series['overlapped']), (1, 0))
+            self.assertGreater(series['peak_max'], 0)
+            self.assertEqual(series['file_size_bucket'], memory.BUCKETS[0])
+        self.assertEqual(self.request('GET', reverse('files:file-list'), self.owner).status_code, 200)
+        self.assertEqual({s['operation'] for s in memory.histogram.snapshot()}, {'upload', 'download'})
+
+    def test_threshold_logs_large_peaks(self):
+        with self.settings(MEMORY_LOG_THRESHOLD=0), self.assertLogs('config.memory', 'WARNING') as logs:
+            self.upload(b'm' * 1000)
+        [message] = logs.output
+        self.assertIn('High memory upload request', message)
+        self.assertNotIn('approximate', message)
+
+    def test_download_memory_does_not_grow_with_the_file(self):
+        size = 8 * 1024 * 1024
+        pk = self.upload(os.urandom(size))
+        memory.histogram.reset()
+        response = self.client.get(
+            reverse('files:file-download', args=[pk]), secure=True,
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.owner)}'
+        )
+        self.assertEqual(int(response['Content-Length']), size)
+        # Drop each chunk as it arrives, so only the view's memory is measured.
+        self.assertEqual(sum(len(chunk) for chunk in response.streaming_content), size)
+        response.close()
+        self.assertLess(self.series('download')['peak_max'], size // 8)
+
+    def test_overlapping_samples_are_kept_apart(self):
+        first = memory.MemorySample('download')
+        second = memory.MemorySample('download')
+        second.finish()
+        first.finish()
+        alone = memory.MemorySample('download')
+        alone.finish()
+        series = self.series('download')
+        self.assertEqual((series['count'], series['overlapped']), (1, 2))
+        self.assertTrue(first.overlapped and second.overlapped)
+        self.assertFalse(alone.overlapped)
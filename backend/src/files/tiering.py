@@ -0,0 +1,85 @@
+"""
+Hot/cold tiering of blobs.
+
+Cold blobs live on the volume named by ``TIER_COLD_VOLUME``, usually a large,
+slow disk that new uploads never go to. A ready hot file is demoted when it
+matches any of ``TIER_COLD_RULES``: each ``(days, max_accesses)`` rule
+matches files not read for ``days`` days (or never read and older than that)
+and read at most ``max_accesses`` times. Reading a cold file queues its
+promotion back to a hot volume (see ``files.access``).
+
+Both directions use ``rebalance.move_blob``: the row keeps pointing at the old
+copy until the new one is complete, and the old copy is deleted
+``BLOB_MOVE_GRACE_SECONDS`` later, so reads go through while a move is in
+progress.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import EncryptedFile
+from .rebalance import move_blob
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TierReport:
+    dry_run: bool = False
+    files_demoted: int = 0
+    bytes_demoted: int = 0
+    done: bool = False
+
+
+def tiering_enabled(storage=None):
+    storage = storage or default_storage
+    return settings.TIER_COLD_VOLUME in getattr(storage, 'volumes', {})
+
+
+def cold_filter(now=None):
+    """Files matching any of ``TIER_COLD_RULES``."""
+    now = now or timezone.now()
+    matches = Q(pk__in=[])
+    for days, max_accesses in settings.TIER_COLD_RULES:
+        idle_since = now - timedelta(days=days)
+        matches |= Q(access_count__lte=max_accesses) & (
+            Q(last_accessed_at__lt=idle_since) |
+            Q(last_accessed_at__isnull=True, created_at__lt=idle_since)
+        )
+    return matches
+
+
+def demote(max_files=100, dry_run=False, storage=None):
+    """Move up to ``max_files`` cold-by-policy blobs to the cold volume."""
+    storage = storage or default_storage
+    report = TierReport(dry_run=dry_run)
+    candidates = list(
+        EncryptedFile.objects.filter(
+            cold_filter(), tier=EncryptedFile.HOT, status=EncryptedFile.READY
+        ).order_by(F('last_accessed_at').asc(nulls_first=True), 'created_at')
+        .only('pk', 'file', 'size')[:max_files + 1]
+    )
+    report.done = len(candidates) <= max_files
+
+    for file_obj in candidates[:max_files]:
+        if not dry_run and not move_blob(file_obj, settings.TIER_COLD_VOLUME, storage):
+            continue
+        report.files_demoted += 1
+        report.bytes_demoted += file_obj.size
+        logger.info('Demoted %s (%d bytes) to the cold tier', file_obj.pk, file_obj.size)
+    return report
+
+
+def promote(file_obj, storage=None):
+    """Move a cold file's blob back to a hot volume."""
+    storage = storage or default_storage
+    volume = storage.choose_volume(exclude=(settings.TIER_COLD_VOLUME,))
+    promoted = move_blob(file_obj, volume.name, storage)
+    if promoted:
+        logger.info('Promoted %s (%d bytes) to %s', file_obj.pk, file_obj.size, volume.name)
+    return promoted
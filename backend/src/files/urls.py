@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'files'
 
@@ -8,9 +8,33 @@ urlpatterns = [
     path('', views.FileListCreateView.as_view(), name='file-list'),
     path('<uuid:pk>/', views.FileDetailView.as_view(), name='file-detail'),
     path('<uuid:pk>/download/', views.FileDownloadView.as_view(), name='file-download'),
+    path('<uuid:pk>/download/stream/', async_views.file_download, name='file-download-stream'),
+    path('<uuid:pk>/preview/', views.FilePreviewView.as_view(), name='file-preview'),
+    
+    # Versions
+    path('chunking/', views.ChunkingParametersView.as_view(), name='chunking'),
+    path('<uuid:pk>/chunks/missing/', views.MissingChunksView.as_view(), name='missing-chunks'),
+    path('<uuid:pk>/chunks/<str:digest>/', views.ChunkUploadView.as_view(), name='chunk-upload'),
+    path('<uuid:pk>/versions/', views.FileVersionListView.as_view(), name='version-list'),
+    path(
+        '<uuid:pk>/versions/<int:number>/restore/',
+        views.FileVersionRestoreView.as_view(),
+        name='version-restore'
+    ),
+    
+    # Change Feed
+    path('changes/', views.ChangeFeedView.as_view(), name='change-feed'),
+    path('changes/wait/', async_views.change_feed_wait, name='change-feed-wait'),
+    
+    # Bulk Operations
+    path('bulk/delete/', views.BulkDeleteView.as_view(), name='bulk-delete'),
+    path('bulk/share/', views.BulkShareView.as_view(), name='bulk-share'),
+    path('bulk/unshare/', views.BulkUnshareView.as_view(), name='bulk-unshare'),
+    path('links/bulk/revoke/', views.BulkLinkRevokeView.as_view(), name='bulk-link-revoke'),
     
     # File Sharing
     path('<uuid:pk>/share/', views.FileShareCreateView.as_view(), name='file-share'),
+    path('<uuid:pk>/share/batch/', views.FileBatchShareView.as_view(), name='file-share-batch'),
     path('shares/', views.FileShareListView.as_view(), name='share-list'),
     path('shares/<uuid:pk>/', views.FileShareDetailView.as_view(), name='share-detail'),
     
@@ -19,4 +43,5 @@ urlpatterns = [
     path('links/', views.ShareableLinkListView.as_view(), name='link-list'),
     path('links/<uuid:pk>/', views.ShareableLinkDetailView.as_view(), name='link-detail'),
     path('public/<uuid:token>/', views.PublicFileDownloadView.as_view(), name='public-download'),
+    path('public/<uuid:token>/stream/', async_views.public_file_download, name='public-download-stream'),
 ] 
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+File versions built from deduplicated chunks.
+
+A new version is uploaded as content-defined chunks (``files.chunking``):
+the client asks which chunk digests the file lacks, uploads only those and
+then commits the ordered list of digests. Each chunk is stored once per
+file, encrypted under the file's key with its own IV, so a small edit to a
+large file costs a chunk or two of storage and upload. ``FileVersion`` and
+``VersionChunk`` record which chunks make up each version;
+``EncryptedFile.version`` names the current one. Version 0 is the blob that
+was originally uploaded, which stays in place.
+
+``prune`` drops versions outside the retention policy (``VERSION_KEEP_LAST``,
+``VERSION_KEEP_DAYS``) and versions of deleted files; ``collect_chunks``
+then drops chunks no version uses any more. Both run from ``gc_storage``,
+and the chunk blobs are removed by the blob collector afterwards.
+"""
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, Max, OuterRef
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+from django.utils import timezone
+from jobs.queue import enqueue
+from . import changes, previews, quota
+from .encryption import encrypt_with_key, iter_decrypt_file, iter_decrypt_parts, iter_decrypt_range
+from .models import EncryptedFile, FileChange, FileChunk, FileVersion, VersionChunk, get_file_path
+
+
+class MissingChunks(Exception):
+    """A version names chunks the file does not have."""
+
+    def __init__(self, digests):
+        super().__init__(f'{len(digests)} chunks are missing')
+        self.digests = digests
+
+
+def chunk_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def manifest_checksum(digests):
+    return hashlib.sha256(''.join(digests).encode()).hexdigest()
+
+
+def missing_chunks(file_obj, digests):
+    """The distinct ``digests`` that ``file_obj`` has no chunk for, in order."""
+    wanted = list(dict.fromkeys(digests))
+    present = set(
+        FileChunk.objects.filter(file=file_obj, digest__in=wanted).values_list('digest', flat=True)
+    )
+    return [digest for digest in wanted if digest not in present]
+
+
+def store_chunk(file_obj, data, storage=None, owner=None):
+    """
+    Encrypt and store a chunk of ``file_obj`` unless the file has it already.
+
+    With ``owner``, a new chunk must fit in the owner's quota
+    (``quota.check_chunk``). Returns ``(chunk, created)``.
+    """
+    storage = storage or default_storage
+    digest = chunk_digest(data)
+    chunk = FileChunk.objects.filter(file=file_obj, digest=digest).first()
+    if chunk is not None:
+        return chunk, False
+    if owner is not None:
+        quota.check_chunk(owner, len(data))
+
+    encrypted, iv = encrypt_with_key(data, file_obj.encryption_key)
+    name = storage.save(get_file_path(None, 'chunk.bin'), encrypted)
+    try:
+        with transaction.atomic():
+            chunk = FileChunk.objects.create(
+                file=file_obj, digest=digest, size=len(data), blob=name, iv=iv
+            )
+    except IntegrityError:
+        # The same chunk was stored concurrently.
+        storage.delete(name)
+        return FileChunk.objects.get(file=file_obj, digest=digest), False
+    return chunk, True
+
+
+def commit(file_obj, digests, user_id=None):
+    """
+    Make the chunks ``digests``, in order, the next version of ``file_obj``.
+
+    Raises ``MissingChunks`` if the file lacks any of them and
+    ``quota.QuotaExceeded`` if the new version does not fit in the owner's
+    quota. Returns the new ``FileVersion``.
+    """
+    with transaction.atomic():
+        locked = EncryptedFile.objects.select_for_update(of=('self',)).select_related('owner').get(
+            pk=file_obj.pk
+        )
+        # Locking the chunks keeps the collector from deleting them under us.
+        chunks = {
+            chunk.digest: chunk
+            for chunk in FileChunk.objects.select_for_update()
+            .filter(file=locked, digest__in=set(digests)).only('pk', 'digest', 'size')
+        }
+        missing = [digest for digest in dict.fromkeys(digests) if digest not in chunks]
+        if missing:
+            raise MissingChunks(missing)
+
+        size = sum(chunks[digest].size for digest in digests)
+        if size > locked.size:
+            quota.reserve(locked.owner, size - locked.size, files=0)
+        elif size < locked.size:
+            quota.release(locked.owner_id, locked.size - size, files=0)
+
+        latest = FileVersion.objects.filter(file=locked).aggregate(latest=Max('number'))['latest']
+        version = FileVersion.objects.create(
+            file=locked,
+            number=(latest or 0) + 1,
+            size=size,
+            checksum=manifest_checksum(digests),
+            created_by_id=user_id,
+        )
+        entries, offset = [], 0
+        for position, digest in enumerate(digests):
+            chunk = chunks[digest]
+            entries.append(VersionChunk(version=version, chunk=chunk, position=position, offset=offset))
+            offset += chunk.size
+        VersionChunk.objects.bulk_create(entries)
+
+        EncryptedFile.objects.filter(pk=locked.pk).update(
+            version=version.number,
+            size=size,
+            checksum=version.checksum,
+            preview='',
+            preview_iv=b'',
+            preview_failed=False,
+            updated_at=timezone.now(),
+        )
+        changes.record(FileChange.UPDATED, [(locked.pk, locked.owner_id)])
+        if locked.preview:
+            enqueue('files.delete_blob', {'name': locked.preview.name})
+        if previews.previewable(locked):
+            enqueue('files.build_preview', {'file_id': str(locked.pk)})
+    return version
+
+
+def restore(file_obj, number, user_id=None):
+    """
+    Commit a copy of version ``number`` as the newest version.
+
+    Raises ``FileVersion.DoesNotExist`` if there is no such version (it
+    was pruned, or is the original upload).
+    """
+    version = FileVersion.objects.get(file=file_obj, number=number)
+    digests = [entry.chunk.digest for entry in _entries(file_obj, version.number)]
+    return commit(file_obj, digests, user_id)
+
+
+def _entries(file_obj, number):
+    return (
+        VersionChunk.objects.filter(version__file=file_obj, version__number=number)
+        .select_related('chunk').only('offset', 'chunk__digest', 'chunk__size', 'chunk__blob', 'chunk__iv')
+        .order_by('position')
+    )
+
+
+def manifest(file_obj, number=None):
+    """The ``VersionChunk`` entries of a version (the current one by default)."""
+    number = file_obj.version if number is None else number
+    return list(_entries(file_obj, number)) if number else []
+
+
+async def amanifest(file_obj):
+    """``manifest`` of the current version, for async views."""
+    if not file_obj.version:
+        return []
+    return [entry async for entry in _entries(file_obj, file_obj.version)]
+
+
+def iter_content(file_obj, entries=None):
+    """Decrypt the current content of a file, one chunk at a time."""
+    if not file_obj.version:
+        return iter_decrypt_file(file_obj.file, file_obj.encryption_key, file_obj.encryption_iv)
+    if entries is None:
+        entries = manifest(file_obj)
+    parts = ((entry.chunk.blob, entry.chunk.iv) for entry in entries)
+    return iter_decrypt_parts(parts, file_obj.encryption_key)
+
+
+def iter_content_range(file_obj, start, end, entries=None):
+    """Decrypt bytes ``start`` to ``end`` (inclusive) of the current content."""
+    if not file_obj.version:
+        return iter_decrypt_range(
+            file_obj.file, file_obj.encryption_key, file_obj.encryption_iv, start, end
+        )
+    if entries is None:
+        entries = manifest(file_obj)
+    # Only the chunks overlapping the range are read.
+    covering = [
+        entry for entry in entries
+        if entry.offset <= end and entry.offset + entry.chunk.size > start
+    ]
+    parts = ((entry.chunk.blob, entry.chunk.iv) for entry in covering)
+    data = iter_decrypt_parts(parts, file_obj.encryption_key)
+    return _slice(data, start - covering[0].offset, end - start + 1)
+
+
+def _slice(chunks, skip, length):
+    for chunk in chunks:
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        chunk = chunk[skip:skip + length]
+        skip = 0
+        length -= len(chunk)
+        yield chunk
+        if not length:
+            return
+
+
+def _delete_in_batches(queryset, model, batch_size):
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def prune(batch_size, dry_run=False):
+    """
+    Delete versions outside the retention policy and versions of deleted
+    files; returns how many.
+
+    A version is kept while it is among its file's ``VERSION_KEEP_LAST``
+    newest (always including the current one, which is the newest) or
+    younger than ``VERSION_KEEP_DAYS`` days.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.VERSION_KEEP_DAYS)
+    expired = FileVersion.objects.annotate(
+        rank=Window(RowNumber(), partition_by=F('file_id'), order_by=F('number').desc())
+    ).filter(rank__gt=max(settings.VERSION_KEEP_LAST, 1), created_at__lt=cutoff)
+    orphaned = FileVersion.objects.filter(
+        ~Exists(EncryptedFile.objects.filter(pk=OuterRef('file_id')))
+    )
+    if dry_run:
+        return expired.count() + orphaned.count()
+    return (
+        _delete_in_batches(expired, FileVersion, batch_size)
+        + _delete_in_batches(orphaned, FileVersion, batch_size)
+    )
+
+
+def collect_chunks(batch_size, grace_seconds=None, dry_run=False):
+    """
+    Delete chunks that no version uses and that are older than
+    ``CHUNK_GC_GRACE_SECONDS``, so uploads waiting to be committed keep
+    theirs; returns how many. Their blobs become orphans for ``collect_blobs``.
+    """
+    if grace_seconds is None:
+        grace_seconds = settings.CHUNK_GC_GRACE_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    unused = FileChunk.objects.filter(created_at__lt=cutoff).filter(
+        ~Exists(VersionChunk.objects.filter(chunk=OuterRef('pk')))
+    )
+    if dry_run:
+        return unused.count()
+    return _delete_in_batches(unused, FileChunk, batch_size)
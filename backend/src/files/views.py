@@ -1,53 +1,193 @@
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.core.files.storage import default_storage
 from rest_framework import generics, status, permissions, viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.decorators import action
-from .models import EncryptedFile, FileShare, ShareableLink
+from .models import EncryptedFile, FileChange, FileShare, FileVersion, ShareableLink, get_file_path
 from .serializers import (
     EncryptedFileSerializer,
     FileShareSerializer,
     ShareableLinkSerializer,
     FileUploadSerializer,
+    FileVersionSerializer,
+    ChunkListSerializer,
+    BulkSelectionSerializer,
+    BulkLinkSelectionSerializer,
+    BulkShareSerializer,
+    BatchShareSerializer,
+    FileChangeSerializer,
+    ChangeFeedQuerySerializer,
 )
 from .permissions import IsOwnerOrSharedWith
-from .encryption import encrypt_file, decrypt_file
+from . import bulk, changes, chunking, conditional, previews, quota, versions
+from .access import recorder
+from .encryption import encrypt_stream, decrypt_file
+from .storage import volume_of
+from .tasks import staging_storage
 from django.core.exceptions import PermissionDenied
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Prefetch
+from django.conf import settings
+from django.urls import reverse
+from analytics.rollups import usage
+from audit import buffer as audit
+from audit.models import AuditEvent
+from jobs.queue import enqueue
+from config import memory
+from config.db.routers import ReplicaReadsMixin
+from config.tracing import span, traced_stream
 import secrets
-
-
-class FileListCreateView(generics.ListCreateAPIView):
+import uuid
+
+
+def visible_files(user):
+    """Files owned by or shared with ``user``, ready for serialization."""
+    return (
+        EncryptedFile.objects.filter(owner=user) |
+        EncryptedFile.objects.filter(shares__shared_with=user)
+    ).distinct().select_related('owner').prefetch_related(
+        Prefetch('shares', queryset=FileShare.objects.select_related('shared_with'))
+    )
+
+
+def not_ready_response(file_obj):
+    """409 for files whose background encryption has not finished (or failed)."""
+    if file_obj.status == EncryptedFile.READY:
+        return None
+    detail = (
+        'This file is still being processed.'
+        if file_obj.status == EncryptedFile.PROCESSING
+        else 'Processing this file failed.'
+    )
+    return Response({'detail': detail}, status=status.HTTP_409_CONFLICT)
+
+
+def decrypted_response(file_obj):
+    """The decrypted file as an attachment, streamed chunk by chunk."""
+    chunks = versions.iter_content(file_obj)
+    response = StreamingHttpResponse(
+        traced_stream('download.decrypt', chunks, size=file_obj.size),
+        content_type=file_obj.mime_type
+    )
+    response['Content-Length'] = file_obj.size
+    response['Content-Disposition'] = content_disposition_header(True, file_obj.name)
+    return response
+
+
+class FileListCreateView(ReplicaReadsMixin, memory.MemoryAccountingMixin, generics.ListCreateAPIView):
     """View for listing and creating files."""
     serializer_class = EncryptedFileSerializer
     parser_classes = (MultiPartParser, FormParser)
+    memory_operations = {'POST': 'upload'}
     
     def get_queryset(self):
-        return (
-            EncryptedFile.objects.filter(owner=self.request.user) |
-            EncryptedFile.objects.filter(shares__shared_with=self.request.user)
-        ).distinct()
+        return visible_files(self.request.user)
     
-    def perform_create(self, serializer):
-        # Handle file upload and encryption
+    def create(self, request, *args, **kwargs):
+        # Turn away uploads that cannot fit before reading the body.
+        quota.check_content_length(request)
+        # Request data is parsed lazily, so force multipart parsing here
+        # to time it separately from the rest of the upload.
+        with span('upload.parse'):
+            request.data
+        if self._wants_async(request):
+            return self.create_async(request)
+        return super().create(request, *args, **kwargs)
+    
+    def _upload(self):
         upload_serializer = FileUploadSerializer(data=self.request.data)
         upload_serializer.is_valid(raise_exception=True)
-        
         file_obj = upload_serializer.validated_data['file']
-        encrypted_data, key, iv = encrypt_file(file_obj)
+        memory.set_file_size(file_obj.size)
+        return file_obj
+    
+    def _wants_async(self, request):
+        if 'respond-async' in request.headers.get('Prefer', ''):
+            return True
+        upload = request.FILES.get('file')
+        return bool(
+            settings.ASYNC_UPLOAD_MIN_SIZE and upload
+            and upload.size >= settings.ASYNC_UPLOAD_MIN_SIZE
+        )
+    
+    def create_async(self, request):
+        """Stage the upload and encrypt it in a background job (202 Accepted)."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file_obj = self._upload()
         
-        # Save the encrypted file
-        serializer.save(
-            owner=self.request.user,
-            file=encrypted_data,
-            encryption_key=key,
-            encryption_iv=iv,
-            size=file_obj.size,
-            mime_type=file_obj.content_type
+        with span('storage.write'):
+            staged_name = staging_storage.save(uuid.uuid4().hex, file_obj)
+        
+        try:
+            with span('upload.db_insert'), transaction.atomic():
+                quota.reserve(request.user, file_obj.size)
+                instance = serializer.save(
+                    owner=request.user,
+                    file='',
+                    encryption_key=b'',
+                    encryption_iv=b'',
+                    size=file_obj.size,
+                    mime_type=file_obj.content_type,
+                    status=EncryptedFile.PROCESSING
+                )
+                changes.add(FileChange.CREATED, [(instance.pk, request.user.pk)])
+                job = enqueue(
+                    'files.encrypt_upload',
+                    {'file_id': str(instance.pk), 'staged_name': staged_name},
+                    owner=request.user
+                )
+        except quota.QuotaExceeded:
+            staging_storage.delete(staged_name)
+            raise
+        
+        usage.file_added(instance)
+        data = dict(serializer.data, job=job.pk)
+        return Response(
+            data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('jobs:job-detail', args=[job.pk])}
         )
+    
+    def perform_create(self, serializer):
+        # Handle file upload and encryption
+        file_obj = self._upload()
+        with span('upload.encrypt', size=file_obj.size):
+            encrypted_data, key, iv = encrypt_stream(file_obj)
+        
+        # Encrypt while writing the ciphertext to storage
+        with span('storage.write'):
+            blob_name = default_storage.save(
+                get_file_path(None, file_obj.name),
+                encrypted_data
+            )
+        
+        # Save the encrypted file
+        try:
+            with span('upload.db_insert'), transaction.atomic():
+                quota.reserve(self.request.user, file_obj.size)
+                instance = serializer.save(
+                    owner=self.request.user,
+                    file=blob_name,
+                    volume=volume_of(blob_name),
+                    encryption_key=key,
+                    encryption_iv=iv,
+                    checksum=encrypted_data.checksum,
+                    size=file_obj.size,
+                    mime_type=file_obj.content_type
+                )
+                changes.add(FileChange.CREATED, [(instance.pk, self.request.user.pk)])
+                if previews.previewable(instance):
+                    enqueue('files.build_preview', {'file_id': str(instance.pk)})
+        except quota.QuotaExceeded:
+            default_storage.delete(blob_name)
+            raise
+        usage.file_added(instance)
 
 
 class FileDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -57,34 +197,229 @@ class FileDetailView(generics.RetrieveUpdateDestroyAPIView):
     lookup_field = 'pk'
     
     def get_queryset(self):
-        return (
-            EncryptedFile.objects.filter(owner=self.request.user) |
-            EncryptedFile.objects.filter(shares__shared_with=self.request.user)
-        ).distinct()
+        return visible_files(self.request.user)
+    
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            instance = serializer.save()
+            changes.record_file(FileChange.UPDATED, instance)
+    
+    def perform_destroy(self, instance):
+        # The blobs are removed by a background job once the row is gone.
+        blob_names = [instance.file.name, instance.preview.name]
+        with transaction.atomic():
+            changes.record_file(FileChange.DELETED, instance)
+            instance.delete()
+            quota.release(instance.owner_id, instance.size)
+            for blob_name in filter(None, blob_names):
+                enqueue('files.delete_blob', {'name': blob_name})
+        usage.file_deleted(instance)
+
+
+class FileDownloadView(ReplicaReadsMixin, memory.MemoryAccountingMixin, APIView):
+    """View for downloading files."""
+    permission_classes = (IsOwnerOrSharedWith,)
+    memory_operations = {'GET': 'download'}
+    
+    def get(self, request, pk):
+        with span('download.lookup'):
+            file_obj = get_object_or_404(EncryptedFile, pk=pk)
+            self.check_object_permissions(request, file_obj)
+        not_ready = not_ready_response(file_obj)
+        if not_ready is not None:
+            return not_ready
+        not_modified = conditional.not_modified(request, file_obj)
+        if not_modified is not None:
+            return not_modified
+        memory.set_file_size(file_obj.size)
+        recorder.record(file_obj)
+        usage.downloaded(file_obj)
+        audit.record(AuditEvent.DOWNLOAD, actor=request.user, file=file_obj, request=request)
+        
+        # Decrypt the file
+        response = decrypted_response(file_obj)
+        return conditional.set_validators(response, file_obj)
 
 
-class FileDownloadView(APIView):
-    """View for downloading files."""
+class FilePreviewView(ReplicaReadsMixin, APIView):
+    """View for the thumbnail of an image file."""
     permission_classes = (IsOwnerOrSharedWith,)
     
     def get(self, request, pk):
+        with span('download.lookup'):
+            file_obj = get_object_or_404(EncryptedFile, pk=pk)
+            self.check_object_permissions(request, file_obj)
+        if not previews.previewable(file_obj):
+            return Response(
+                {'detail': 'Files of this type have no preview.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if file_obj.preview_failed:
+            return Response(
+                {'detail': 'This file has no preview: it could not be read as an image.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        not_ready = not_ready_response(file_obj)
+        if not_ready is not None:
+            return not_ready
+        not_modified = conditional.not_modified(request, file_obj, 'preview')
+        if not_modified is not None:
+            return not_modified
+        
+        try:
+            if not file_obj.preview:
+                raise FileNotFoundError(file_obj.pk)
+            with span('download.decrypt'):
+                data = decrypt_file(file_obj.preview, file_obj.encryption_key, file_obj.preview_iv)
+        except FileNotFoundError:
+            previews.request_rebuild(file_obj)
+            response = Response(
+                {'detail': 'The preview is being generated.'},
+                status=status.HTTP_202_ACCEPTED
+            )
+            response['Retry-After'] = '5'
+            return response
+        
+        response = HttpResponse(data.read(), content_type=previews.PREVIEW_CONTENT_TYPE)
+        response['Cache-Control'] = f'private, max-age={settings.PREVIEW_CACHE_SECONDS}'
+        return conditional.set_validators(response, file_obj, 'preview')
+
+
+class ChunkingParametersView(APIView):
+    """The chunk sizes clients must use when uploading versions."""
+    
+    def get(self, request):
+        return Response(chunking.parameters())
+
+
+class FileVersionsMixin:
+    """Looks up the file of a version endpoint and checks access to it."""
+    permission_classes = (IsOwnerOrSharedWith,)
+    
+    def get_file(self, request, pk):
         file_obj = get_object_or_404(EncryptedFile, pk=pk)
         self.check_object_permissions(request, file_obj)
+        return file_obj
+
+
+class MissingChunksView(FileVersionsMixin, APIView):
+    """Which of a list of chunk digests a file still needs."""
+    
+    def post(self, request, pk):
+        file_obj = self.get_file(request, pk)
+        serializer = ChunkListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({
+            'missing': versions.missing_chunks(file_obj, serializer.validated_data['chunks'])
+        })
+
+
+class ChunkUploadView(FileVersionsMixin, APIView):
+    """Store one chunk of a file; the body is the raw plaintext chunk."""
+    
+    def put(self, request, pk, digest):
+        file_obj = self.get_file(request, pk)
+        not_ready = not_ready_response(file_obj)
+        if not_ready is not None:
+            return not_ready
+        too_large = Response(
+            {'detail': f'Chunks may not be larger than {settings.CHUNK_MAX_SIZE} bytes.'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        if length > settings.CHUNK_MAX_SIZE:
+            return too_large
+        # Read the body directly: at most one byte more than a chunk may be.
+        data = request.stream.read(settings.CHUNK_MAX_SIZE + 1) if request.stream else b''
+        if len(data) > settings.CHUNK_MAX_SIZE:
+            return too_large
+        if versions.chunk_digest(data) != digest:
+            return Response(
+                {'detail': 'The chunk does not match its digest.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Decrypt the file
-        decrypted_data = decrypt_file(
-            file_obj.file,
-            file_obj.encryption_key,
-            file_obj.encryption_iv
+        owner = request.user if request.user.pk == file_obj.owner_id else file_obj.owner
+        with span('storage.write', size=len(data)):
+            chunk, created = versions.store_chunk(file_obj, data, owner=owner)
+        return Response(
+            {'digest': chunk.digest, 'size': chunk.size},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
         )
+
+
+class FileVersionListView(FileVersionsMixin, APIView):
+    """
+    List a file's versions, or add one.
+    
+    A JSON body ``{"chunks": [...]}`` commits the listed chunks, which must
+    all have been uploaded, as the new version (409 with the missing digests
+    otherwise). A multipart ``file`` is staged and chunked by a background
+    job instead (202 Accepted).
+    """
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+    
+    def get(self, request, pk):
+        file_obj = self.get_file(request, pk)
+        queryset = FileVersion.objects.filter(file=file_obj).select_related('created_by')
+        return Response({
+            'current': file_obj.version,
+            'versions': FileVersionSerializer(queryset, many=True).data,
+        })
+    
+    def post(self, request, pk):
+        file_obj = self.get_file(request, pk)
+        not_ready = not_ready_response(file_obj)
+        if not_ready is not None:
+            return not_ready
+        if 'file' in request.FILES:
+            return self.create_async(request, file_obj)
         
-        response = FileResponse(
-            decrypted_data,
-            content_type=file_obj.mime_type,
-            as_attachment=True,
-            filename=file_obj.name
+        serializer = ChunkListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            version = versions.commit(file_obj, serializer.validated_data['chunks'], request.user.pk)
+        except versions.MissingChunks as exc:
+            return Response(
+                {'detail': 'Upload the missing chunks first.', 'missing': exc.digests},
+                status=status.HTTP_409_CONFLICT
+            )
+        version.created_by = request.user
+        return Response(FileVersionSerializer(version).data, status=status.HTTP_201_CREATED)
+    
+    def create_async(self, request, file_obj):
+        upload = request.FILES['file']
+        with span('storage.write'):
+            staged_name = staging_storage.save(uuid.uuid4().hex, upload)
+        job = enqueue(
+            'files.create_version',
+            {'file_id': str(file_obj.pk), 'staged_name': staged_name, 'user_id': request.user.pk},
+            owner=request.user
         )
-        return response
+        return Response(
+            {'job': job.pk},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('jobs:job-detail', args=[job.pk])}
+        )
+
+
+class FileVersionRestoreView(FileVersionsMixin, APIView):
+    """Make a copy of an earlier version the current one."""
+    
+    def post(self, request, pk, number):
+        file_obj = self.get_file(request, pk)
+        not_ready = not_ready_response(file_obj)
+        if not_ready is not None:
+            return not_ready
+        try:
+            version = versions.restore(file_obj, number, request.user.pk)
+        except FileVersion.DoesNotExist:
+            return Response({'detail': 'No such version.'}, status=status.HTTP_404_NOT_FOUND)
+        version.created_by = request.user
+        return Response(FileVersionSerializer(version).data, status=status.HTTP_201_CREATED)
 
 
 class FileShareCreateView(generics.CreateAPIView):
@@ -97,10 +432,37 @@ class FileShareCreateView(generics.CreateAPIView):
             pk=self.kwargs['pk'],
             owner=self.request.user
         )
-        serializer.save(file=file_obj)
+        with transaction.atomic():
+            share = serializer.save(file=file_obj)
+            changes.add(
+                FileChange.SHARED,
+                [(file_obj.pk, file_obj.owner_id), (file_obj.pk, share.shared_with_id)]
+            )
+        audit.record(
+            AuditEvent.SHARE, actor=self.request.user, file=file_obj,
+            target=share.shared_with.email, request=self.request
+        )
 
 
-class FileShareListView(generics.ListAPIView):
+class FileBatchShareView(APIView):
+    """View for sharing a file with many users at once."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def post(self, request, pk):
+        file_obj = get_object_or_404(EncryptedFile, pk=pk, owner=request.user)
+        serializer = BatchShareSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk.share_with_users(
+            request.user,
+            file_obj,
+            serializer.validated_data['emails'],
+            serializer.validated_data['can_write'],
+            request=request
+        )
+        return Response(results)
+
+
+class FileShareListView(ReplicaReadsMixin, generics.ListAPIView):
     """View for listing file shares."""
     serializer_class = FileShareSerializer
     
@@ -117,6 +479,18 @@ class FileShareDetailView(generics.RetrieveDestroyAPIView):
     def get_queryset(self):
         return FileShare.objects.filter(
             file__owner=self.request.user
+        ).select_related('shared_with')
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            changes.add(
+                FileChange.UNSHARED,
+                [(instance.file_id, self.request.user.pk), (instance.file_id, instance.shared_with_id)]
+            )
+        audit.record(
+            AuditEvent.UNSHARE, actor=self.request.user, file=instance.file_id,
+            target=instance.shared_with.email, request=self.request
         )
 
 
@@ -130,10 +504,14 @@ class ShareableLinkCreateView(generics.CreateAPIView):
             pk=self.kwargs['pk'],
             owner=self.request.user
         )
-        serializer.save(file=file_obj, created_by=self.request.user)
+        link = serializer.save(file=file_obj, created_by=self.request.user)
+        audit.record(
+            AuditEvent.LINK_CREATE, actor=self.request.user, file=file_obj,
+            target=link.pk, request=self.request
+        )
 
 
-class ShareableLinkListView(generics.ListAPIView):
+class ShareableLinkListView(ReplicaReadsMixin, generics.ListAPIView):
     """View for listing shareable links."""
     serializer_class = ShareableLinkSerializer
     
@@ -151,14 +529,113 @@ class ShareableLinkDetailView(generics.RetrieveDestroyAPIView):
         return ShareableLink.objects.filter(
             created_by=self.request.user
         )
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        audit.record(
+            AuditEvent.LINK_DELETE, actor=self.request.user, file=instance.file_id,
+            target=instance.pk, request=self.request
+        )
+
+
+class BulkDeleteView(APIView):
+    """Delete many files at once."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def post(self, request):
+        serializer = BulkSelectionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk.delete_files(request.user, **serializer.selection)
+        return Response({'results': results})
+
+
+class BulkShareView(APIView):
+    """Share many files with one user at once."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def post(self, request):
+        serializer = BulkShareSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        results = bulk.share_files(
+            request.user,
+            serializer.validated_data['recipient'],
+            serializer.validated_data['can_write'],
+            request=request,
+            **serializer.selection
+        )
+        return Response({'results': results})
+
+
+class BulkUnshareView(APIView):
+    """Stop sharing many files with one user at once."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def post(self, request):
+        serializer = BulkShareSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        results = bulk.unshare_files(
+            request.user,
+            serializer.validated_data['recipient'],
+            request=request,
+            **serializer.selection
+        )
+        return Response({'results': results})
 
 
-class PublicFileDownloadView(APIView):
+class BulkLinkRevokeView(APIView):
+    """Delete many shareable links at once."""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def post(self, request):
+        serializer = BulkLinkSelectionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk.revoke_links(request.user, request=request, **serializer.selection)
+        return Response({'results': results})
+
+
+def change_feed_response(page):
+    """The JSON body of a change feed page from ``changes.page``."""
+    return dict(page, changes=FileChangeSerializer(page['changes'], many=True).data)
+
+
+class ChangeFeedView(ReplicaReadsMixin, APIView):
+    """
+    The changes to files visible to the user after ``?cursor=``, oldest
+    first, at most ``?limit=`` of them. Without a cursor the response only
+    has the current one. 410 Gone if the cursor has expired; list the files
+    again and start over. ``changes/wait/`` long-polls the same feed.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def get(self, request):
+        serializer = ChangeFeedQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        try:
+            page = changes.page(
+                request.user.pk,
+                serializer.validated_data.get('cursor'),
+                serializer.validated_data.get('limit')
+            )
+        except changes.CursorExpired:
+            return Response(
+                {'detail': 'This cursor has expired; list the files again.'},
+                status=status.HTTP_410_GONE
+            )
+        return Response(change_feed_response(page))
+
+
+class PublicFileDownloadView(memory.MemoryAccountingMixin, APIView):
     """View for downloading files via public links."""
     permission_classes = (permissions.AllowAny,)
+    memory_operations = {'POST': 'public_download'}
     
     def post(self, request, token):
-        link = get_object_or_404(ShareableLink, id=token)
+        with span('download.lookup'):
+            link = get_object_or_404(
+                ShareableLink.objects.select_related('file'),
+                id=token
+            )
+        memory.set_file_size(link.file.size)
         
         # Check if link is valid
         if not link.is_valid():
@@ -176,24 +653,25 @@ class PublicFileDownloadView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
+        # Only callers who may download learn about the file's state.
+        not_ready = not_ready_response(link.file)
+        if not_ready is not None:
+            return not_ready
+        not_modified = conditional.not_modified(request, link.file)
+        if not_modified is not None:
+            return not_modified
+        
         # Increment access count
-        link.access_count += 1
-        link.save()
+        with span('download.count_access'):
+            link.access_count += 1
+            link.save()
+        recorder.record(link.file)
+        usage.downloaded(link.file)
+        audit.record(AuditEvent.PUBLIC_DOWNLOAD, file=link.file, target=link.pk, request=request)
         
         # Decrypt and serve the file
-        decrypted_data = decrypt_file(
-            link.file.file,
-            link.file.encryption_key,
-            link.file.encryption_iv
-        )
-        
-        response = FileResponse(
-            decrypted_data,
-            content_type=link.file.mime_type,
-            as_attachment=True,
-            filename=link.file.name
-        )
-        return response
+        response = decrypted_response(link.file)
+        return conditional.set_validators(response, link.file)
 
 
 class FileViewSet(viewsets.ModelViewSet):
@@ -0,0 +1,96 @@
+"""
+Gunicorn settings for production.
+
+The ASGI app runs under uvicorn workers. It is preloaded in the master, so
+Django setup, the URLconf imports and the PBKDF2 master-key derivation happen
+once (see ``config.warmup``) and forked workers share that state
+copy-on-write. Workers are recycled after a jittered number of requests or when
+their resident memory grows past ``GUNICORN_MAX_WORKER_MEMORY_MB``.
+
+Every setting can be overridden through the environment.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+_cores = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+# Async workers multiplex connections, so one per core is enough; sync
+# workers block on I/O and follow the usual 2 * cores + 1.
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    _cores if 'uvicorn' in worker_class else 2 * _cores + 1
+))
+preload_app = True
+
+# Large uploads are encrypted inside the request, so allow for slow ones.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '500'))
+max_worker_memory_mb = int(os.getenv('GUNICORN_MAX_WORKER_MEMORY_MB', '1024'))
+memory_check_interval = int(os.getenv('GUNICORN_MEMORY_CHECK_INTERVAL', '15'))
+
+# Heartbeat files on tmpfs so a slow container disk cannot stall workers.
+worker_tmp_dir = os.getenv('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+logger = logging.getLogger('gunicorn.error')
+
+
+def post_fork(server, worker):
+    # The master warmed up with its own connections; never share them.
+    from django.db import connections
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    # Write what the worker still buffers: audit events, download counts,
+    # usage rollups and trace spans.
+    from analytics.rollups import usage
+    from audit.buffer import audit_log
+    from config.tracing import get_exporter
+    from files.access import recorder
+
+    for buffer in (audit_log, recorder, usage, get_exporter()):
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception('Could not flush %s on worker exit', type(buffer).__name__)
+
+
+def post_worker_init(worker):
+    if max_worker_memory_mb > 0:
+        threading.Thread(
+            target=_watch_memory,
+            args=(worker, max_worker_memory_mb * 1024 * 1024),
+            name='memory-watchdog',
+            daemon=True,
+        ).start()
+
+
+def _watch_memory(worker, limit):
+    """Ask the worker to shut down gracefully once it exceeds ``limit`` bytes."""
+    from config.memory import current_rss
+
+    while True:
+        time.sleep(memory_check_interval)
+        rss = current_rss()
+        if rss > limit:
+            logger.warning(
+                'Worker %s uses %d MiB (limit %d MiB); recycling',
+                worker.pid, rss // (1024 * 1024), limit // (1024 * 1024)
+            )
+            os.kill(worker.pid, signal.SIGTERM)
+            return
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Admin interface for Job model."""
+    list_display = ('kind', 'status', 'priority', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('id', 'kind')
+    readonly_fields = ('id', 'created_at', 'updated_at', 'finished_at', 'locked_by', 'last_error')
+    raw_id_fields = ('owner',)
@@ -0,0 +1,43 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            help='Jobs run in parallel by this process (default: JOBS_CONCURRENCY).'
+        )
+        parser.add_argument(
+            '--kind', action='append', dest='kinds',
+            help='Only run jobs of this kind. May be given more than once.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            help='Seconds to wait when the queue is empty (default: JOBS_POLL_INTERVAL).'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no job is runnable instead of waiting for more.'
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'],
+            kinds=options['kinds'],
+            poll_interval=options['poll_interval'],
+            burst=options['burst'],
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write('Finishing running jobs, then exiting...')
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        self.stdout.write(f'Running jobs with concurrency {worker.concurrency}')
+        worker.run()
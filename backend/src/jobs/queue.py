@@ -0,0 +1,185 @@
+"""
+A small job queue kept in the database.
+
+Handlers are registered per job kind, usually in an app's ``tasks.py``::
+
+    @register('files.delete_blob', concurrency=4)
+    def delete_blob(job):
+        default_storage.delete(job.payload['name'])
+
+    enqueue('files.delete_blob', {'name': name})
+
+``manage.py run_jobs`` claims and runs jobs. A claim marks the job running
+until ``timeout`` seconds from now (its visibility timeout); if the worker dies
+the lock expires and another worker picks the job up again. Failed jobs are
+retried with exponential backoff until ``max_attempts`` is reached. Higher
+``priority`` jobs are claimed first, and at most ``concurrency`` jobs of a kind
+run at once across all workers.
+"""
+
+import logging
+import traceback
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from config import tracing
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Candidates looked at per claim; others may be claimed concurrently.
+CLAIM_BATCH = 10
+
+
+@dataclass
+class Task:
+    kind: str
+    func: Callable
+    concurrency: Optional[int] = None
+    max_attempts: int = 3
+    timeout: Optional[int] = None
+    retry_delay: Optional[int] = None
+    on_failure: Optional[Callable] = None
+
+    def lock_seconds(self):
+        return self.timeout or settings.JOBS_DEFAULT_TIMEOUT
+
+    def backoff(self, attempts):
+        return (self.retry_delay or settings.JOBS_RETRY_DELAY) * 2 ** (attempts - 1)
+
+
+_registry = {}
+
+
+def register(kind, concurrency=None, max_attempts=3, timeout=None, retry_delay=None, on_failure=None):
+    """
+    Register the decorated function as the handler for ``kind``.
+
+    The handler receives the ``Job`` and may return a JSON-serializable
+    result. ``on_failure(job)`` is called once the job has given up.
+    """
+    def decorator(func):
+        _registry[kind] = Task(kind, func, concurrency, max_attempts, timeout, retry_delay, on_failure)
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, owner=None, priority=0, delay=0):
+    """Queue a job. It is committed together with the caller's transaction."""
+    try:
+        task = _registry[kind]
+    except KeyError:
+        raise ValueError(f'No job handler registered for {kind!r}.')
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        owner=owner,
+        priority=priority,
+        max_attempts=task.max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _running_counts(now):
+    return dict(
+        Job.objects.filter(status=Job.RUNNING, locked_until__gt=now)
+        .values_list('kind')
+        .annotate(Count('id'))
+    )
+
+
+def claim(worker_id, kinds=None):
+    """Claim the next runnable job for ``worker_id``, or return None."""
+    now = timezone.now()
+    running = _running_counts(now)
+    available = [
+        kind for kind, task in _registry.items()
+        if (kinds is None or kind in kinds)
+        and (task.concurrency is None or running.get(kind, 0) < task.concurrency)
+    ]
+    if not available:
+        return None
+
+    candidates = Job.objects.filter(kind__in=available).filter(
+        Q(status=Job.QUEUED, run_after__lte=now) |
+        Q(status=Job.RUNNING, locked_until__lte=now)
+    ).order_by('-priority', 'run_after')
+
+    for job in candidates[:CLAIM_BATCH]:
+        task = _registry[job.kind]
+        # Compare-and-set: only one worker wins a given job.
+        claimed = Job.objects.filter(
+            pk=job.pk, status=job.status, attempts=job.attempts, locked_until=job.locked_until
+        ).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=task.lock_seconds()),
+        )
+        if not claimed:
+            continue
+
+        if task.concurrency is not None and _running_counts(now).get(job.kind, 0) > task.concurrency:
+            # Another worker claimed the same kind at the same time; back off.
+            Job.objects.filter(pk=job.pk, locked_by=worker_id).update(
+                status=Job.QUEUED, attempts=F('attempts') - 1, locked_by='', locked_until=None
+            )
+            continue
+
+        job.refresh_from_db()
+        return job
+    return None
+
+
+def _finish(job, **fields):
+    """Record the outcome unless the job's lock was lost to another worker."""
+    return Job.objects.filter(
+        pk=job.pk, locked_by=job.locked_by, attempts=job.attempts
+    ).update(**fields)
+
+
+def run(job):
+    """Run a claimed job and record its outcome."""
+    task = _registry.get(job.kind)
+    now = timezone.now()
+    if task is None or job.attempts > job.max_attempts:
+        error = (
+            f'No job handler registered for {job.kind!r}.' if task is None
+            else f'Gave up after {job.max_attempts} attempts; the last one timed out.'
+        )
+        _finish(job, status=Job.FAILED, last_error=error, locked_until=None, finished_at=now)
+        logger.error('Job %s (%s) failed: %s', job.pk, job.kind, error)
+        if task is not None and task.on_failure:
+            task.on_failure(job)
+        return
+
+    try:
+        with tracing.start_trace() if settings.TRACING_ENABLED else nullcontext():
+            with tracing.span('job', kind=job.kind, job_id=str(job.pk), attempt=job.attempts):
+                result = task.func(job)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            _finish(job, status=Job.FAILED, last_error=error, locked_until=None, finished_at=now)
+            logger.error('Job %s (%s) failed permanently:\n%s', job.pk, job.kind, error)
+            if task.on_failure:
+                task.on_failure(job)
+        else:
+            _finish(
+                job,
+                status=Job.QUEUED,
+                last_error=error,
+                locked_by='',
+                locked_until=None,
+                run_after=now + timedelta(seconds=task.backoff(job.attempts)),
+            )
+            logger.warning('Job %s (%s) failed, will retry:\n%s', job.pk, job.kind, error)
+        return
+
+    _finish(job, status=Job.SUCCEEDED, result=result, locked_until=None, finished_at=timezone.now())
@@ -0,0 +1,14 @@
+from rest_framework import serializers
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for job status."""
+    
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'kind', 'status', 'attempts', 'max_attempts',
+            'result', 'created_at', 'updated_at', 'finished_at'
+        )
+        read_only_fields = fields
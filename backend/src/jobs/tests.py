@@ -0,0 +1,139 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from config.testing import EndpointBudgetTestCase
+from files.models import EncryptedFile
+from . import queue
+from .models import Job
+
+User = get_user_model()
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        registry = mock.patch.dict(queue._registry, clear=True)
+        registry.start()
+        self.addCleanup(registry.stop)
+        self.calls = []
+
+    def register(self, kind, func=None, **options):
+        queue.register(kind, **options)(func or (lambda job: self.calls.append(job.payload)))
+
+    def test_higher_priority_runs_first(self):
+        self.register('test.work')
+        queue.enqueue('test.work', {'n': 1})
+        queue.enqueue('test.work', {'n': 2}, priority=5)
+
+        queue.run(queue.claim('w'))
+        queue.run(queue.claim('w'))
+        self.assertEqual(self.calls, [{'n': 2}, {'n': 1}])
+        self.assertIsNone(queue.claim('w'))
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        def fail(job):
+            raise RuntimeError('boom')
+        on_failure = mock.Mock()
+        self.register('test.fail', fail, max_attempts=2, retry_delay=60, on_failure=on_failure)
+        job = queue.enqueue('test.fail')
+
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            queue.run(queue.claim('w'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+        self.assertIsNone(queue.claim('w'))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run(queue.claim('w'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        on_failure.assert_called_once()
+
+    def test_expired_lock_is_reclaimed(self):
+        self.register('test.work', timeout=30)
+        job = queue.enqueue('test.work')
+        claimed = queue.claim('dead-worker')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(queue.claim('w'))
+
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = queue.claim('w')
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # The dead worker's late result is ignored.
+        queue.run(claimed)
+        self.assertEqual(self.calls, [{}])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.locked_by, 'w')
+
+    def test_concurrency_limit_per_kind(self):
+        self.register('test.limited', concurrency=1)
+        self.register('test.other')
+        queue.enqueue('test.limited', priority=1)
+        queue.enqueue('test.limited', priority=1)
+        queue.enqueue('test.other')
+
+        self.assertEqual(queue.claim('a').kind, 'test.limited')
+        self.assertEqual(queue.claim('b').kind, 'test.other')
+        self.assertIsNone(queue.claim('c'))
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            queue.enqueue('test.missing')
+
+
+class AsyncUploadTests(EndpointBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('jobs@example.com', 'jobs-test-password', full_name='Jobs')
+        cls.other = User.objects.create_user('other@example.com', 'jobs-test-password', full_name='Other')
+
+    def test_upload_is_encrypted_in_the_background(self):
+        upload = SimpleUploadedFile('big.txt', b'payload' * 1000, content_type='text/plain')
+        response = self.request(
+            'POST', reverse('files:file-list'), self.user,
+            data={'name': 'big.txt', 'file': upload}, HTTP_PREFER='respond-async'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], EncryptedFile.PROCESSING)
+        job_url = response['Location']
+        file_id = response.json()['id']
+
+        response = self.request('GET', reverse('files:file-download', args=[file_id]), self.user)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.request('GET', job_url).status_code, 401)
+        self.assertEqual(self.request('GET', job_url, self.other).status_code, 404)
+        self.assertEqual(self.request('GET', job_url, self.user).json()['status'], Job.QUEUED)
+
+        queue.run(queue.claim('w'))
+
+        self.assertEqual(self.request('GET', job_url, self.user).json()['status'], Job.SUCCEEDED)
+        response = self.request('GET', reverse('files:file-download', args=[file_id]), self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, b'payload' * 1000)
+
+    def test_delete_queues_blob_removal(self):
+        upload = SimpleUploadedFile('doomed.txt', b'x' * 100, content_type='text/plain')
+        response = self.request(
+            'POST', reverse('files:file-list'), self.user,
+            data={'name': 'doomed.txt', 'file': upload}
+        )
+        blob_name = EncryptedFile.objects.get(pk=response.json()['id']).file.name
+        self.request('DELETE', reverse('files:file-detail', args=[response.json()['id']]), self.user)
+        self.assertTrue(default_storage.exists(blob_name))
+
+        queue.run(queue.claim('w'))
+        self.assertFalse(default_storage.exists(blob_name))
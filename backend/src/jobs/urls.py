@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'jobs'
+
+urlpatterns = [
+    path('<uuid:pk>/', views.JobDetailView.as_view(), name='job-detail'),
+]
@@ -0,0 +1,12 @@
+from rest_framework import generics, permissions
+from .models import Job
+from .serializers import JobSerializer
+
+
+class JobDetailView(generics.RetrieveAPIView):
+    """View for polling the status of a background job."""
+    serializer_class = JobSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def get_queryset(self):
+        return Job.objects.filter(owner=self.request.user)
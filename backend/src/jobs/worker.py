@@ -0,0 +1,59 @@
+"""Thread-pool worker that drains the job queue."""
+
+import logging
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from . import queue
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """
+    Run up to ``concurrency`` jobs at a time until ``stop()`` is called.
+
+    With ``burst`` the worker exits as soon as no job is runnable.
+    """
+
+    def __init__(self, concurrency=None, kinds=None, poll_interval=None, burst=False):
+        self.concurrency = concurrency or settings.JOBS_CONCURRENCY
+        self.kinds = kinds
+        self.poll_interval = poll_interval or settings.JOBS_POLL_INTERVAL
+        self.burst = burst
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        threads = [
+            threading.Thread(target=self._loop, args=(f'{self.name}:{i}',), name=f'job-worker-{i}')
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _loop(self, worker_id):
+        try:
+            while not self._stopping.is_set():
+                close_old_connections()
+                try:
+                    job = queue.claim(worker_id, self.kinds)
+                except Exception:
+                    logger.exception('Failed to claim a job')
+                    job = None
+                if job is None:
+                    if self.burst:
+                        return
+                    self._stopping.wait(self.poll_interval)
+                    continue
+                queue.run(job)
+        finally:
+            connections.close_all()